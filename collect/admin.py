@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import Source, Record, LocationImportMapping
+from .models import Source, Record, LocationImportMapping, CollectJob
 
 admin.site.register(Source)
 admin.site.register(Record)
-admin.site.register(LocationImportMapping)
\ No newline at end of file
+admin.site.register(LocationImportMapping)
+admin.site.register(CollectJob)
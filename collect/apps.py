@@ -3,3 +3,8 @@ from django.apps import AppConfig
 class CollectConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'collect'
+    # Collector plugins, imported when a source using them is dispatched
+    collect_plugins = {
+        'fffse': 'collect.collect_fffse.Collect_fffse',
+        'feed': 'collect.collect_feed.Collect_feed',
+    }
@@ -1,41 +1,126 @@
-import datetime
+import datetime, resource, sys, time, tracemalloc
+from contextlib import contextmanager
+from importlib.metadata import EntryPoint, entry_points
+from django.apps import apps
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+from core.versions import deferred_bumps
+from .models import Record
+
+ENTRY_POINT_GROUP = 'zenchanger.collectors'
+
+def peak_rss():
+    """
+    Peak resident set size of this process in bytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
 
 class Collector:
+    PROGRESS_INTERVAL = 1.0
+    KEEP_ALIVE_INTERVAL = 60.0
     _registry = {}
+    _discovered = False
 
     @classmethod
     def register(cls, name, collector_class):
+        """
+        Register a collector class, or the dotted path of one, under name.
+        Dotted paths are imported when the plugin is first used.
+        """
         cls._registry[name] = collector_class
 
+    @classmethod
+    def discover(cls):
+        """
+        Register the plugins declared by installed apps, in their AppConfig
+        collect_plugins dict, and by the zenchanger.collectors entry point
+        group. Nothing is imported until a plugin is dispatched.
+        """
+        for app_config in apps.get_app_configs():
+            for name, path in getattr(app_config, 'collect_plugins', {}).items():
+                cls._registry.setdefault(name, path)
+        for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+            cls._registry.setdefault(entry_point.name, entry_point)
+        cls._discovered = True
+
     @classmethod
     def get(cls, name):
-        return cls._registry.get(name)
+        if name not in cls._registry and not cls._discovered:
+            cls.discover()
+        collector_class = cls._registry.get(name)
+        if isinstance(collector_class, str):
+            collector_class = import_string(collector_class)
+        elif isinstance(collector_class, EntryPoint):
+            collector_class = collector_class.load()
+        else:
+            return collector_class
+        cls._registry[name] = collector_class
+        return collector_class
 
     @staticmethod
-    def dispatch(source, ops=["collect", "clear", "store"]):
+    def dispatch(source, ops=["collect", "clear", "store"], job=None, keep_alive=None):
         """
         Dispatches the collection process for the given source.
+        A single Record with the run's messages and metrics is stored,
+        whether the run succeeds or not. When a CollectJob is given, its
+        phase and progress are kept up to date while the run proceeds.
+        keep_alive is called at every phase and at most once per
+        KEEP_ALIVE_INTERVAL seconds of progress, e.g. to renew the lock of
+        the queued job running the collection. Data versions are bumped
+        once at the end of the run, not for every saved object.
         """
         collector_class = Collector.get(source.plugin)
         if not collector_class:
             raise ValueError(f"No collector registered for plugin: {source.plugin}")
-        
-        collector = collector_class(source)
-        if "collect" in ops:
-            if not collector.collect_data():
-                raise ValueError(f"{source.id} collection failed")
-        if "clear" in ops:
-            if not collector.clear_data():
-                raise ValueError(f"{source.id} clearing failed")
-        if "store" in ops:
-            if not collector.store_data():
-                raise ValueError(f"{source.id} storing failed")
-            source.last_run = datetime.datetime.now(tz=datetime.timezone.utc)
-            source.save()
+
+        collector = collector_class(source, job=job)
+        collector.keep_alive = keep_alive
+        error = None
+        try:
+            with collector.measure(), deferred_bumps():
+                if "collect" in ops:
+                    with collector.phase("collect"):
+                        if not collector.collect_data():
+                            raise ValueError(f"{source.id} collection failed")
+                if "clear" in ops:
+                    with collector.phase("clear"):
+                        if not collector.clear_data():
+                            raise ValueError(f"{source.id} clearing failed")
+                if "store" in ops:
+                    with collector.phase("store"):
+                        if not collector.store_data():
+                            raise ValueError(f"{source.id} storing failed")
+                    source.last_run = datetime.datetime.now(tz=datetime.timezone.utc)
+                    source.save()
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            collector.close()
+            collector.save_record(error)
         return True
-    
-    def __init__(self, source):
+
+    def __init__(self, source, job=None):
         self.source = source
+        self.job = job
+        self.keep_alive = None
+        self._progress_saved_at = 0.0
+        self._kept_alive_at = 0.0
+        self.messages = []
+        self.metrics = {
+            'phases': {},
+            'wall_time': 0.0,
+            'bytes_downloaded': 0,
+            'items_parsed': 0,
+            'rows_inserted': 0,
+            'rows_updated': 0,
+            'rows_deleted': 0,
+            'queries': 0,
+            'peak_memory': 0,
+        }
 
     def collect_data(self):
         return True
@@ -43,5 +128,108 @@ class Collector:
     def clear_data(self):
         return True
 
-    def store_data(self, response_list):
+    def store_data(self):
         return True
+
+    def close(self):
+        """
+        Release what the run holds, e.g. downloads. Called after every run.
+        """
+
+    def report(self, result):
+        """
+        Add a human readable message to the Record of this run.
+        """
+        self.messages.append(result)
+
+    def count(self, metric, amount=1):
+        """
+        Increase one of the volume counters in self.metrics.
+        """
+        self.metrics[metric] = self.metrics.get(metric, 0) + amount
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Measure the wall time of one of the collect, clear or store phases.
+        """
+        self._keep_alive(force=True)
+        if self.job:
+            self.job.phase = name
+            self.job.items_processed = 0
+            self.job.items_total = None
+            self.job.save(update_fields=['phase', 'items_processed', 'items_total'])
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.metrics['phases'][name] = round(time.perf_counter() - start, 3)
+
+    def progress(self, processed, total=None):
+        """
+        Report how many items the current phase has processed. Saved to the
+        job at most once per PROGRESS_INTERVAL seconds, and always at the end.
+        """
+        self._keep_alive()
+        if not self.job:
+            return
+        self.job.items_processed = processed
+        if total is not None:
+            self.job.items_total = total
+        now = time.monotonic()
+        if now - self._progress_saved_at >= self.PROGRESS_INTERVAL or processed == total:
+            self._progress_saved_at = now
+            self.job.save(update_fields=['items_processed', 'items_total'])
+
+    def _keep_alive(self, force=False):
+        if not self.keep_alive:
+            return
+        now = time.monotonic()
+        if force or now - self._kept_alive_at >= self.KEEP_ALIVE_INTERVAL:
+            self._kept_alive_at = now
+            self.keep_alive()
+
+    @contextmanager
+    def measure(self):
+        """
+        Measure total wall time, query count and peak memory of a run. Peak
+        memory is how much the run raised the peak resident size of the
+        process, which in a long lived worker is 0 for runs that stay under
+        the peak of an earlier one. With the COLLECT_TRACE_MEMORY setting it
+        is the peak of the memory allocated by Python during the run, which
+        is exact but slows the run down.
+        """
+        def count_query(execute, sql, params, many, context):
+            self.metrics['queries'] += 1
+            return execute(sql, params, many, context)
+
+        trace = settings.COLLECT_TRACE_MEMORY
+        started_tracing = trace and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if trace:
+            tracemalloc.reset_peak()
+        rss_at_start = peak_rss()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(count_query):
+                yield
+        finally:
+            self.metrics['wall_time'] = round(time.perf_counter() - start, 3)
+            if trace:
+                self.metrics['peak_memory'] = tracemalloc.get_traced_memory()[1]
+            else:
+                self.metrics['peak_memory'] = peak_rss() - rss_at_start
+            if started_tracing:
+                tracemalloc.stop()
+
+    def save_record(self, error=None):
+        result = "; ".join(self.messages)
+        if error:
+            result = {"error": error, "messages": self.messages}
+        Record.objects.create(
+            source=self.source,
+            result=result,
+            metrics=self.metrics,
+            timestamp=datetime.datetime.now(tz=datetime.timezone.utc)
+        )
@@ -0,0 +1,275 @@
+"""
+Configurable collector for CSV and JSON feeds.
+
+Everything about a feed is declared in Source.settings, for example:
+
+    {
+        "format": "json",
+        "records": "$.responses[*]",
+        "fields": {"id": "$.RTIME", "date": "$.date", "time_of_day": "$.time"},
+        "defaults": {"date": "2020-09-25", "time_of_day": ""},
+        "location": {"field": "$.ECITY", "country": "SE"},
+        "organizers": ["Fridays For Future Sweden"],
+        "chunk_size": 500
+    }
+
+For CSV feeds "fields" and the location "field" name columns instead of
+JSONPath expressions, and "csv" may hold "delimiter" and "encoding". A
+location "country_field" can name a per-record country code instead of
+the fixed "country".
+
+Records flow through a pipeline of parse, map, resolve locations and bulk
+upsert, one chunk at a time with a commit per chunk, so that large feeds
+never hold all rows in memory or the database write lock for a whole run.
+CSV feeds are read row by row from the download; JSON feeds are parsed
+whole by json.load. Records without an id, a known country or a valid
+date are skipped and counted as items_skipped.
+"""
+import csv, io, json, re, tempfile
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from core.history import bulk_insert_new_with_history, bulk_upsert_with_history
+from core.models import Event, Country, Location, Organization
+from core.versions import bump
+from .collect_base import Collector
+from .models import LocationImportMapping
+from .purge import purge_events, purge_source_events
+
+DOWNLOAD_CHUNK = 64 * 1024
+UPSERT_FIELDS = ['ext_data_src', 'date', 'time_of_day', 'location', 'country']
+DATE_FIELD = Event._meta.get_field('date')
+ID_LENGTH = Event._meta.get_field('id').max_length
+TIME_LENGTH = Event._meta.get_field('time_of_day').max_length
+# Skipped records reported by message, the rest are only counted
+MAX_SKIP_REPORTS = 10
+
+def json_path(data, path):
+    """
+    Evaluate a small JSONPath subset: $, .key, ['key'], [n] and [*].
+    Returns the list of matching values.
+    """
+    matches = [data]
+    for key, quoted, index in re.findall(r"\.([^.\[]+)|\['([^']*)'\]|\[(\*|-?\d+)\]", path.lstrip('$')):
+        found = []
+        for match in matches:
+            if index == '*':
+                found.extend(match.values() if isinstance(match, dict) else match if isinstance(match, list) else [])
+            elif index:
+                if isinstance(match, list) and -len(match) <= int(index) < len(match):
+                    found.append(match[int(index)])
+            elif isinstance(match, dict) and (key or quoted) in match:
+                found.append(match[key or quoted])
+        matches = found
+    return matches
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+class Collect_feed(Collector):
+    def __init__(self, source, job=None):
+        super().__init__(source, job=job)
+        self.settings = source.settings
+        self.download = None
+
+    def collect_data(self):
+        """
+        Stream the feed into a temporary file, so that it is parsed
+        incrementally by store_data() without holding it in memory.
+        """
+        import requests
+
+        params = self.settings.get('params', {})
+        self.download = tempfile.TemporaryFile()
+        with requests.get(self.source.url, params=params, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            for block in response.iter_content(DOWNLOAD_CHUNK):
+                self.download.write(block)
+                self.count('bytes_downloaded', len(block))
+        self.download.seek(0)
+        self.report(f"Downloaded {self.metrics['bytes_downloaded']} bytes")
+        return True
+
+    def close(self):
+        if self.download is not None:
+            self.download.close()
+
+    def clear_data(self):
+        """
+        Feeds are upserted, and store_data() removes events that are no
+        longer in the feed, so clearing is only done for clear-only runs.
+        """
+        if self.download is not None:
+            return True
+        cleared_count = purge_source_events(self.source, chunk_size=self.settings.get('chunk_size', 500))
+        self.count('rows_deleted', cleared_count)
+        self.report(f"Cleared {cleared_count} old events")
+        return True
+
+    def store_data(self):
+        chunk_size = self.settings.get('chunk_size', 500)
+        self._countries = {c.code: c for c in Country.objects.all()}
+        self._locations = {}
+        self._organizers = list(Organization.objects.filter(name__in=self.settings.get('organizers', [])))
+        seen_ids = set()
+        for chunk in chunked(self.map_records(self.parse_records()), chunk_size):
+            with transaction.atomic():
+                self.resolve_locations(chunk)
+                seen_ids.update(self.upsert(chunk))
+            self.progress(self.metrics['items_parsed'])
+
+        if self.settings.get('delete_missing', True):
+            stored_ids = set(Event.objects.filter(ext_data_src=self.source.id).values_list('id', flat=True))
+            for stale_ids in chunked(stored_ids - seen_ids, chunk_size):
+                self.count('rows_deleted', purge_events(
+                    Event.objects.filter(id__in=stale_ids),
+                    chunk_size=chunk_size,
+                    history=self.settings.get('purge_history', True),
+                ))
+        self.report(
+            f"Stored {self.metrics['rows_inserted']} new and {self.metrics['rows_updated']} updated events"
+        )
+        if self.metrics.get('items_skipped'):
+            self.report(f"Skipped {self.metrics['items_skipped']} invalid records")
+        return True
+
+    def parse_records(self):
+        """
+        Yield the raw records of the downloaded feed.
+        """
+        if self.settings.get('format', 'json') == 'csv':
+            options = self.settings.get('csv', {})
+            lines = io.TextIOWrapper(self.download, encoding=options.get('encoding', 'utf-8'), newline='')
+            for row in csv.DictReader(lines, delimiter=options.get('delimiter', ',')):
+                self.count('items_parsed')
+                yield row
+        else:
+            data = json.load(self.download)
+            for record in json_path(data, self.settings.get('records', '$[*]')):
+                self.count('items_parsed')
+                yield record
+
+    def field(self, record, path):
+        if self.settings.get('format', 'json') == 'csv':
+            return record.get(path)
+        matches = json_path(record, path)
+        return matches[0] if matches else None
+
+    def skip(self, reason):
+        self.count('items_skipped')
+        if self.metrics['items_skipped'] <= MAX_SKIP_REPORTS:
+            self.report(f"Skipped record: {reason}")
+
+    def map_records(self, records):
+        """
+        Map raw records to Event field values according to the settings,
+        skipping records that can not be stored.
+        """
+        fields = self.settings.get('fields', {})
+        defaults = self.settings.get('defaults', {})
+        location = self.settings.get('location', {})
+        for record in records:
+            values = dict(defaults)
+            for name, path in fields.items():
+                value = self.field(record, path)
+                if value not in (None, ''):
+                    values[name] = value
+            if values.get('id') in (None, ''):
+                self.skip("no id")
+                continue
+            values['id'] = f"{self.source.id}:{values['id']}"
+            try:
+                values['date'] = DATE_FIELD.to_python(values.get('date'))
+            except (ValidationError, TypeError):
+                values['date'] = None
+            if values['date'] is None:
+                self.skip(f"{values['id']} has no valid date")
+                continue
+            values['time_of_day'] = str(values.get('time_of_day', ''))
+            if len(values['id']) > ID_LENGTH or len(values['time_of_day']) > TIME_LENGTH:
+                self.skip(f"{values['id'][:ID_LENGTH]} has a too long id or time")
+                continue
+            values['location_name'] = str(self.field(record, location['field']) or '').strip() if location.get('field') else ''
+            country_code = location.get('country')
+            if location.get('country_field'):
+                country_code = self.field(record, location['country_field']) or country_code
+            values['country'] = self._countries.get(str(country_code or '').upper())
+            if values['country'] is None:
+                self.skip(f"{values['id']} has an unknown country {country_code!r}")
+                continue
+            yield values
+
+    def resolve_locations(self, chunk):
+        """
+        Resolve the location names of a chunk with one query for import
+        mappings and one for locations, creating mappings for unknown names.
+        Names are matched per country and regardless of case, like the fffse
+        collector does.
+        """
+        names = {}
+        for v in chunk:
+            if v['location_name']:
+                names.setdefault((v['location_name'].lower(), v['country'].code), v['location_name'])
+        missing = {key: name for key, name in names.items() if key not in self._locations}
+        if missing:
+            lowered = {key[0] for key in missing}
+            mappings = {
+                (mapping.imported_name.lower(), mapping.country_id): mapping
+                for mapping in LocationImportMapping.objects.alias(lower_name=Lower('imported_name')).filter(
+                    # SQLite's LOWER() only folds ASCII, so also match the names as imported
+                    Q(lower_name__in=lowered) | Q(imported_name__in=missing.values()),
+                    source=self.source, country_id__in={code for _, code in missing},
+                ).select_related('location')
+            }
+            for key in missing:
+                if key in mappings:
+                    self._locations[key] = mappings[key].location
+            unmapped = {key: name for key, name in missing.items() if key not in self._locations}
+            by_name = {}
+            for loc in Location.objects.filter(name__in={name for name, _ in unmapped}).select_related('in_country'):
+                by_name.setdefault((loc.name, loc.in_country.code), loc)
+            new_mappings = []
+            for key, name in unmapped.items():
+                loc = by_name.get(key)
+                self._locations[key] = loc
+                if not loc:
+                    new_mappings.append(LocationImportMapping(source=self.source, imported_name=name, country_id=key[1]))
+            bulk_insert_new_with_history(new_mappings, LocationImportMapping, ['source_id', 'imported_name', 'country_id'])
+        for values in chunk:
+            values['location'] = self._locations.get((values['location_name'].lower(), values['country'].code))
+
+    def upsert(self, chunk):
+        """
+        Insert or update the events of a chunk and add the organizers.
+        Returns the ids of the events in the chunk.
+        """
+        events = {}
+        for values in chunk:
+            events[values['id']] = Event(
+                id=values['id'],
+                ext_data_src=self.source.id,
+                date=values.get('date'),
+                time_of_day=values.get('time_of_day', ''),
+                location=values['location'],
+                country=values['country'],
+            )
+        inserted, updated = bulk_upsert_with_history(
+            events.values(), Event, unique_fields=['id'], update_fields=UPSERT_FIELDS
+        )
+        Organizers = Event.organizers.through
+        Organizers.objects.bulk_create([
+            Organizers(event_id=event_id, organization_id=org.id)
+            for event_id in events for org in self._organizers
+        ], ignore_conflicts=True)
+        bump('events')
+        self.count('rows_inserted', inserted)
+        self.count('rows_updated', updated)
+        return events.keys()
@@ -1,12 +1,20 @@
 
 import datetime, json, requests
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Lower
+from core.history import history_buffer
 from core.models import Event, Country, Organization, Location
 from .collect_base import Collector
-from .models import Record, LocationImportMapping
+from .models import LocationImportMapping
+from .purge import purge_source_events
+
+# Responses stored per transaction
+STORE_CHUNK_SIZE = 200
 
 class Collect_fffse(Collector):
-    def __init__(self, source):
-        super().__init__(source)
+    def __init__(self, source, job=None):
+        super().__init__(source, job=job)
         self.responses = []
       
     def collect_data(self):
@@ -14,19 +22,21 @@ class Collect_fffse(Collector):
         token = self.source.settings.get('token', None)
         url = self.source.url
         response = requests.get(f'{url}{token}')
+        self.count('bytes_downloaded', len(response.content))
         response_text = response.text
         response_text = response_text[response_text.find('['):response_text.rfind(']')+1]
         response_list = json.loads(response_text)
         response_count = len(response_list)
         print(f"fffse collected {response_count} responses")
         self.responses = response_list
+        self.count('items_parsed', response_count)
         self.report(f"Collected {len(self.responses)} items")
         return True
 
     def clear_data(self):
         print(f"fffse clear_data() for source {self.source.id}")
-        cleared_count = Event.objects.filter(ext_data_src=self.source.id).count()
-        Event.objects.filter(ext_data_src=self.source.id).delete()
+        cleared_count = purge_source_events(self.source)
+        self.count('rows_deleted', cleared_count)
         print(f"fffse cleared {cleared_count} events from {self.source.id}")
         self.report(f"Cleared {cleared_count} old events")
         return True
@@ -36,53 +46,59 @@ class Collect_fffse(Collector):
         stored_count = 0
         sweden = Country.objects.get(code='SE')
         fff_sweden = Organization.objects.get(name='Fridays For Future Sweden')
-        for item in self.responses:
-            print(f"     Response id {item['RTIME']} submitted at {datetime.datetime.utcfromtimestamp(item['RTIME'])}")
-            print(item)
-            try:
-                ecity = item.get('ECITY', '').strip()
-                loc = None
-                map_loc = LocationImportMapping.objects.filter(
-                    source=self.source,
-                    imported_name__iexact=ecity,
-                ).first()
-                if map_loc:
-                    loc = map_loc.location
-                else:
-                    loc = Location.objects.filter(
-                        name__iexact=ecity,
-                        in_country=sweden
-                    ).first()
-                    if not loc:
-                        print(f"     Creating new location map for {ecity} in {sweden.name}")
-                        map_loc = LocationImportMapping.objects.create(
-                            source=self.source,
-                            imported_name=ecity,
-                        )
-                        map_loc.save()
+        total = len(self.responses)
+        for start in range(0, total, STORE_CHUNK_SIZE):
+            # One transaction per chunk, which also writes the chunk's history
+            with history_buffer():
+                for i, item in enumerate(self.responses[start:start + STORE_CHUNK_SIZE], start + 1):
+                    self.progress(i - 1, total)
+                    print(f"     Response id {item['RTIME']} submitted at {datetime.datetime.utcfromtimestamp(item['RTIME'])}")
+                    print(item)
+                    try:
+                        # Roll back the item, and its history, if it fails
+                        with transaction.atomic():
+                            ecity = item.get('ECITY', '').strip()
+                            loc = None
+                            map_loc = LocationImportMapping.objects.alias(
+                                lower_name=Lower('imported_name'),
+                            ).filter(
+                                source=self.source,
+                                country=sweden,
+                                lower_name=Lower(Value(ecity)),
+                            ).first()
+                            if map_loc:
+                                loc = map_loc.location
+                            else:
+                                loc = Location.objects.filter(
+                                    name=ecity.lower(),
+                                    in_country=sweden
+                                ).first()
+                                if not loc:
+                                    print(f"     Creating new location map for {ecity} in {sweden.name}")
+                                    map_loc = LocationImportMapping.objects.create(
+                                        source=self.source,
+                                        imported_name=ecity,
+                                        country=sweden,
+                                    )
+                                    map_loc.save()
 
-                event = Event.objects.create(
-                    id = f'{self.source.id}:{item["RTIME"]}',
-                    ext_data_src = self.source.id,
-                    date = self.source.settings.get('date', '2020-09-25'),
-                    location = loc,
-                    country = sweden,
-                )
-                event.save()
-                event.organizers.add(fff_sweden)
-                stored_count += 1
-                print(f"     Stored event: {event.id} at {event.date} in {event.location}")
-            except Exception as e:
-                print(f"     Error storing event: {e}")
-                continue
+                            event = Event.objects.create(
+                                id = f'{self.source.id}:{item["RTIME"]}',
+                                ext_data_src = self.source.id,
+                                date = self.source.settings.get('date', '2020-09-25'),
+                                location = loc,
+                                country = sweden,
+                            )
+                            event.save()
+                            event.organizers.add(fff_sweden)
+                            stored_count += 1
+                            self.count('rows_inserted')
+                            print(f"     Stored event: {event.id} at {event.date} in {event.location}")
+                    except Exception as e:
+                        print(f"     Error storing event: {e}")
+                        continue
+        self.progress(total, total)
         self.report(f"Stored {stored_count} new events")
         return True
-    
-    def report(self, result):
-        Record.objects.create(
-            source=self.source,
-            result=result,
-            timestamp=datetime.datetime.now()
-        )
 
 Collector.register('fffse', Collect_fffse)
\ No newline at end of file
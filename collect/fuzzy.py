@@ -0,0 +1,100 @@
+"""
+Trigram similarity matching of imported location names to Locations.
+"""
+import heapq
+from collections import Counter, defaultdict
+from simple_history.utils import bulk_update_with_history
+from core.models import Location
+from core.text import fold
+from .models import LocationImportMapping
+
+def trigrams(text):
+    padded = f"  {fold(text)} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class TrigramIndex:
+    """
+    Inverted trigram index over Location name and display_name. Candidates
+    are scored with the Dice coefficient of their trigram sets, so only
+    locations sharing at least one trigram with the query are scored.
+    """
+    def __init__(self, locations):
+        self.locations = {}
+        self.entries = []  # (location id, trigram count) per indexed name
+        self.postings = defaultdict(list)
+        seen = set()
+        for location in locations:
+            self.locations[location.id] = location
+            for name in (location.name, location.display_name):
+                if not name or (location.id, fold(name)) in seen:
+                    continue
+                seen.add((location.id, fold(name)))
+                grams = trigrams(name)
+                entry = len(self.entries)
+                self.entries.append((location.id, len(grams)))
+                for gram in grams:
+                    self.postings[gram].append(entry)
+
+    @classmethod
+    def build(cls, **filters):
+        return cls(Location.objects.filter(**filters).select_related('in_country').only(
+            'id', 'name', 'display_name', 'in_country__code', 'in_country__name'
+        ))
+
+    def search(self, name, k=5, min_score=0.3):
+        """
+        Return up to k (score, location) pairs scoring at least min_score,
+        best first.
+        """
+        grams = trigrams(name)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+        # A name sharing fewer trigrams than this can not reach min_score
+        min_shared = min_score * (len(grams) + 1) / 2
+        scores = {}
+        for entry, count in shared.items():
+            if count < min_shared:
+                continue
+            location_id, size = self.entries[entry]
+            score = 2 * count / (len(grams) + size)
+            if score >= min_score and score > scores.get(location_id, 0):
+                scores[location_id] = score
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(round(score, 3), self.locations[location_id]) for location_id, score in best]
+
+def match_unresolved_mappings(source=None, k=5, threshold=None, indexes=None, dry_run=False):
+    """
+    Suggest the top k locations in its country for every
+    LocationImportMapping without a location, with one TrigramIndex per
+    country, built on first use. Mappings without a country get no
+    suggestions. Mappings whose best candidate scores at least threshold,
+    and clearly better than the runner up, are resolved in one bulk update.
+    Returns a list of (mapping, suggestions, resolved) tuples.
+    """
+    mappings = LocationImportMapping.objects.filter(location__isnull=True).select_related('source')
+    if source is not None:
+        mappings = mappings.filter(source=source)
+    indexes = {} if indexes is None else indexes
+
+    matches = []
+    resolved = []
+    for mapping in mappings:
+        if mapping.country_id is None:
+            matches.append((mapping, [], False))
+            continue
+        if mapping.country_id not in indexes:
+            indexes[mapping.country_id] = TrigramIndex.build(in_country=mapping.country_id)
+        suggestions = indexes[mapping.country_id].search(mapping.imported_name, k=k)
+        auto = (
+            threshold is not None and suggestions and suggestions[0][0] >= threshold and
+            (len(suggestions) == 1 or suggestions[0][0] > suggestions[1][0])
+        )
+        if auto:
+            mapping.location = suggestions[0][1]
+            resolved.append(mapping)
+        matches.append((mapping, suggestions, auto))
+
+    if resolved and not dry_run:
+        bulk_update_with_history(resolved, LocationImportMapping, ['location'], batch_size=500)
+    return matches
@@ -1,4 +1,4 @@
-import os, requests
+import os
 from core.models import Location, Country
 
 def google_maps_lookup(location_name):
@@ -12,6 +12,9 @@ def google_maps_lookup(location_name):
     location_name_parts.reverse() 
     location_name = ', '.join(location_name_parts).strip()
     try:
+        # Imported here so that web workers only load requests when needed
+        import requests
+
         # You'll need to set your Google Maps API key
         api_key = os.getenv("GOOGLE_MAPS_API_KEY")
         url = f"https://maps.googleapis.com/maps/api/geocode/json"
@@ -80,7 +83,7 @@ def create_location_with_chain(country_code, location_chain, lat, lon):
     for i, loc_name in enumerate(reversed(location_chain)):
         # Check if location already exists
         existing = Location.objects.filter(
-            name__iexact=loc_name.lower(),
+            name=loc_name.lower(),
             in_country=country
         ).first()
         
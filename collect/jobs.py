@@ -0,0 +1,55 @@
+import datetime
+from core.jobs import job_handler, enqueue, heartbeat
+from .models import CollectJob
+from .collect_base import Collector
+from .google_maps_api import google_maps_lookup
+
+def start_collect_job(source, ops=["collect", "clear", "store"]):
+    """
+    Queue a collection run for source and return its CollectJob at once.
+    The run itself is done by a background worker.
+    """
+    collect_job = CollectJob.objects.create(source=source, ops=list(ops))
+    enqueue('collect.run', {'collect_job': collect_job.id})
+    return collect_job
+
+def fail_collect_job(job):
+    """
+    Mark the CollectJob of a timed out job failed, e.g. after its worker died.
+    """
+    CollectJob.objects.filter(
+        id=job.payload['collect_job'], status__in=[CollectJob.Status.QUEUED, CollectJob.Status.RUNNING],
+    ).update(
+        status=CollectJob.Status.FAILED,
+        error="Timed out",
+        finished_at=datetime.datetime.now(tz=datetime.timezone.utc),
+    )
+
+@job_handler('collect.run', timeout=3600, max_attempts=1, priority=10, on_timeout=fail_collect_job)
+def run_collect_job(job):
+    """
+    Run a queued CollectJob to completion, recording its outcome on the job.
+    The job's lock is renewed as the run reports progress.
+    """
+    collect_job = CollectJob.objects.select_related('source').get(id=job.payload['collect_job'])
+    collect_job.status = CollectJob.Status.RUNNING
+    collect_job.started_at = datetime.datetime.now(tz=datetime.timezone.utc)
+    collect_job.save(update_fields=['status', 'started_at'])
+    try:
+        Collector.dispatch(collect_job.source, ops=collect_job.ops, job=collect_job, keep_alive=lambda: heartbeat(job))
+        collect_job.status = CollectJob.Status.DONE
+    except Exception as e:
+        collect_job.status = CollectJob.Status.FAILED
+        collect_job.error = str(e)
+        raise
+    finally:
+        collect_job.finished_at = datetime.datetime.now(tz=datetime.timezone.utc)
+        collect_job.save(update_fields=['status', 'error', 'finished_at'])
+    return collect_job.as_dict()
+
+@job_handler('geocode.lookup', timeout=60)
+def geocode_lookup(job):
+    """
+    Look up a location name with the Google Maps geocoding API.
+    """
+    return google_maps_lookup(job.payload['query'])
@@ -1,6 +1,8 @@
 import os
-from django.shortcuts import render, get_object_or_404
-from core.models import Country, Location
+from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
+from core.models import Country, Location, Job
+from core.jobs import enqueue
 from .google_maps_api import google_maps_lookup, create_location_with_chain, coordinates_differ_significantly
 
 def location_view(request):
@@ -53,63 +55,28 @@ def location_detail(request, pk):
     # Handle Google Maps lookup
     google_result = None
     create_message = None
-    
+    lookup_pending = False
+    lookup_job_id = request.GET.get('lookup')
+    if lookup_job_id and lookup_job_id.isdigit() and request.method != 'POST':
+        lookup_job = Job.objects.filter(id=int(lookup_job_id), kind='geocode.lookup').first()
+        # Lookups queued by signed in users are theirs alone
+        if lookup_job and lookup_job.created_by_id and not lookup_job.visible_to(request.user):
+            lookup_job = None
+        if lookup_job and lookup_job.status == Job.Status.DONE:
+            google_result = lookup_job.result
+            create_message = annotate_google_result(google_result)
+        elif lookup_job and lookup_job.status == Job.Status.FAILED:
+            google_result = {'status': 'error', 'message': lookup_job.error}
+        elif lookup_job:
+            lookup_pending = True
+
     if request.method == 'POST':
         if 'lookup' in request.POST:
-            google_result = google_maps_lookup(location.name)
+            # The lookup runs as a background job, the page polls for it
+            lookup_job = enqueue('geocode.lookup', {'query': location.name},
+                                 user=request.user if request.user.is_authenticated else None)
+            return redirect(f"{reverse('location_detail', args=[location.id])}?lookup={lookup_job.id}")
             
-            # Process each result to determine what locations need to be created
-            if google_result and google_result.get('status') == 'success':
-                for i, result in enumerate(google_result['results']):
-                    missing_locations = []
-                    coordinate_updates = []
-                    
-                    # Find country code from address components
-                    country_code = None
-                    components = result.get('address_components', [])
-                    for component in components:
-                        if 'country' in component['types']:
-                            country_code = component['short_name']
-                            break
-                    
-                    # Check each location in the chain
-                    print(f"Looking for country code {country_code}")
-                    for j, loc_name in enumerate(result['location_chain']):
-                        if country_code:
-                            if j == len(result['location_chain']) - 1:
-                                # Last one, check country table instead
-                                existing_country = Country.objects.filter(code=country_code).first()
-                                if not existing_country:
-                                    create_message = f"Country '{country_code}' not found in database"
-                                    break
-                                continue
-                            
-                            existing_loc = Location.objects.filter(
-                                name__iexact=loc_name.lower(),
-                                in_country__code=country_code
-                            ).first()
-                            
-                            if not existing_loc:
-                                missing_locations.append(loc_name)
-                            elif j == 0:  # Only check coordinates for the most specific location
-                                # Check if coordinates differ significantly (>50 meters)
-                                google_lat, google_lon = result['lat'], result['lon']
-                                print(f"Checking coordinates for {existing_loc.name}: ({existing_loc.lat}, {existing_loc.lon}) vs ({google_lat}, {google_lon})")
-                                if coordinates_differ_significantly(existing_loc.lat, existing_loc.lon, google_lat, google_lon):
-                                    coordinate_updates.append({
-                                        'location': existing_loc,
-                                        'current_lat': existing_loc.lat,
-                                        'current_lon': existing_loc.lon,
-                                        'google_lat': google_lat,
-                                        'google_lon': google_lon
-                                    })
-                    
-                    # Add the missing locations and coordinate updates info to the result
-                    result['missing_locations'] = missing_locations
-                    result['coordinate_updates'] = coordinate_updates
-                    result['country_code'] = country_code
-                    result['create_button_id'] = f"create_{i}"
-                    
         elif 'create_locations' in request.POST:
             try:
                 create_message = create_locations_from_google_result(request.POST)
@@ -128,9 +95,69 @@ def location_detail(request, pk):
         'sublocations': sublocations,
         'events': events,
         'google_result': google_result,
+        'lookup_pending': lookup_pending,
         'create_message': create_message
     })
 
+def annotate_google_result(google_result):
+    """
+    Add the missing locations and coordinate updates needed for each result
+    of a Google Maps lookup. Returns an error message, or None.
+    """
+    create_message = None
+    # Process each result to determine what locations need to be created
+    if google_result and google_result.get('status') == 'success':
+        for i, result in enumerate(google_result['results']):
+            missing_locations = []
+            coordinate_updates = []
+            
+            # Find country code from address components
+            country_code = None
+            components = result.get('address_components', [])
+            for component in components:
+                if 'country' in component['types']:
+                    country_code = component['short_name']
+                    break
+            
+            # Check each location in the chain
+            print(f"Looking for country code {country_code}")
+            for j, loc_name in enumerate(result['location_chain']):
+                if country_code:
+                    if j == len(result['location_chain']) - 1:
+                        # Last one, check country table instead
+                        existing_country = Country.objects.filter(code=country_code).first()
+                        if not existing_country:
+                            create_message = f"Country '{country_code}' not found in database"
+                            break
+                        continue
+                    
+                    existing_loc = Location.objects.filter(
+                        name=loc_name.lower(),
+                        in_country__code=country_code
+                    ).first()
+                    
+                    if not existing_loc:
+                        missing_locations.append(loc_name)
+                    elif j == 0:  # Only check coordinates for the most specific location
+                        # Check if coordinates differ significantly (>50 meters)
+                        google_lat, google_lon = result['lat'], result['lon']
+                        print(f"Checking coordinates for {existing_loc.name}: ({existing_loc.lat}, {existing_loc.lon}) vs ({google_lat}, {google_lon})")
+                        if coordinates_differ_significantly(existing_loc.lat, existing_loc.lon, google_lat, google_lon):
+                            coordinate_updates.append({
+                                'location': existing_loc,
+                                'current_lat': existing_loc.lat,
+                                'current_lon': existing_loc.lon,
+                                'google_lat': google_lat,
+                                'google_lon': google_lon
+                            })
+            
+            # Add the missing locations and coordinate updates info to the result
+            result['missing_locations'] = missing_locations
+            result['coordinate_updates'] = coordinate_updates
+            result['country_code'] = country_code
+            result['create_button_id'] = f"create_{i}"
+    return create_message
+
 def create_locations_from_google_result(post_data):
     """
     Create Location objects based on Google Maps result data
@@ -0,0 +1,39 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from collect.fuzzy import match_unresolved_mappings
+from collect.models import Source
+
+class Command(BaseCommand):
+    help = "Suggest and auto-resolve locations for unresolved LocationImportMappings"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', help="Only match mappings of this source id")
+        parser.add_argument('--top', type=int, default=3, help="Number of suggestions per mapping")
+        parser.add_argument('--threshold', type=float, help="Auto-resolve when the best score is at least this (0-1)")
+        parser.add_argument('--dry-run', action='store_true', help="Show what would be resolved without saving")
+
+    def handle(self, *args, **options):
+        source = None
+        if options['source']:
+            try:
+                source = Source.objects.get(id=options['source'])
+            except Source.DoesNotExist:
+                raise CommandError(f"Unknown source {options['source']}")
+
+        start = time.perf_counter()
+        matches = match_unresolved_mappings(
+            source=source,
+            k=options['top'],
+            threshold=options['threshold'],
+            dry_run=options['dry_run'],
+        )
+        for mapping, suggestions, resolved in matches:
+            marker = "=>" if resolved else "  "
+            candidates = ", ".join(f"{loc.name.title()} ({loc.in_country.code}) {score}" for score, loc in suggestions)
+            self.stdout.write(f"{marker} {mapping.source.id}:{mapping.imported_name}: {candidates or '-'}")
+
+        resolved_count = sum(1 for _, _, resolved in matches if resolved)
+        self.stdout.write(
+            f"Matched {len(matches)} mappings in {time.perf_counter() - start:.2f}s, "
+            f"{'would resolve' if options['dry_run'] else 'resolved'} {resolved_count}"
+        )
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collect', '0003_historicallocationimportmapping_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='record',
+            name='metrics',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
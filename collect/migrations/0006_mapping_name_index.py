@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:15
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collect', '0005_collectjob'),
+        ('core', '0010_event_location_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='locationimportmapping',
+            index=models.Index(models.F('source'), django.db.models.functions.text.Lower('imported_name'), name='mapping_source_lname_idx'),
+        ),
+    ]
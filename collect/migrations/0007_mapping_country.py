@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def set_countries(apps, schema_editor):
+    # The fffse collector only imports Swedish events, feeds name their
+    # country in the settings unless it is given per record
+    Country = apps.get_model('core', 'Country')
+    Source = apps.get_model('collect', 'Source')
+    LocationImportMapping = apps.get_model('collect', 'LocationImportMapping')
+    codes = set(Country.objects.values_list('code', flat=True))
+    for source in Source.objects.all():
+        code = 'SE' if source.plugin == 'fffse' else (source.settings or {}).get('location', {}).get('country')
+        if code and str(code).upper() in codes:
+            LocationImportMapping.objects.filter(source=source, country__isnull=True).update(country_id=str(code).upper())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collect', '0006_mapping_name_index'),
+        ('core', '0011_dataversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicallocationimportmapping',
+            name='country',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.country'),
+        ),
+        migrations.AddField(
+            model_name='locationimportmapping',
+            name='country',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='location_mappings', to='core.country'),
+        ),
+        migrations.RunPython(set_countries, migrations.RunPython.noop),
+    ]
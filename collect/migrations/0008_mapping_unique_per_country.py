@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:10
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collect', '0007_mapping_country'),
+        ('core', '0013_job_created_by'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='locationimportmapping',
+            unique_together={('source', 'imported_name', 'country')},
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
-from simple_history.models import HistoricalRecords
+from django.db.models.functions import Lower
+from core.history import BufferedHistoricalRecords
 
 class Source(models.Model):
     id = models.CharField(max_length=255, primary_key=True)
@@ -10,7 +11,7 @@ class Source(models.Model):
     enabled = models.BooleanField(default=True)
     last_run = models.DateTimeField(null=True, blank=True, editable=False)
     next_run = models.DateTimeField(null=True, blank=True, editable=False)
-    history = HistoricalRecords()
+    history = BufferedHistoricalRecords()
 
     def __str__(self):
         return f"Source {self.id}"
@@ -18,6 +19,7 @@ class Source(models.Model):
 class Record(models.Model):
     source = models.ForeignKey(Source, on_delete=models.CASCADE, related_name='records')
     result = models.JSONField()
+    metrics = models.JSONField(null=True, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -27,10 +29,54 @@ class LocationImportMapping(models.Model):
     source = models.ForeignKey(Source, on_delete=models.CASCADE, related_name='location_mappings')
     imported_name = models.CharField(max_length=255)
     location = models.ForeignKey('core.Location', null=True, blank=True, on_delete=models.CASCADE, related_name='location_mappings')
-    history = HistoricalRecords()
+    # Country of the imported name, location suggestions are limited to it
+    country = models.ForeignKey('core.Country', null=True, blank=True, on_delete=models.CASCADE, related_name='location_mappings')
+    history = BufferedHistoricalRecords()
 
     class Meta:
-        unique_together = ('source', 'imported_name')
+        unique_together = ('source', 'imported_name', 'country')
+        indexes = [
+            models.Index('source', Lower('imported_name'), name='mapping_source_lname_idx'),
+        ]
 
     def __str__(self):
-        return f"Mapping for {self.source}:{self.imported_name} to {self.location.name if self.location else 'None'}"
\ No newline at end of file
+        return f"Mapping for {self.source}:{self.imported_name} to {self.location.name if self.location else 'None'}"
+
+class CollectJob(models.Model):
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
+    source = models.ForeignKey(Source, on_delete=models.CASCADE, related_name='jobs')
+    ops = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    phase = models.CharField(max_length=20, blank=True)
+    items_processed = models.PositiveIntegerField(default=0)
+    items_total = models.PositiveIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def is_active(self):
+        return self.status in (self.Status.QUEUED, self.Status.RUNNING)
+
+    def as_dict(self):
+        return {
+            'job_id': self.id,
+            'source': self.source_id,
+            'ops': self.ops,
+            'status': self.status,
+            'phase': self.phase,
+            'items_processed': self.items_processed,
+            'items_total': self.items_total,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __str__(self):
+        return f"CollectJob {self.id} for {self.source_id} ({self.status})"
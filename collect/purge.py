@@ -0,0 +1,82 @@
+"""
+Fast deletion of collected events.
+
+QuerySet.delete() loads every event, collects the cascade to EventRecord
+and the organizers table and sends the history signals one row at a time.
+purge_events() instead deletes one chunk of primary keys at a time with
+plain DELETE statements, writing the deletion history of each chunk with
+a single bulk insert, and commits between chunks so that the write lock
+is only held briefly.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from core.models import Event, EventRecord
+from core.versions import bump
+
+PURGE_CHUNK_SIZE = 1000
+
+def _delete_in(table, column, ids):
+    quote = connection.ops.quote_name
+    placeholders = ", ".join(["%s"] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {quote(table)} WHERE {quote(column)} IN ({placeholders})", ids)
+        return cursor.rowcount
+
+def _write_deletion_history(ids, when):
+    """
+    Copy the events with the given ids into the history table as deleted,
+    with a single INSERT ... SELECT.
+    """
+    quote = connection.ops.quote_name
+    HistoricalEvent = Event.history.model
+    columns = [
+        (HistoricalEvent._meta.get_field(field.name).column, Event._meta.get_field(field.name).column)
+        for field in HistoricalEvent.tracked_fields
+    ]
+    placeholders = ", ".join(["%s"] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(HistoricalEvent._meta.db_table)} "
+            f"({', '.join(quote(h) for h, _ in columns)}, history_date, history_type, history_change_reason) "
+            f"SELECT {', '.join(quote(e) for _, e in columns)}, %s, '-', 'purged' "
+            f"FROM {quote(Event._meta.db_table)} WHERE {quote(Event._meta.pk.column)} IN ({placeholders})",
+            [connection.ops.adapt_datetimefield_value(when), *ids],
+        )
+
+def purge_events(queryset, chunk_size=PURGE_CHUNK_SIZE, history=True):
+    """
+    Delete the events of queryset in chunks of raw DELETE statements,
+    including their EventRecords and organizer links. Deletion history is
+    written in bulk, or not at all with history=False. The events version
+    is bumped once at the end. Returns the number of deleted events.
+    """
+    history = history and getattr(settings, "SIMPLE_HISTORY_ENABLED", True)
+    organizers = Event.organizers.through._meta
+    deleted = 0
+    when = timezone.now()
+    while True:
+        ids = list(queryset.order_by().values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            if history:
+                _write_deletion_history(ids, when)
+            _delete_in(EventRecord._meta.db_table, 'event_id', ids)
+            _delete_in(organizers.db_table, organizers.get_field('event').column, ids)
+            deleted += _delete_in(Event._meta.db_table, Event._meta.pk.column, ids)
+    # Once per run, not per chunk, to spare the hot DataVersion row
+    if deleted:
+        bump('events')
+    return deleted
+
+def purge_source_events(source, chunk_size=PURGE_CHUNK_SIZE):
+    """
+    Delete all events collected from source. Deletion history is skipped
+    when the source settings have "purge_history": false.
+    """
+    return purge_events(
+        Event.objects.filter(ext_data_src=source.id),
+        chunk_size=chunk_size,
+        history=source.settings.get('purge_history', True),
+    )
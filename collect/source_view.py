@@ -1,6 +1,11 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Source
-from .collect_base import Collector
+from .models import Source, CollectJob
+from .jobs import start_collect_job
+
+CHART_RUNS = 20
+CHART_WIDTH = 240
+CHART_HEIGHT = 60
+CHART_SERIES = ['wall_time', 'collect', 'clear', 'store']
 
 def source_view(request):
     if request.method == "POST":
@@ -8,17 +13,51 @@ def source_view(request):
         action = request.POST.get("action")
         source = get_object_or_404(Source, id=source_id)
         if action == "collect":
-            Collector.dispatch(source)
+            start_collect_job(source)
         elif action == "clear":
-            Collector.dispatch(source, ops=["clear"])
+            start_collect_job(source, ops=["clear"])
         return redirect("source_view")
 
     sources = Source.objects.all()
+    active_jobs = {
+        job.source_id: job
+        for job in CollectJob.objects.filter(
+            status__in=[CollectJob.Status.QUEUED, CollectJob.Status.RUNNING]
+        ).order_by('created_at')
+    }
     source_data = []
     for source in sources:
-        records = source.records.order_by('-timestamp')[:6]
+        records = list(source.records.order_by('-timestamp')[:CHART_RUNS])
         source_data.append({
             "isrc": source,
-            "irec": records,
+            "job": active_jobs.get(source.id),
+            "irec": records[:6],
+            "chart": runtime_chart(records),
         })
     return render(request, "collect/source_view.html", {"source_data": source_data})
+
+def runtime_chart(records):
+    """
+    Build SVG polyline points for the total and per-phase run times of
+    the given records (newest first), scaled to the slowest run.
+    """
+    runs = [r.metrics for r in reversed(records) if r.metrics]
+    if len(runs) < 2:
+        return None
+    max_time = max(run.get('wall_time', 0) for run in runs) or 1
+    step = CHART_WIDTH / (len(runs) - 1)
+    series = {}
+    for name in CHART_SERIES:
+        points = []
+        for i, run in enumerate(runs):
+            value = run.get(name, 0) if name == 'wall_time' else run.get('phases', {}).get(name, 0)
+            y = CHART_HEIGHT - (value / max_time) * CHART_HEIGHT
+            points.append(f"{i * step:.1f},{y:.1f}")
+        series[name] = " ".join(points)
+    return {
+        'width': CHART_WIDTH,
+        'height': CHART_HEIGHT,
+        'max_time': max_time,
+        'series': series,
+        'latest': runs[-1],
+    }
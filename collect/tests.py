@@ -1,3 +1,209 @@
+import datetime, io, tempfile
+from unittest import mock
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from core.jobs import claim, run_job
+from core.models import Country, Event, EventRecord, Job, Location, Organization
+from core.versions import get_versions
+from .collect_base import Collector
+from .fuzzy import TrigramIndex
+from .jobs import start_collect_job
+from .models import CollectJob, LocationImportMapping, Source
+from .purge import purge_source_events
 
-# Create your tests here.
+class CollectJobTests(TestCase):
+    def test_every_collector_runs_as_a_job(self):
+        Collector.discover()
+        for plugin in list(Collector._registry):
+            with self.subTest(plugin=plugin):
+                source = Source.objects.create(id=f'test-{plugin}', url='https://example.com/', settings={}, plugin=plugin)
+                # No ops, so nothing is downloaded: the collector is only created and its run recorded
+                collect_job = start_collect_job(source, ops=[])
+                job = run_job(claim('test', kinds=['collect.run']))
+                self.assertEqual(job.status, Job.Status.DONE, job.error)
+                collect_job.refresh_from_db()
+                self.assertEqual(collect_job.status, CollectJob.Status.DONE)
+                self.assertEqual(source.records.count(), 1)
+
+    def test_run_records_its_own_memory_peak(self):
+        source = Source.objects.create(id='test', url='https://example.com/', settings={}, plugin='fffse')
+        # The process peak before the run is left out
+        with mock.patch('collect.collect_base.peak_rss', side_effect=[5000, 5300]):
+            Collector.dispatch(source, ops=[])
+        self.assertEqual(source.records.get().metrics['peak_memory'], 300)
+
+    def test_collect_job_renews_its_lock(self):
+        source = Source.objects.create(id='test', url='https://example.com/', settings={}, plugin='fffse')
+        start_collect_job(source, ops=['clear'])
+        job = claim('test', kinds=['collect.run'])
+        with mock.patch('collect.jobs.heartbeat') as heartbeat:
+            run_job(job)
+        heartbeat.assert_called_with(job)
+
+    def test_timed_out_job_fails_its_collect_job(self):
+        source = Source.objects.create(id='test', url='https://example.com/', settings={}, plugin='fffse')
+        collect_job = start_collect_job(source)
+        job = claim('test', kinds=['collect.run'])
+        CollectJob.objects.filter(id=collect_job.id).update(status=CollectJob.Status.RUNNING)
+        # The worker died without renewing the lock
+        Job.objects.filter(id=job.id).update(locked_until=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertIsNone(claim('other', kinds=['collect.run']))
+        collect_job.refresh_from_db()
+        self.assertEqual((collect_job.status, collect_job.error), (CollectJob.Status.FAILED, "Timed out"))
+        self.assertEqual(Job.objects.get(id=job.id).status, Job.Status.FAILED)
+
+class FffseCollectorTests(TestCase):
+    def test_store_bumps_events_once(self):
+        sweden = Country.objects.create(code='SE', name='Sweden')
+        Organization.objects.create(name='Fridays For Future Sweden')
+        Location.objects.create(name='Lund', in_country=sweden, lat=0, lon=0)
+        source = Source.objects.create(id='fffse', url='https://example.com/', settings={}, plugin='fffse')
+
+        def download(collector):
+            collector.responses = [{'RTIME': 1600000000 + i, 'ECITY': city} for i, city in enumerate(['Lund', 'Ystad'])]
+            return True
+
+        with mock.patch('collect.collect_fffse.Collect_fffse.collect_data', download):
+            Collector.dispatch(source, ops=['collect', 'store'])
+        self.assertEqual(Event.objects.filter(location__name='lund').count(), 1)
+        self.assertEqual(Event.objects.filter(location=None).count(), 1)
+        self.assertEqual(get_versions('events')['events'][0], 1)
+
+FEED_CSV = b"""id,date,city
+1,2024-01-05,Lund
+2,not a date,Lund
+3,2024-02-30,Lund
+4,2024-01-06,Malmo
+"""
+
+class FeedCollectorTests(TestCase):
+    def test_invalid_records_are_skipped(self):
+        Country.objects.create(code='SE', name='Sweden')
+        source = Source.objects.create(id='feed', url='https://example.com/feed.csv', plugin='feed', settings={
+            'format': 'csv',
+            'fields': {'id': 'id', 'date': 'date'},
+            'location': {'field': 'city', 'country': 'SE'},
+        })
+        downloads = []
+
+        def download(collector):
+            collector.download = tempfile.TemporaryFile()
+            collector.download.write(FEED_CSV)
+            collector.download.seek(0)
+            downloads.append(collector.download)
+            return True
+
+        with mock.patch('collect.collect_feed.Collect_feed.collect_data', download):
+            Collector.dispatch(source, ops=['collect', 'store'])
+        self.assertEqual(sorted(Event.objects.values_list('id', flat=True)), ['feed:1', 'feed:4'])
+        self.assertEqual(source.records.get().metrics['items_skipped'], 2)
+        self.assertTrue(downloads[0].closed)
+
+    def test_mappings_are_per_country_and_ignore_case(self):
+        sweden = Country.objects.create(code='SE', name='Sweden')
+        Country.objects.create(code='NO', name='Norway')
+        malmo = Location.objects.create(name='Malmö', in_country=sweden, lat=0, lon=0)
+        source = Source.objects.create(id='feed', url='https://example.com/feed.csv', plugin='feed', settings={
+            'format': 'csv',
+            'fields': {'id': 'id', 'date': 'date'},
+            'location': {'field': 'city', 'country_field': 'country'},
+        })
+        feed = "id,date,city,country\n1,2024-01-05,Lund,SE\n2,2024-01-05,LUND,SE\n3,2024-01-05,Lund,NO\n4,2024-01-05,MALMÖ,SE\n"
+
+        def download(collector):
+            collector.download = tempfile.TemporaryFile()
+            collector.download.write(feed.encode())
+            collector.download.seek(0)
+            return True
+
+        with mock.patch('collect.collect_feed.Collect_feed.collect_data', download):
+            Collector.dispatch(source, ops=['collect', 'store'])
+        self.assertEqual(sorted(source.location_mappings.values_list('imported_name', 'country_id')), [('Lund', 'NO'), ('Lund', 'SE')])
+        self.assertEqual(Event.objects.get(id='feed:4').location, malmo)
+
+        # A later run finds the mappings whatever the case
+        feed = "id,date,city,country\n5,2024-01-06,lund,SE\n6,2024-01-06,lund,NO\n"
+        with mock.patch('collect.collect_feed.Collect_feed.collect_data', download):
+            Collector.dispatch(source, ops=['collect', 'store'])
+        self.assertEqual(source.location_mappings.count(), 2)
+
+class LocationMatchingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sweden = Country.objects.create(code='SE', name='Sweden')
+        cls.norway = Country.objects.create(code='NO', name='Norway')
+        cls.malmo = Location.objects.create(name='Malmö', in_country=cls.sweden, lat=0, lon=0)
+        cls.lund = Location.objects.create(name='Lund', in_country=cls.sweden, lat=0, lon=0)
+        cls.lunde = Location.objects.create(name='Lunde', in_country=cls.norway, lat=0, lon=0)
+        cls.source = Source.objects.create(id='feed', url='https://example.com/', settings={}, plugin='feed')
+
+    def test_trigram_scores(self):
+        index = TrigramIndex([self.malmo, self.lund, self.lunde])
+        self.assertEqual(index.search('MALMO')[0], (1.0, self.malmo))
+        suggestions = index.search('Lund')
+        self.assertEqual([location for _, location in suggestions], [self.lund, self.lunde])
+        self.assertGreater(suggestions[0][0], suggestions[1][0])
+        self.assertEqual(index.search('Stockholm'), [])
+
+    def test_command_resolves_within_the_country(self):
+        norwegian = LocationImportMapping.objects.create(source=self.source, imported_name='Lund', country=self.norway)
+        swedish = LocationImportMapping.objects.create(source=self.source, imported_name='Malmo', country=self.sweden)
+        other_source = Source.objects.create(id='other', url='https://example.com/', settings={}, plugin='feed')
+        unknown = LocationImportMapping.objects.create(source=other_source, imported_name='Lund')
+
+        call_command('match_locations', '--threshold', '0.5', '--dry-run', stdout=io.StringIO())
+        self.assertFalse(LocationImportMapping.objects.filter(location__isnull=False).exists())
+
+        out = io.StringIO()
+        call_command('match_locations', '--threshold', '0.5', stdout=out)
+        self.assertIn('resolved 2', out.getvalue())
+        for mapping, location in ((norwegian, self.lunde), (swedish, self.malmo), (unknown, None)):
+            mapping.refresh_from_db()
+            self.assertEqual(mapping.location, location)
+
+class PurgeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sweden = Country.objects.create(code='SE', name='Sweden')
+        cls.organization = Organization.objects.create(name='org')
+        cls.source = Source.objects.create(id='src', url='https://example.com/', settings={}, plugin='feed')
+        for i in range(5):
+            cls.add_event(f'src:{i}', 'src')
+        cls.kept = cls.add_event('other:1', 'other')
+
+    @classmethod
+    def add_event(cls, event_id, source_id):
+        event = Event.objects.create(id=event_id, ext_data_src=source_id, date='2024-01-05', country=cls.sweden, time_of_day='12:00')
+        event.organizers.add(cls.organization)
+        EventRecord.objects.create(event=event, participants=10, data={})
+        return event
+
+    def test_purge_deletes_in_chunks_with_dependents(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(purge_source_events(self.source, chunk_size=2), 5)
+        event_deletes = [q for q in queries if q['sql'].startswith(f'DELETE FROM "{Event._meta.db_table}"')]
+        self.assertEqual(len(event_deletes), 3)
+        self.assertEqual(list(Event.objects.values_list('id', flat=True)), [self.kept.id])
+        self.assertEqual(list(EventRecord.objects.values_list('event_id', flat=True)), [self.kept.id])
+        self.assertEqual(list(Event.organizers.through.objects.values_list('event_id', flat=True)), [self.kept.id])
+
+    def test_purge_bumps_events_once(self):
+        with mock.patch('collect.purge.bump') as bump:
+            purge_source_events(self.source, chunk_size=2)
+        bump.assert_called_once_with('events')
+
+    def test_purge_writes_deletion_history(self):
+        purge_source_events(self.source, chunk_size=2)
+        deleted = Event.history.filter(history_type='-')
+        self.assertEqual(sorted(deleted.values_list('id', flat=True)), [f'src:{i}' for i in range(5)])
+        self.assertEqual(set(deleted.values_list('history_change_reason', 'country_id', 'time_of_day')), {('purged', 'SE', '12:00')})
+        self.assertEqual(len({row.history_date for row in deleted}), 1)
+
+    def test_purge_history_can_be_skipped(self):
+        self.source.settings = {'purge_history': False}
+        purge_source_events(self.source)
+        self.assertFalse(Event.history.filter(history_type='-').exists())
+        self.assertEqual(Event.objects.count(), 1)
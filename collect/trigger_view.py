@@ -1,36 +1,32 @@
 import datetime
 from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_GET
 from cron_converter import Cron
-from .models import Source, Record
-from .collect_base import Collector
-
-# Imports required for plugin registration to happen
-from .collect_fffse import Collect_fffse 
+from .models import Source, Record, CollectJob
+from .jobs import start_collect_job
 
 @csrf_exempt
 @require_GET
 def run_collect_plugin(request, source_id):
     try:
-        result = {}
         source = Source.objects.get(id=source_id)
-        result = Collector.dispatch(source)
-        Record.objects.create(
-            source=source,
-            result=result,
-            timestamp=datetime.datetime.now(tz=datetime.timezone.utc)
-        )
-        source.last_run = datetime.datetime.now(tz=datetime.timezone.utc)
-        source.save()
-        return JsonResponse({"status": "success", "result": result})
-    except Exception as e:
-        Record.objects.create(
-            source=source,
-            result={"error": str(e)},
-            timestamp=datetime.datetime.now(tz=datetime.timezone.utc)
-        )
-        return JsonResponse({"status": "error", "error": str(e)}, status=500)
+    except Source.DoesNotExist:
+        return JsonResponse({"status": "error", "error": f"Unknown source {source_id}"}, status=404)
+    # The run happens in the background, poll the status url for progress
+    job = start_collect_job(source)
+    return JsonResponse({
+        "status": "queued",
+        "job_id": job.id,
+        "status_url": reverse("collect_job_status", args=[job.id]),
+    }, status=202)
+
+@require_GET
+def collect_job_status(request, job_id):
+    job = get_object_or_404(CollectJob, id=job_id)
+    return JsonResponse(job.as_dict())
     
 def run_collect_all(request):
     for source in Source.objects.all():
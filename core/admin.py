@@ -1,5 +1,5 @@
 from django.contrib import admin
-from core.models import Country, Location, Organization, Role, Stakeholder, Event
+from core.models import Country, Location, Organization, Role, Stakeholder, Event, Job
 
 admin.site.register(Country)
 admin.site.register(Location)
@@ -7,3 +7,4 @@ admin.site.register(Organization)
 admin.site.register(Role)
 admin.site.register(Stakeholder)
 admin.site.register(Event)
+admin.site.register(Job)
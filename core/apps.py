@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from .jobs import discover_handlers
+        from .versions import connect_signals
+        discover_handlers()
+        connect_signals()
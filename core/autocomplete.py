@@ -0,0 +1,144 @@
+"""
+Ranked prefix autocomplete for locations and organizations.
+
+Every process keeps an in-memory index per kind, built from the database
+and rebuilt when the version of a dataset it depends on changes, see
+core.versions, so a save in any process is seen by the next search.
+Names are folded with core.text.fold() and indexed from the start of
+every word, so "lan" finds "Stockholms Län". Matches rank an exact name
+first, then names starting with the query, then names with a word
+starting with it, and within each by number of events. Event counts
+change with every collection run, so they are only reloaded when at
+least COUNTS_MAX_AGE seconds old.
+"""
+import bisect, heapq, re, threading, time
+from django.db.models import Count
+from .models import Event, Location, Organization
+from .text import fold
+from .versions import get_versions
+
+COUNTS_MAX_AGE = 300
+EXACT, PREFIX, WORD = 0, 1, 2
+WORD_START = re.compile(r'\b\w')
+
+class PrefixIndex:
+    """
+    Sorted folded names of items, one key for every word a name starts at.
+    The keys matching a prefix are a contiguous range found by bisection.
+    items maps id to the payload returned by searches.
+    """
+    def __init__(self, items, names):
+        self.items = items
+        self.names = {}
+        keys = []
+        for item_id, name in names.items():
+            folded = fold(name)
+            self.names[item_id] = folded
+            starts = {0} | {match.start() for match in WORD_START.finditer(folded)}
+            keys.extend((folded[start:], item_id) for start in starts)
+        keys.sort()
+        self.keys = [key for key, _ in keys]
+        self.ids = [item_id for _, item_id in keys]
+        self.counts = {}
+
+    def search(self, query, limit=10):
+        """
+        Return the ids of up to limit items matching query, best first.
+        """
+        query = fold(query)
+        if not query:
+            return []
+        lo = bisect.bisect_left(self.keys, query)
+        hi = bisect.bisect_left(self.keys, query + chr(0x10ffff), lo)
+        tiers = {}
+        for item_id in self.ids[lo:hi]:
+            if item_id in tiers:
+                continue
+            name = self.names[item_id]
+            tiers[item_id] = EXACT if name == query else PREFIX if name.startswith(query) else WORD
+        counts, names = self.counts, self.names
+        return heapq.nsmallest(limit, tiers, key=lambda i: (tiers[i], -counts.get(i, 0), names[i]))
+
+class Autocomplete:
+    """
+    The PrefixIndex of one kind of item in this process, kept current with
+    the versions of datasets.
+    """
+    def __init__(self, datasets, load, load_counts):
+        self.datasets = datasets
+        self.load = load
+        self.load_counts = load_counts
+        self.lock = threading.Lock()
+        self.index = None
+        self.version = None
+        self.counted_at = None
+
+    def current(self):
+        versions = get_versions(*self.datasets, 'events')
+        version = tuple(versions[name] for name in self.datasets)
+        counted = versions['events']
+        if self.version != version:
+            with self.lock:
+                if self.version != version:
+                    index = PrefixIndex(*self.load())
+                    index.counts = self.load_counts()
+                    self.index, self.version, self.counted_at = index, version, (counted, time.monotonic())
+        elif self.counted_at[0] != counted and time.monotonic() - self.counted_at[1] > COUNTS_MAX_AGE:
+            with self.lock:
+                if self.counted_at[0] != counted:
+                    self.index.counts = self.load_counts()
+                    self.counted_at = (counted, time.monotonic())
+        return self.index
+
+    def search(self, query, limit=10):
+        index = self.current()
+        return [index.items[item_id] for item_id in index.search(query, limit)]
+
+def load_locations():
+    rows = list(Location.objects.values_list('id', 'name', 'in_location_id', 'in_country__name'))
+    parents = {location_id: (name, parent_id) for location_id, name, parent_id, _ in rows}
+    items, names = {}, {}
+    for location_id, name, parent_id, country in rows:
+        # Same as Location.full_name(), without a query per level
+        chain, seen = [name.title()], {location_id}
+        while parent_id and parent_id not in seen:
+            seen.add(parent_id)
+            parent_name, parent_id = parents[parent_id]
+            chain.append(parent_name.title())
+        chain.append(country.title())
+        items[location_id] = {
+            'id': location_id,
+            'name': name.title(),
+            'country': country.title(),
+            'display': f"{name.title()} ({country.title()})",
+            'full_name': ', '.join(chain),
+        }
+        names[location_id] = name
+    return items, names
+
+def count_location_events():
+    return dict(Event.objects.filter(location__isnull=False).values_list('location').annotate(n=Count('id')).order_by())
+
+def load_organizations():
+    rows = list(Organization.objects.values_list('id', 'name'))
+    return {org_id: {'id': org_id, 'name': name} for org_id, name in rows}, dict(rows)
+
+def count_organization_events():
+    Organizers = Event.organizers.through
+    return dict(Organizers.objects.values_list('organization_id').annotate(n=Count('id')).order_by())
+
+locations = Autocomplete(('locations', 'countries'), load_locations, count_location_events)
+organizations = Autocomplete(('organizations',), load_organizations, count_organization_events)
+
+def complete_locations(query, limit=10):
+    """
+    Locations matching query as dicts of id, name, country, display and
+    full_name, best first.
+    """
+    return locations.search(query, limit)
+
+def complete_organizations(query, limit=20):
+    """
+    Organizations matching query as dicts of id and name, best first.
+    """
+    return organizations.search(query, limit)
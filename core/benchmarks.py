@@ -0,0 +1,221 @@
+"""
+Benchmarks of the key views and functions, run by `manage.py benchmark`.
+
+A benchmark is a function registered with the benchmark decorator. It is
+called once with the BenchmarkContext and returns the callable to time,
+or a (callable, cleanup) tuple when every timed run must be followed by
+an untimed cleanup. Benchmarks run against the current database, which
+should hold a dataset from `manage.py generate_synthetic_data`, and with
+a dummy cache, so that the views do their work on every run instead of
+serving the page and option caches filled by the warmup.
+"""
+import csv, datetime, io, statistics, time
+from django.contrib.auth.models import User
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+from .metrics import count_queries
+from .models import Country, Event, EventPlan, Location, Organization
+
+_benchmarks = {}
+
+NO_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+def benchmark(name):
+    def register(func):
+        _benchmarks[name] = func
+        return func
+    return register
+
+def available():
+    return list(_benchmarks)
+
+class BenchmarkContext:
+    """
+    Logged in test client and sample objects shared by the benchmarks.
+    """
+    def __init__(self):
+        self.user, created = User.objects.get_or_create(username='benchmark')
+        if created:
+            self.user.set_unusable_password()
+            self.user.save()
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.country = Country.objects.annotate(n=Count('events')).order_by('-n').first()
+        self.location = Location.objects.annotate(n=Count('events')).order_by('-n').first()
+        self.plan = EventPlan.objects.annotate(n=Count('events')).order_by('-n').first()
+        self.cleanups = []
+
+    def get(self, url):
+        response = self.client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {url} returned {response.status_code}")
+        return response
+
+    def close(self):
+        """
+        Run the cleanups and remove the benchmark user and its session.
+        """
+        for cleanup in self.cleanups:
+            cleanup()
+        self.client.logout()
+        self.user.delete()
+
+def dataset_size():
+    return {
+        'countries': Country.objects.count(),
+        'locations': Location.objects.count(),
+        'organizations': Organization.objects.count(),
+        'plans': EventPlan.objects.count(),
+        'events': Event.objects.count(),
+    }
+
+def run_benchmarks(names=None, repeat=5, warmup=1, progress=None):
+    """
+    Run the named benchmarks, or all, and return their results keyed by
+    name: timings in milliseconds and the queries of one run.
+    """
+    results = {}
+    with override_settings(ALLOWED_HOSTS=['testserver'], CACHES=NO_CACHES):
+        ctx = BenchmarkContext()
+        try:
+            for name in names or _benchmarks:
+                run = _benchmarks[name](ctx)
+                run, cleanup = run if isinstance(run, tuple) else (run, None)
+                timings, queries = [], 0
+                for i in range(warmup + repeat):
+                    with count_queries() as stats:
+                        start = time.perf_counter()
+                        run()
+                        elapsed = time.perf_counter() - start
+                    if cleanup:
+                        cleanup()
+                    if i >= warmup:
+                        timings.append(elapsed * 1000)
+                        queries = stats.queries
+                results[name] = {
+                    'runs': repeat,
+                    'min_ms': round(min(timings), 3),
+                    'median_ms': round(statistics.median(timings), 3),
+                    'mean_ms': round(statistics.mean(timings), 3),
+                    'max_ms': round(max(timings), 3),
+                    'queries': queries,
+                }
+                if progress:
+                    progress(name, results[name])
+        finally:
+            ctx.close()
+    return results
+
+def compare(baseline, current, threshold=0.2):
+    """
+    Compare the median timings of two result sets. Returns a list of
+    (name, baseline_ms, current_ms, change, regressed) rows.
+    """
+    rows = []
+    for name, result in current.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]['median_ms'], result['median_ms']
+        change = (after - before) / before if before else 0.0
+        rows.append((name, before, after, change, change > threshold))
+    return rows
+
+@benchmark('event_list')
+def event_list(ctx):
+    return lambda: ctx.get(reverse('event_list'))
+
+@benchmark('event_list_page')
+def event_list_page(ctx):
+    return lambda: ctx.get(reverse('event_list') + '?page=20')
+
+@benchmark('event_list_country')
+def event_list_country(ctx):
+    return lambda: ctx.get(reverse('event_list') + f'?country={ctx.country.code}')
+
+@benchmark('event_list_dates')
+def event_list_dates(ctx):
+    today = datetime.date.today()
+    return lambda: ctx.get(reverse('event_list') + f'?date_from={today - datetime.timedelta(days=90)}&date_to={today}')
+
+@benchmark('event_list_search')
+def event_list_search(ctx):
+    return lambda: ctx.get(reverse('event_list') + f'?search={ctx.location.name[:4]}')
+
+@benchmark('country_events')
+def country_events(ctx):
+    return lambda: ctx.get(reverse('country_events', args=[ctx.country.code]))
+
+@benchmark('location_events')
+def location_events(ctx):
+    return lambda: ctx.get(reverse('location_events', args=[ctx.location.id]))
+
+@benchmark('location_list')
+def location_list(ctx):
+    return lambda: ctx.get(reverse('get_locations_by_country') + f'?country={ctx.country.code}')
+
+@benchmark('location_search')
+def location_search(ctx):
+    return lambda: ctx.get(reverse('search_locations') + f'?q={ctx.location.name[:3]}')
+
+@benchmark('organization_search')
+def organization_search(ctx):
+    return lambda: ctx.get(reverse('search_organizations') + '?q=synthetic organization 1')
+
+@benchmark('plan_detail')
+def plan_detail(ctx):
+    return lambda: ctx.get(reverse('eventplan_detail', args=[ctx.plan.id]))
+
+@benchmark('recurrence_expansion')
+def recurrence_expansion(ctx):
+    plans = list(EventPlan.objects.exclude(recurrence=EventPlan.Recurrence.IRREGULAR)[:200])
+    def run():
+        for plan in plans:
+            plan.get_next_event_dates(count=52)
+    return run
+
+@benchmark('collector_store')
+def collector_store(ctx):
+    """
+    Store a 2000 row CSV feed of new events with the feed collector.
+    """
+    from collect.collect_feed import Collect_feed
+    from collect.models import LocationImportMapping, Source
+    from collect.purge import purge_source_events
+
+    source, _ = Source.objects.get_or_create(id='benchmark-feed', defaults={
+        'url': 'http://localhost/benchmark.csv',
+        'plugin': 'feed',
+        'enabled': False,
+        'settings': {
+            'format': 'csv',
+            'fields': {'id': 'id', 'date': 'date', 'time_of_day': 'time'},
+            'location': {'field': 'city', 'country_field': 'country'},
+            'chunk_size': 500,
+            'purge_history': False,
+        },
+    })
+    locations = list(Location.objects.select_related('in_country')[:500])
+    feed = io.StringIO()
+    writer = csv.writer(feed)
+    writer.writerow(['id', 'date', 'time', 'city', 'country'])
+    for i in range(2000):
+        location = locations[i % len(locations)]
+        writer.writerow([i, datetime.date.today() + datetime.timedelta(days=i % 365), '12:00',
+                         location.name.title(), location.in_country.code])
+    data = feed.getvalue().encode()
+
+    def run():
+        collector = Collect_feed(source)
+        collector.download = io.BytesIO(data)
+        collector.store_data()
+    def cleanup():
+        purge_source_events(source)
+    def remove_source():
+        source_id = source.id
+        source.delete()
+        Event.history.filter(ext_data_src=source_id).delete()
+        LocationImportMapping.history.filter(source_id=source_id).delete()
+        Source.history.filter(id=source_id).delete()
+    ctx.cleanups.append(remove_source)
+    return run, cleanup
@@ -0,0 +1,38 @@
+"""
+Conditional responses from data versions.
+
+Views decorated with versioned_condition() send an ETag and a
+Last-Modified header derived from the versions of the datasets they
+show, see core.versions, and answer requests with a matching
+If-None-Match or If-Modified-Since with 304 Not Modified before the view
+runs, so only the version lookup queries the database.
+"""
+import datetime, hashlib
+from django.utils import timezone
+from django.views.decorators.http import condition
+from .versions import request_versions, version_key
+
+def versioned_condition(datasets, per_user=False):
+    """
+    condition() decorator for a view showing datasets. Responses depend on
+    the full URL and the date, as event statuses change at midnight.
+    per_user is for pages showing the user, e.g. a username or a CSRF token
+    in the header, whose ETags also hold the user. They leave out the CSRF
+    cookie, which the first response sets, so that the first revalidation
+    matches too. The cookie only rotates at login, when the user changes.
+    """
+    def etag(request, *args, **kwargs):
+        parts = [
+            request.get_full_path(),
+            datetime.date.today().isoformat(),
+            version_key(*datasets, versions=request_versions(request, datasets)),
+        ]
+        if per_user:
+            parts.append(str(request.user.pk))
+        return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        dates = [updated_at for _, updated_at in request_versions(request, datasets).values() if updated_at]
+        return max(dates + [timezone.make_aware(datetime.datetime.combine(datetime.date.today(), datetime.time()))])
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
@@ -0,0 +1,52 @@
+"""
+Routing of read-only views to the replica database.
+
+Views decorated with read_only, and code inside a use_replica() block,
+read models of the REPLICA_APPS from the 'replica' connection when one
+is configured. Writes, and all reads elsewhere, go to 'default'.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_ALIAS = 'replica'
+# Sessions and users always come from the primary, so that a lagging
+# replica never logs anyone out
+REPLICA_APPS = {'core', 'collect'}
+
+_use_replica = ContextVar('use_replica', default=False)
+
+@contextmanager
+def use_replica():
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+def read_only(view):
+    """
+    Decorator for views that only read, letting them use the replica.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with use_replica():
+            return view(*args, **kwargs)
+    return wrapper
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and model._meta.app_label in REPLICA_APPS and REPLICA_ALIAS in connections.settings:
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Instances read from the replica must still be saved to the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,155 @@
+"""
+Batched writing of simple_history records.
+
+Models use BufferedHistoricalRecords instead of HistoricalRecords. A
+history_buffer() block is a transaction in which historical rows are not
+saved one by one but collected, and written with one bulk_create per
+model right before the transaction commits, so the history is committed
+together with the changes it records. Rows of a savepoint that is rolled
+back are dropped with it. Outside a buffer, rows are saved immediately as
+usual. Code that saves many objects in a loop should run it in a buffer.
+
+Code that writes many rows at once should use the bulk helpers below,
+since plain bulk ORM operations bypass the history signals entirely.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import connections, transaction
+from django.utils import timezone
+from simple_history.models import HistoricalRecords
+from simple_history.signals import pre_create_historical_record, post_create_historical_record
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
+
+_current_buffer = ContextVar('history_buffer', default=None)
+
+class HistoryBuffer:
+    def __init__(self, using):
+        self.using = using
+        self.pending = defaultdict(list)
+
+    def add(self, history_instance, instance):
+        # A no-op on_commit callback registered now is discarded by Django
+        # if the current savepoint is rolled back, which tells flush() that
+        # the row is gone too
+        def marker():
+            pass
+        transaction.on_commit(marker, using=self.using)
+        self.pending[type(history_instance)].append((history_instance, instance, marker))
+
+    def flush(self):
+        """
+        Write the rows of the savepoints that were not rolled back. Must run
+        inside the buffer's transaction.
+        """
+        alive = {func for _, func, _ in connections[self.using].run_on_commit}
+        pending, self.pending = self.pending, defaultdict(list)
+        for model, rows in pending.items():
+            rows = [(history, instance) for history, instance, marker in rows if marker in alive]
+            model.objects.using(self.using).bulk_create([history for history, _ in rows])
+            for history, instance in rows:
+                post_create_historical_record.send(
+                    sender=model,
+                    instance=instance,
+                    history_instance=history,
+                    history_date=history.history_date,
+                    history_user=history.history_user,
+                    history_change_reason=history.history_change_reason,
+                    using=self.using,
+                )
+
+@contextmanager
+def history_buffer(using='default'):
+    """
+    Run the block in a transaction, buffering the historical rows written
+    inside it and bulk inserting them before it commits. Nested blocks
+    share the outermost buffer and its transaction.
+    """
+    if _current_buffer.get() is not None:
+        yield _current_buffer.get()
+        return
+    buffer = HistoryBuffer(using)
+    token = _current_buffer.set(buffer)
+    try:
+        with transaction.atomic(using=using):
+            yield buffer
+            buffer.flush()
+    finally:
+        _current_buffer.reset(token)
+
+class BufferedHistoricalRecords(HistoricalRecords):
+    """
+    HistoricalRecords that defers saving to the active history_buffer().
+    Outside a buffer, for other databases and for models tracking m2m
+    fields, records are saved immediately as usual.
+    """
+    def create_historical_record(self, instance, history_type, using=None):
+        buffer = _current_buffer.get()
+        using = using if self.use_base_model_db else None
+        if buffer is None or self.m2m_fields or (using or 'default') != buffer.using:
+            return super().create_historical_record(instance, history_type, using=using)
+
+        manager = getattr(instance, self.manager_name)
+        history_instance = manager.model(
+            history_date=getattr(instance, "_history_date", timezone.now()),
+            history_type=history_type,
+            history_user=self.get_history_user(instance),
+            history_change_reason=self.get_change_reason_for_object(instance, history_type, using),
+            **{field.attname: getattr(instance, field.attname) for field in self.fields_included(instance)},
+        )
+        if getattr(manager.model, "history_relation", None) is not None:
+            history_instance.history_relation = instance
+        pre_create_historical_record.send(
+            sender=manager.model,
+            instance=instance,
+            history_date=history_instance.history_date,
+            history_user=history_instance.history_user,
+            history_change_reason=history_instance.history_change_reason,
+            history_instance=history_instance,
+            using=using,
+        )
+        buffer.add(history_instance, instance)
+
+def bulk_insert_new_with_history(objs, model, unique_fields, batch_size=None):
+    """
+    Insert the objs whose unique_fields values are not in the table yet and
+    write "+" history for them only. Call it in a transaction, which on
+    SQLite holds the write lock, so no other writer can insert the same
+    keys in between. Returns the inserted objects.
+    """
+    objs = list(objs)
+    keys = [tuple(getattr(obj, field) for field in unique_fields) for obj in objs]
+    lookup = {f"{field}__in": {key[i] for key in keys} for i, field in enumerate(unique_fields)}
+    existing = set(model.objects.filter(**lookup).values_list(*unique_fields)) if objs else set()
+    new, seen = [], set()
+    for obj, key in zip(objs, keys):
+        if key not in existing and key not in seen:
+            seen.add(key)
+            new.append(obj)
+    model.objects.bulk_create(new, batch_size=batch_size)
+    model.history.bulk_history_create(new, batch_size=batch_size)
+    return new
+
+def bulk_upsert_with_history(objs, model, unique_fields, update_fields, batch_size=None):
+    """
+    Insert or update objs with one bulk_create(update_conflicts=True) and
+    write "+" history for new rows and "~" history for updated ones.
+    Returns the number of (inserted, updated) rows.
+    """
+    objs = list(objs)
+    keys = [tuple(getattr(obj, field) for field in unique_fields) for obj in objs]
+    lookup = {f"{unique_fields[0]}__in": [key[0] for key in keys]}
+    existing = set(model.objects.filter(**lookup).values_list(*unique_fields))
+    model.objects.bulk_create(
+        objs,
+        update_conflicts=True,
+        unique_fields=unique_fields,
+        update_fields=update_fields,
+        batch_size=batch_size,
+    )
+    created = [obj for obj, key in zip(objs, keys) if key not in existing]
+    updated = [obj for obj, key in zip(objs, keys) if key in existing]
+    model.history.bulk_history_create(created, batch_size=batch_size)
+    model.history.bulk_history_create(updated, batch_size=batch_size, update=True)
+    return len(created), len(updated)
+
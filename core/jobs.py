@@ -0,0 +1,182 @@
+"""
+A small job queue stored in the application database.
+
+Job handlers are registered per job kind with the job_handler decorator,
+in a jobs.py module of any installed app. Work is queued with enqueue()
+and executed by `manage.py worker`, which claims jobs with a conditional
+UPDATE so that several worker processes can share one SQLite database.
+A claimed job is locked for its timeout, which long running handlers
+extend with heartbeat(); if the worker dies the lock expires and the job
+is picked up again, until max_attempts is reached. Then the job fails and
+the handler's on_timeout callback, if any, cleans up after it.
+"""
+import datetime, logging, time
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils.module_loading import autodiscover_modules
+from .slowlog import log_slow_queries
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+RETRY_BACKOFF = 30  # seconds, doubled for every failed attempt
+
+def job_handler(kind, timeout=300, max_attempts=3, priority=0, on_timeout=None):
+    """
+    Register the decorated function as handler for jobs of the given kind.
+    The function is called with the Job and its return value, which must
+    be JSON serializable, is stored as the job result. on_timeout is called
+    with the Job when it fails because its last attempt timed out.
+    """
+    def register(func):
+        _handlers[kind] = {
+            'func': func,
+            'timeout': timeout,
+            'max_attempts': max_attempts,
+            'priority': priority,
+            'on_timeout': on_timeout,
+        }
+        return func
+    return register
+
+def discover_handlers():
+    """
+    Import the jobs.py module of every installed app, registering handlers.
+    """
+    autodiscover_modules('jobs')
+
+def _now():
+    return datetime.datetime.now(tz=datetime.timezone.utc)
+
+def enqueue(kind, payload=None, priority=None, run_after=None, user=None):
+    """
+    Queue a job of the given kind and return it. Defaults for priority,
+    timeout and attempts come from the handler registration. user is who
+    queued the job, the only one besides staff allowed to see its result.
+    With the
+    JOBS_EAGER setting the job runs in-process once the current
+    transaction commits, which is handy when no worker is running.
+    """
+    handler = _handlers.get(kind)
+    if not handler:
+        raise ValueError(f"No job handler registered for kind: {kind}")
+    job = Job.objects.create(
+        kind=kind,
+        payload=payload or {},
+        priority=handler['priority'] if priority is None else priority,
+        timeout=handler['timeout'],
+        max_attempts=handler['max_attempts'],
+        run_after=run_after or _now(),
+        created_by=user,
+    )
+    if getattr(settings, 'JOBS_EAGER', False):
+        transaction.on_commit(lambda: run_job(claim(job_id=job.id, worker='eager')))
+    return job
+
+def _claimable(now):
+    return (
+        Q(status=Job.Status.QUEUED, run_after__lte=now) |
+        Q(status=Job.Status.RUNNING, locked_until__lt=now, attempts__lt=F('max_attempts'))
+    )
+
+def claim(worker, kinds=None, job_id=None):
+    """
+    Claim the next runnable job for worker, highest priority first. Jobs
+    whose lock has expired are claimable again. Returns None if no job is
+    available. The claim is a single conditional UPDATE, so two workers
+    can never claim the same job.
+    """
+    while True:
+        now = _now()
+        fail_timed_out(now)
+        candidates = Job.objects.filter(_claimable(now))
+        if kinds:
+            candidates = candidates.filter(kind__in=kinds)
+        if job_id is not None:
+            candidates = candidates.filter(id=job_id)
+        candidate = candidates.order_by('-priority', 'id').values_list('id', 'timeout').first()
+        if candidate is None:
+            return None
+        candidate_id, timeout = candidate
+        claimed = Job.objects.filter(_claimable(now), id=candidate_id).update(
+            status=Job.Status.RUNNING,
+            locked_by=worker,
+            locked_until=now + datetime.timedelta(seconds=timeout),
+            attempts=F('attempts') + 1,
+        )
+        if not claimed:
+            # Another worker was faster, try the next one
+            continue
+        return Job.objects.get(id=candidate_id)
+
+def fail_timed_out(now=None):
+    """
+    Fail the jobs whose last attempt timed out and call their on_timeout
+    callbacks. Each job is failed with a conditional UPDATE, so callbacks
+    run once even with several workers.
+    """
+    now = now or _now()
+    for job in Job.objects.filter(status=Job.Status.RUNNING, locked_until__lt=now, attempts__gte=F('max_attempts')):
+        failed = Job.objects.filter(id=job.id, status=Job.Status.RUNNING, locked_until__lt=now).update(
+            status=Job.Status.FAILED, error="Timed out", locked_until=None, finished_at=now,
+        )
+        on_timeout = _handlers.get(job.kind, {}).get('on_timeout')
+        if failed and on_timeout:
+            try:
+                on_timeout(job)
+            except Exception:
+                logger.exception(f"on_timeout of job {job.id} {job.kind} failed")
+
+def heartbeat(job):
+    """
+    Extend the lock of a long running job by another timeout period.
+    """
+    job.locked_until = _now() + datetime.timedelta(seconds=job.timeout)
+    Job.objects.filter(id=job.id, locked_by=job.locked_by).update(locked_until=job.locked_until)
+
+def run_job(job):
+    """
+    Run a claimed job with its handler and record the outcome. Failed jobs
+    are queued again with exponential backoff until max_attempts is reached.
+    """
+    if job is None:
+        return None
+    handler = _handlers.get(job.kind)
+    try:
+        if not handler:
+            raise ValueError(f"No job handler registered for kind: {job.kind}")
+        with log_slow_queries(f"job {job.kind} #{job.id}"):
+            job.result = handler['func'](job)
+        job.status = Job.Status.DONE
+        job.error = ""
+        job.finished_at = _now()
+    except Exception as e:
+        logger.exception(f"Job {job.id} {job.kind} failed on attempt {job.attempts}")
+        job.error = str(e)
+        if job.attempts < job.max_attempts:
+            job.status = Job.Status.QUEUED
+            job.run_after = _now() + datetime.timedelta(seconds=RETRY_BACKOFF * 2 ** (job.attempts - 1))
+        else:
+            job.status = Job.Status.FAILED
+            job.finished_at = _now()
+    job.locked_until = None
+    job.save(update_fields=['result', 'status', 'error', 'run_after', 'locked_until', 'finished_at'])
+    return job
+
+def work(worker, kinds=None, poll_interval=1.0, stop=lambda: False, once=False):
+    """
+    Claim and run jobs until stop() returns true. With once, return as
+    soon as the queue is empty.
+    """
+    while not stop():
+        job = claim(worker, kinds=kinds)
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        logger.info(f"{worker} running job {job.id} {job.kind}")
+        run_job(job)
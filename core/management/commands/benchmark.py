@@ -0,0 +1,64 @@
+import datetime, json, subprocess
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from core.benchmarks import available, compare, dataset_size, run_benchmarks
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class Command(BaseCommand):
+    help = "Time the key views and functions against the current database and write JSON results"
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help=f"Benchmarks to run, default all of: {', '.join(available())}")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per benchmark")
+        parser.add_argument('--warmup', type=int, default=1, help="Untimed runs per benchmark")
+        parser.add_argument('--output', '-o', help="Write the JSON results to this file")
+        parser.add_argument('--compare', help="Compare with the JSON results of an earlier run")
+        parser.add_argument('--threshold', type=float, default=0.2, help="Slowdown counted as regression, 0.2 is 20%%")
+        parser.add_argument('--fail-on-regression', action='store_true', help="Exit with an error on regressions")
+
+    def handle(self, *args, **options):
+        unknown = set(options['names']) - set(available())
+        if unknown:
+            raise CommandError(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        def progress(name, result):
+            self.stderr.write(f"{name:24} {result['median_ms']:10.2f} ms  {result['queries']:4} queries")
+
+        report = {
+            'created': datetime.datetime.now(tz=datetime.timezone.utc).isoformat(),
+            'commit': current_commit(),
+            'database': connection.vendor,
+            'dataset': dataset_size(),
+            'repeat': options['repeat'],
+            'results': run_benchmarks(options['names'], options['repeat'], options['warmup'], progress=progress),
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
+
+        if baseline:
+            if baseline.get('dataset') != report['dataset']:
+                self.stderr.write("Warning: the datasets of the two runs differ")
+            self.stderr.write(f"Compared with {baseline.get('commit')} ({baseline.get('created')}):")
+            regressions = []
+            for name, before, after, change, regressed in compare(baseline['results'], report['results'], options['threshold']):
+                self.stderr.write(f"{name:24} {before:10.2f} -> {after:10.2f} ms  {change:+7.1%}{'  REGRESSION' if regressed else ''}")
+                if regressed:
+                    regressions.append(name)
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f"Regressions in: {', '.join(regressions)}")
@@ -0,0 +1,61 @@
+import gzip, os, time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from core.retention import COMPACT_CHUNK_SIZE, archive_path, compact_history, database_pages, history_models
+
+class Command(BaseCommand):
+    help = "Squash no-op history rows and archive history past HISTORY_RETENTION"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', action='append', dest='models', help="Only compact this model label, may be repeated")
+        parser.add_argument('--chunk-size', type=int, default=COMPACT_CHUNK_SIZE, help="Objects per transaction")
+        parser.add_argument('--archive-dir', help="Directory for archive files, defaults to HISTORY_ARCHIVE_DIR")
+        parser.add_argument('--no-archive', action='store_true', help="Delete expired rows without archiving them")
+        parser.add_argument('--vacuum', action='store_true', help="VACUUM the database afterwards to shrink the file")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the rows that would be removed")
+
+    def handle(self, *args, **options):
+        try:
+            targets = history_models(options['models'])
+        except (LookupError, ValueError) as e:
+            raise CommandError(str(e))
+
+        pages_before = database_pages()
+        removed = 0
+        for label, model, history_model, policy in targets:
+            start = time.perf_counter()
+            archive, path = None, None
+            if not options['no_archive'] and not options['dry_run']:
+                path = archive_path(label, options['archive_dir'])
+                archive = gzip.open(path, 'at', encoding='utf-8')
+            try:
+                stats = compact_history(
+                    model, history_model, policy,
+                    chunk_size=options['chunk_size'], archive=archive, dry_run=options['dry_run'],
+                )
+            finally:
+                if archive is not None:
+                    archive.close()
+            if path and not stats['expired']:
+                os.remove(path)
+                path = None
+            removed += stats['squashed'] + stats['expired']
+            self.stdout.write(
+                f"{label}: {stats['objects']} objects, squashed {stats['squashed']} no-op rows, "
+                f"expired {stats['expired']} rows{f' to {path}' if path else ''} "
+                f"in {time.perf_counter() - start:.2f}s"
+            )
+
+        if options['vacuum'] and not options['dry_run']:
+            with connection.cursor() as cursor:
+                cursor.execute("VACUUM")
+        pages_after = database_pages()
+        summary = f"{'Would remove' if options['dry_run'] else 'Removed'} {removed} history rows"
+        if pages_before and pages_after:
+            page_size = pages_before[0]
+            if options['vacuum']:
+                # VACUUM empties the freelist, so count the pages it released
+                summary += f", shrank the database file by {(pages_before[1] - pages_after[1]) * page_size} bytes"
+            else:
+                summary += f", freed {max(pages_after[2] - pages_before[2], 0) * page_size} bytes of database pages for reuse"
+        self.stdout.write(summary)
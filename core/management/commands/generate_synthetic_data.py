@@ -0,0 +1,50 @@
+import random, time
+from django.core.management.base import BaseCommand, CommandError
+from core.models import Event
+from core.synthetic import (
+    SYNTHETIC_SOURCE, clear_synthetic_data, generate_countries, generate_events,
+    generate_locations, generate_organizations, generate_plans,
+)
+
+class Command(BaseCommand):
+    help = "Generate a synthetic dataset of countries, locations, organizations, plans and events"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=10000, help="Number of events")
+        parser.add_argument('--countries', type=int, default=10, help="Number of countries, at most 40")
+        parser.add_argument('--branching', type=int, default=6, help="Sublocations per location")
+        parser.add_argument('--depth', type=int, default=3, help="Levels of the location tree in every country")
+        parser.add_argument('--organizations', type=int, default=200, help="Number of organizations")
+        parser.add_argument('--plans', type=int, default=500, help="Number of recurring event plans")
+        parser.add_argument('--seed', type=int, default=1, help="Random seed, the same seed gives the same data")
+        parser.add_argument('--clear', action='store_true', help="Remove existing synthetic data first")
+        parser.add_argument('--clear-only', action='store_true', help="Only remove existing synthetic data")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if options['clear'] or options['clear_only']:
+            removed = clear_synthetic_data()
+            self.stdout.write(f"Removed synthetic data with {removed} events")
+            if options['clear_only']:
+                return
+        if Event.objects.filter(ext_data_src=SYNTHETIC_SOURCE).exists():
+            raise CommandError("Synthetic data exists already, use --clear to replace it")
+
+        rng = random.Random(options['seed'])
+        try:
+            countries = generate_countries(options['countries'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        locations = generate_locations(rng, countries, options['branching'], options['depth'])
+        organizations = generate_organizations(options['organizations'])
+        plans = generate_plans(rng, options['plans'], locations, organizations)
+        self.stdout.write(
+            f"Created {len(countries)} countries, {len(locations)} leaf locations, "
+            f"{len(organizations)} organizations and {len(plans)} plans"
+        )
+
+        def progress(done):
+            if done % 100000 == 0 or done == options['events']:
+                self.stdout.write(f"  {done} events")
+        generate_events(rng, options['events'], locations, organizations, plans, progress=progress)
+        self.stdout.write(f"Generated synthetic data in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,39 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import Resolver404, resolve
+from core.profiling import profile_call, render_report, save_profile
+
+class Command(BaseCommand):
+    help = "Profile a GET request to a URL against the current database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help="Path with query string, e.g. '/events/?country=SE'")
+        parser.add_argument('--user', help="Username to log in as, default the first superuser")
+        parser.add_argument('--sample', action='store_true', help="Use the sampling profiler instead of cProfile")
+        parser.add_argument('--warmup', type=int, default=1, help="Unprofiled requests before the profiled one, which bypasses the caches they fill")
+        parser.add_argument('--output-dir', help="Directory for the profile files, default PROFILE_DIR")
+
+    def handle(self, *args, **options):
+        path = options['url'].split('?', 1)[0]
+        try:
+            view_name = resolve(path).view_name
+        except Resolver404:
+            raise CommandError(f"No view for {path}")
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+        else:
+            user = User.objects.filter(is_superuser=True).order_by('id').first()
+        if user is None:
+            raise CommandError("No user to log in as")
+
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            client = Client()
+            client.force_login(user)
+            for _ in range(options['warmup']):
+                client.get(options['url'])
+            profiled = profile_call(lambda: client.get(options['url']), sample=options['sample'])
+
+        title = f"GET {options['url']} ({view_name}) as {user.username} -> {profiled['result'].status_code}"
+        paths = save_profile(profiled, view_name, options['output_dir'])
+        self.stdout.write(render_report(profiled, title, paths))
@@ -0,0 +1,46 @@
+import glob, json
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+class Command(BaseCommand):
+    help = "Summarize the slow query log, slowest statements by total time first"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help="Log file, defaults to SLOW_QUERY_LOG_FILE and its rotated files")
+        parser.add_argument('--top', type=int, default=10, help="Number of statements to show")
+        parser.add_argument('--scans', action='store_true', help="Only show statements whose plan scans a table")
+
+    def handle(self, *args, **options):
+        path = str(options['file'] or settings.SLOW_QUERY_LOG_FILE)
+        files = sorted(glob.glob(path) + glob.glob(f"{path}.[0-9]*"))
+        if not files:
+            raise CommandError(f"No slow query log at {path}")
+
+        statements = defaultdict(lambda: {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'origins': set(), 'plan': None})
+        for name in files:
+            with open(name) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    statement = statements[entry['sql']]
+                    statement['count'] += 1
+                    statement['total_ms'] += entry['duration_ms']
+                    statement['max_ms'] = max(statement['max_ms'], entry['duration_ms'])
+                    statement['origins'].add(entry['origin'])
+                    statement['plan'] = entry.get('plan') or statement['plan']
+
+        ranked = sorted(statements.items(), key=lambda item: item[1]['total_ms'], reverse=True)
+        if options['scans']:
+            ranked = [(sql, s) for sql, s in ranked if s['plan'] and 'SCAN' in s['plan'].upper()]
+        for sql, statement in ranked[:options['top']]:
+            self.stdout.write(
+                f"{statement['count']}x total {statement['total_ms']:.1f} ms, max {statement['max_ms']:.1f} ms "
+                f"from {', '.join(sorted(statement['origins'])[:3])}"
+            )
+            self.stdout.write(f"  {sql[:500]}")
+            for plan_line in (statement['plan'] or '').splitlines():
+                self.stdout.write(f"    {plan_line}")
+        self.stdout.write(f"{len(statements)} distinct slow statements in {len(files)} files")
@@ -0,0 +1,46 @@
+import multiprocessing, os, signal, socket
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+def run_worker(name, kinds, poll_interval, once):
+    import django
+    django.setup()
+    from core.jobs import work
+
+    stopping = []
+    def stop(signum, frame):
+        stopping.append(signum)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    work(name, kinds=kinds, poll_interval=poll_interval, stop=lambda: bool(stopping), once=once)
+
+class Command(BaseCommand):
+    help = "Run background job worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', '-n', type=int, default=1, help="Number of worker processes")
+        parser.add_argument('--kind', action='append', dest='kinds', help="Only run jobs of this kind, may be repeated")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty")
+        parser.add_argument('--once', action='store_true', help="Exit when the queue is empty")
+
+    def handle(self, *args, **options):
+        base_name = f"{socket.gethostname()}:{os.getpid()}"
+        worker_args = (options['kinds'], options['poll_interval'], options['once'])
+        if options['processes'] <= 1:
+            run_worker(base_name, *worker_args)
+            return
+
+        # Connections must not be shared with forked children
+        connections.close_all()
+        processes = []
+        for i in range(options['processes']):
+            process = multiprocessing.Process(target=run_worker, args=(f"{base_name}/{i}", *worker_args))
+            process.start()
+            processes.append(process)
+        self.stdout.write(f"Started {len(processes)} workers")
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.join()
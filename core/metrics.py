@@ -0,0 +1,129 @@
+"""
+Per-view request metrics, kept in process memory.
+
+QueryMetricsMiddleware records for every request the number of SQL
+queries, the time spent in SQL and the total latency, keyed by the URL
+name of the view. render_prometheus() exposes the totals in the
+Prometheus text format, along with the hits and misses of the page
+caches, see core.pagecache. Each worker process keeps its own totals, which
+Prometheus sums when scraping several workers.
+"""
+import threading, time
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.db import connections
+
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_QUERY_BUDGET = 50
+
+_lock = threading.Lock()
+_views = {}
+_caches = {}
+
+class QueryStats:
+    def __init__(self, keep_statements=False):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.keep_statements = keep_statements
+        self.statements = []
+        self.durations = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.queries += 1
+            self.sql_time += duration
+            if self.keep_statements:
+                self.statements.append(sql)
+                self.durations.append(duration)
+
+@contextmanager
+def count_queries(keep_statements=False):
+    """
+    Count the queries run on every database connection inside the block.
+    Yields the QueryStats, which lists the SQL and duration of every query
+    only with keep_statements.
+    """
+    stats = QueryStats(keep_statements)
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+        yield stats
+
+def query_budget(view_name):
+    """
+    Return the maximum number of queries allowed for a view, from the
+    QUERY_BUDGETS setting keyed by URL name.
+    """
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    return budgets.get(view_name, budgets.get('default', DEFAULT_QUERY_BUDGET))
+
+def record(view_name, queries, sql_time, duration, over_budget=False):
+    with _lock:
+        view = _views.setdefault(view_name, {
+            'requests': 0,
+            'queries': 0,
+            'sql_seconds': 0.0,
+            'duration_seconds': 0.0,
+            'buckets': [0] * len(DURATION_BUCKETS),
+            'over_budget': 0,
+        })
+        view['requests'] += 1
+        view['queries'] += queries
+        view['sql_seconds'] += sql_time
+        view['duration_seconds'] += duration
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if duration <= bound:
+                view['buckets'][i] += 1
+        if over_budget:
+            view['over_budget'] += 1
+
+def record_cache(cache_name, hit):
+    with _lock:
+        counts = _caches.setdefault(cache_name, {'hits': 0, 'misses': 0})
+        counts['hits' if hit else 'misses'] += 1
+
+def reset():
+    with _lock:
+        _views.clear()
+        _caches.clear()
+
+def render_prometheus():
+    """
+    Return the collected metrics in the Prometheus text exposition format.
+    """
+    with _lock:
+        views = {name: dict(view, buckets=list(view['buckets'])) for name, view in _views.items()}
+        caches = {name: dict(counts) for name, counts in _caches.items()}
+    lines = []
+    def metric(name, kind, help_text, key):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for view_name, view in sorted(views.items()):
+            lines.append(f'{name}{{view="{view_name}"}} {view[key]}')
+
+    metric('zenchanger_requests_total', 'counter', "Requests handled.", 'requests')
+    metric('zenchanger_db_queries_total', 'counter', "SQL queries run while handling requests.", 'queries')
+    metric('zenchanger_db_query_seconds_total', 'counter', "Time spent in SQL queries.", 'sql_seconds')
+    metric('zenchanger_query_budget_exceeded_total', 'counter', "Requests over their query budget.", 'over_budget')
+
+    name = 'zenchanger_request_duration_seconds'
+    lines.append(f"# HELP {name} Request latency.")
+    lines.append(f"# TYPE {name} histogram")
+    for view_name, view in sorted(views.items()):
+        for bound, count in zip(DURATION_BUCKETS, view['buckets']):
+            lines.append(f'{name}_bucket{{view="{view_name}",le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{view="{view_name}",le="+Inf"}} {view["requests"]}')
+        lines.append(f'{name}_sum{{view="{view_name}"}} {view["duration_seconds"]}')
+        lines.append(f'{name}_count{{view="{view_name}"}} {view["requests"]}')
+
+    for key, help_text in (('hits', "Page cache hits."), ('misses', "Page cache misses.")):
+        name = f'zenchanger_cache_{key}_total'
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for cache_name, counts in sorted(caches.items()):
+            lines.append(f'{name}{{cache="{cache_name}"}} {counts[key]}')
+    return "\n".join(lines) + "\n"
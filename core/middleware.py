@@ -0,0 +1,87 @@
+import logging, time
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from . import metrics, profiling, slowlog
+from .metrics import count_queries, query_budget
+
+logger = logging.getLogger(__name__)
+
+class QueryMetricsMiddleware:
+    """
+    Record query count, SQL time and latency of every request per view,
+    and log requests that run more queries than their QUERY_BUDGETS entry.
+    The numbers are also left on request.query_metrics for tests.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with count_queries() as stats:
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = (match.view_name if match else None) or 'unresolved'
+        budget = query_budget(view_name)
+        over_budget = stats.queries > budget
+        if over_budget:
+            logger.warning(
+                f"{request.method} {request.path} ({view_name}) ran {stats.queries} queries, "
+                f"over its budget of {budget}"
+            )
+        metrics.record(view_name, stats.queries, stats.sql_time, duration, over_budget=over_budget)
+        request.query_metrics = {
+            'view': view_name,
+            'queries': stats.queries,
+            'sql_time': stats.sql_time,
+            'duration': duration,
+            'budget': budget,
+        }
+        return response
+
+class SlowQueryMiddleware:
+    """
+    Log the slow queries of sampled requests, see core.slowlog. Only
+    active when the SLOW_QUERY_THRESHOLD_MS setting is set.
+    """
+    def __init__(self, get_response):
+        if not slowlog.enabled():
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        def origin():
+            match = getattr(request, 'resolver_match', None)
+            return f"{request.method} {request.path} ({match.view_name if match else 'unresolved'})"
+        with slowlog.log_slow_queries(origin):
+            return self.get_response(request)
+
+class ProfileMiddleware:
+    """
+    Profile a GET or HEAD request when a staff user adds ?_profile=1 to the
+    URL, or ?_profile=sample for the sampling profiler, and respond with
+    the profile report instead of the page. Other methods are never
+    profiled, so that a link cannot make staff repeat a change under the
+    profiler. Conditional request headers are dropped, so that the view
+    runs instead of answering 304. See core.profiling.
+    """
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = request.GET.get('_profile')
+        if not mode or request.method not in ('GET', 'HEAD') or not request.user.is_staff:
+            return self.get_response(request)
+
+        for header in ('HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE'):
+            request.META.pop(header, None)
+        profiled = profiling.profile_call(lambda: self.get_response(request), sample=(mode == 'sample'))
+        response = profiled['result']
+        match = getattr(request, 'resolver_match', None)
+        title = f"{request.method} {request.get_full_path()} ({match.view_name if match else 'unresolved'}) -> {response.status_code}"
+        paths = profiling.save_profile(profiled, match.view_name if match else request.path)
+        return HttpResponse(profiling.render_report(profiled, title, paths), content_type='text/plain; charset=utf-8')
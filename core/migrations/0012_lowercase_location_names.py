@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def lowercase_names(apps, schema_editor):
+    # SQLite's LOWER() only folds ASCII, so names are lowered in Python like
+    # Location.save() does
+    Location = apps.get_model('core', 'Location')
+    changed = []
+    for location in Location.objects.only('id', 'name').iterator():
+        if location.name != location.name.lower():
+            location.name = location.name.lower()
+            changed.append(location)
+    Location.objects.bulk_update(changed, ['name'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_dataversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(lowercase_names, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,7 @@
 import uuid
 from django.db import models
 from django.contrib.auth.models import User
-from simple_history.models import HistoricalRecords
+from .history import BufferedHistoricalRecords
 
 class Country(models.Model):
     class Visibility(models.TextChoices):
@@ -16,7 +16,7 @@ class Country(models.Model):
         choices=Visibility.choices,
         default=Visibility.DEFAULT
     )
-    history = HistoricalRecords()
+    history = BufferedHistoricalRecords()
 
     def save(self, *args, **kwargs):
         self.name = self.name.lower()
@@ -25,6 +25,24 @@ class Country(models.Model):
     def __str__(self):
         return f"{self.name.title()}"
 
+class LocationQuerySet(models.QuerySet):
+    """
+    Bulk writes lower-case location names like Location.save() does, since
+    name lookups rely on it.
+    """
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.name = obj.name.lower()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if 'name' in fields:
+            for obj in objs:
+                obj.name = obj.name.lower()
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
 class Location(models.Model):
     name = models.CharField(max_length=255)
     display_name = models.CharField(max_length=255, blank=True)
@@ -32,10 +50,16 @@ class Location(models.Model):
     in_location = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='sublocations')
     lat = models.FloatField()
     lon = models.FloatField()
-    history = HistoricalRecords()
+    history = BufferedHistoricalRecords()
+
+    objects = LocationQuerySet.as_manager()
 
     class Meta:
         unique_together = ('name', 'in_location')
+        indexes = [
+            # Names are stored lower-case, so lookups by name use plain equality
+            models.Index(fields=['in_country', 'name'], name='location_country_name_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         self.name = self.name.lower()
@@ -67,14 +91,14 @@ class Location(models.Model):
 class Organization(models.Model):
     name = models.CharField(max_length=255)
     parent = models.ForeignKey('self', null=True, blank=True, related_name='children', on_delete=models.SET_NULL)
-    history = HistoricalRecords()
+    history = BufferedHistoricalRecords()
 
     def __str__(self):
         return self.name
 
 class Role(models.Model):
     name = models.CharField(max_length=255)
-    history = HistoricalRecords()
+    history = BufferedHistoricalRecords()
 
     def __str__(self):
         return self.name
@@ -83,7 +107,7 @@ class Stakeholder(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stakeholder_organizations')
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='stakeholders')
     role = models.ForeignKey('Role', on_delete=models.CASCADE, related_name='stakeholders')
-    history = HistoricalRecords()
+    history = BufferedHistoricalRecords()
 
     class Meta:
         unique_together = ('user', 'organization', 'role')
@@ -146,7 +170,7 @@ class EventPlan(models.Model):
     created_by = models.ForeignKey(User, null=True, on_delete=models.CASCADE, related_name='event_plans')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    history = HistoricalRecords()
+    history = BufferedHistoricalRecords()
 
     def __str__(self):
         recurrence_info = ""
@@ -258,7 +282,16 @@ class Event(models.Model):
     time_of_day = models.CharField(max_length=5)
     organizers = models.ManyToManyField(Organization, related_name='events')
     created_by = models.ForeignKey(User, null=True, on_delete=models.CASCADE, related_name='events_created')
-    history = HistoricalRecords()
+    history = BufferedHistoricalRecords()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-date'], name='event_date_idx'),
+            models.Index(fields=['country', '-date'], name='event_country_date_idx'),
+            models.Index(fields=['location', '-date'], name='event_location_date_idx'),
+            models.Index(fields=['plan', 'date'], name='event_plan_date_idx'),
+            models.Index(fields=['ext_data_src'], name='event_source_idx'),
+        ]
 
     def clean(self):
         """Validate event fields"""
@@ -283,3 +316,56 @@ class EventRecord(models.Model):
 
     def __str__(self):
         return f"Record for {self.event.id} at {self.timestamp}"
+
+class Job(models.Model):
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
+    kind = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    priority = models.IntegerField(default=0, help_text="Higher priority jobs run first")
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    timeout = models.PositiveIntegerField(default=300, help_text="Seconds a worker may hold the job before it is retried")
+    run_after = models.DateTimeField(help_text="Earliest time the job may run")
+    locked_until = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name='+',
+                                   help_text="User who queued the job, who may see its result")
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_after'], name='job_claim_idx'),
+        ]
+
+    def as_dict(self):
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'attempts': self.attempts,
+            'result': self.result,
+            'error': self.error,
+        }
+
+    def visible_to(self, user):
+        return user.is_staff or (self.created_by_id is not None and self.created_by_id == user.id)
+
+    def __str__(self):
+        return f"Job {self.id} {self.kind} ({self.status})"
+
+class DataVersion(models.Model):
+    name = models.CharField(max_length=64, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
@@ -0,0 +1,47 @@
+"""
+Cached option lists for filter dropdowns.
+
+Option lists are cached under the versions of the datasets they are
+built from, see core.versions, so a save to one of those models makes
+the next request rebuild the list. Sets that would be too large for a
+dropdown are not listed at all; forms use the typeahead endpoints for
+them instead.
+"""
+from django.core.cache import cache
+from .models import Country, Location
+from .pagecache import cached
+from .versions import version_key
+
+OPTIONS_TIMEOUT = 24 * 3600
+LOCATION_OPTIONS_LIMIT = 200
+
+def cached_options(name, datasets, build, versions=None):
+    """
+    Return the option list name, building it with build() when the
+    datasets it depends on changed since it was cached. versions may hold
+    the dataset versions already, as returned by get_versions().
+    """
+    key = f"options:{name}:{version_key(*datasets, versions=versions)}"
+    options = cached(key)
+    if options is None:
+        options = build()
+        cache.set(key, options, OPTIONS_TIMEOUT)
+    return options
+
+def country_options(versions=None):
+    """
+    Visible countries as [{'code', 'name'}], ordered by name.
+    """
+    return cached_options('countries', ['countries'], lambda: list(
+        Country.objects.filter(visibility=Country.Visibility.DEFAULT).order_by('name').values('code', 'name')
+    ), versions)
+
+def location_options(limit=LOCATION_OPTIONS_LIMIT, versions=None):
+    """
+    All locations as [{'id', 'name'}], ordered by name, or None when there
+    are more than limit, in which case a typeahead is used instead.
+    """
+    def build():
+        locations = list(Location.objects.order_by('name').values('id', 'name')[:limit + 1])
+        return locations if len(locations) <= limit else None
+    return cached_options(f'locations:{limit}', ['locations'], build, versions)
@@ -0,0 +1,120 @@
+"""
+Caching of rendered pages and page fragments.
+
+Entries are keyed on the versions of the datasets they are built from,
+see core.versions, so a save or delete of an Event, EventPlan, Location,
+Country or Organization makes the pages showing them rebuild on their
+next request. Keys also hold the view arguments, the normalized filter
+parameters, whether the user is staff and the current date, which event
+statuses depend on. Hits and misses are counted per cache in
+core.metrics.
+
+Fragments are rendered by the {% fragment %} tag of the pagecache
+template library. They are shared by all users, staff or not, so the tag
+hides the user and request from them; per-user content such as edit
+links belongs outside the fragment. CSRF tokens in a cached fragment are
+replaced with the token of the current request.
+
+Inside a bypass_caches() block nothing is looked up in the page and
+option caches, so that a profiled request does the work of a miss.
+"""
+import datetime, functools, hashlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.core.cache import cache
+from django.http import HttpResponse
+from . import metrics
+from .versions import request_versions, version_key
+
+PAGE_CACHE_TIMEOUT = 24 * 3600
+CSRF_PLACEHOLDER = 'csrf-token-of-the-request'
+
+_bypassed = ContextVar('cache_bypassed', default=False)
+
+@contextmanager
+def bypass_caches():
+    """
+    Treat every cache lookup in the block as a miss. Entries built in the
+    block are still stored.
+    """
+    token = _bypassed.set(True)
+    try:
+        yield
+    finally:
+        _bypassed.reset(token)
+
+def cached(key):
+    """
+    Return the cache entry under key, or None when there is none or the
+    caches are bypassed.
+    """
+    return None if _bypassed.get() else cache.get(key)
+
+def cache_key(prefix, request, datasets, params=(), args=()):
+    """
+    Return the key of the current request's entry in the cache prefix.
+    params names the GET parameters the response depends on.
+    """
+    filters = [(param, request.GET.get(param, '').strip()) for param in params]
+    parts = [
+        repr(args),
+        repr([(param, value) for param, value in filters if value]),
+        'staff' if request.user.is_staff else 'user',
+        datetime.date.today().isoformat(),
+        version_key(*datasets, versions=request_versions(request, datasets)),
+    ]
+    return f"{prefix}:{hashlib.md5('|'.join(parts).encode()).hexdigest()}"
+
+class Fragment:
+    """
+    A cacheable part of a page, looked up when created. Views skip building
+    the context of a fragment that is cached. versions holds the dataset
+    versions it was keyed on, for reuse by the view.
+    """
+    def __init__(self, name, key, versions):
+        self.name = name
+        self.key = key
+        self.versions = versions
+        self.html = cached(key)
+        metrics.record_cache(name, self.html is not None)
+
+    @property
+    def cached(self):
+        return self.html is not None
+
+    def render(self, render, csrf_token=None):
+        if self.html is None:
+            self.html = render()
+            cache.set(self.key, self.html, PAGE_CACHE_TIMEOUT)
+        return self.html.replace(CSRF_PLACEHOLDER, str(csrf_token or ''))
+
+def page_fragment(request, name, datasets, params=(), args=()):
+    """
+    Return the Fragment name of the current request.
+    """
+    key = cache_key(f"fragment:{name}", request, datasets, params, args)
+    return Fragment(name, key, request_versions(request, datasets))
+
+def cached_response(name, datasets, params=()):
+    """
+    Cache the successful GET responses of a view whose content only
+    depends on its arguments, the params and the datasets, e.g. an AJAX
+    endpoint.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+            key = cache_key(f"response:{name}", request, datasets, params, (args, sorted(kwargs.items())))
+            entry = cached(key)
+            metrics.record_cache(name, entry is not None)
+            if entry is not None:
+                content, content_type = entry
+                return HttpResponse(content, content_type=content_type)
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                cache.set(key, (response.content, response['Content-Type']), PAGE_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
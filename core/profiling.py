@@ -0,0 +1,153 @@
+"""
+Profiling of single requests.
+
+profile_call() runs a function under cProfile, or under a sampling
+profiler that records the Python stack of the running thread every
+millisecond, and collects the SQL queries it runs. The page and option
+caches are bypassed meanwhile, so a profiled view does all its work. The
+results are saved to PROFILE_DIR as a pstats file for snakeviz or
+pstats, and as collapsed stacks ("outer;inner count" lines) for
+flamegraph.pl or speedscope.
+When PROFILING_ENABLED, staff can profile any page by adding ?_profile=1
+(or ?_profile=sample) to its URL, see ProfileMiddleware, or use
+`manage.py profile_view`.
+"""
+import cProfile, io, os, pstats, sys, threading, time
+from collections import Counter
+from django.conf import settings
+from django.utils import timezone
+from django.utils.text import slugify
+from .metrics import count_queries
+from .pagecache import bypass_caches
+
+SAMPLE_INTERVAL = 0.001
+REPORT_FUNCTIONS = 40
+
+class StackSampler(threading.Thread):
+    """
+    Record the stack of another thread at a fixed interval.
+    """
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        base_dir = str(settings.BASE_DIR)
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                filename = code.co_filename
+                if filename.startswith(base_dir):
+                    filename = os.path.relpath(filename, base_dir)
+                elif 'site-packages' in filename:
+                    filename = filename.split('site-packages' + os.sep, 1)[1]
+                stack.append(f"{filename}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+def profile_call(func, sample=False):
+    """
+    Call func under the profiler. Returns a dict with the result of func,
+    the wall time, the queries as (seconds, sql) and the profile.
+    """
+    profile = None
+    sampler = None
+    with bypass_caches(), count_queries(keep_statements=True) as stats:
+        start = time.perf_counter()
+        if sample:
+            sampler = StackSampler(threading.get_ident())
+            sampler.start()
+            try:
+                result = func()
+            finally:
+                sampler.stop()
+        else:
+            profile = cProfile.Profile()
+            result = profile.runcall(func)
+        duration = time.perf_counter() - start
+    return {
+        'result': result,
+        'duration': duration,
+        'queries': list(zip(stats.durations, stats.statements)),
+        'profile': profile,
+        'stacks': sampler.stacks if sampler else None,
+    }
+
+def collapsed_stacks(profiled):
+    """
+    Return the sampled stacks as collapsed stack lines.
+    """
+    return "".join(f"{stack} {count}\n" for stack, count in profiled['stacks'].most_common())
+
+def save_profile(profiled, name, directory=None):
+    """
+    Write the profile and the SQL list of a profiled call to files named
+    after name and the current time, numbered if that name is taken.
+    Returns the paths written.
+    """
+    directory = directory or settings.PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    base = stem = os.path.join(directory, f"{timezone.now().strftime('%Y%m%dT%H%M%S.%f')}-{slugify(name)[:80]}")
+    number = 1
+    while os.path.exists(f"{base}.sql"):
+        number += 1
+        base = f"{stem}-{number}"
+    paths = []
+    if profiled['profile'] is not None:
+        profiled['profile'].dump_stats(f"{base}.prof")
+        paths.append(f"{base}.prof")
+    if profiled['stacks'] is not None:
+        with open(f"{base}.collapsed", 'w') as f:
+            f.write(collapsed_stacks(profiled))
+        paths.append(f"{base}.collapsed")
+    with open(f"{base}.sql", 'w') as f:
+        for duration, sql in profiled['queries']:
+            f.write(f"-- {duration * 1000:.2f} ms\n{sql};\n")
+    paths.append(f"{base}.sql")
+    return paths
+
+def render_report(profiled, title, paths=()):
+    """
+    Return a plain text report of a profiled call: the hottest functions
+    or stacks, and every SQL query with its time.
+    """
+    out = io.StringIO()
+    sql_time = sum(duration for duration, _ in profiled['queries'])
+    out.write(f"{title}\n")
+    out.write(
+        f"{profiled['duration'] * 1000:.1f} ms total, {len(profiled['queries'])} queries "
+        f"taking {sql_time * 1000:.1f} ms\n"
+    )
+    for path in paths:
+        out.write(f"Saved {path}\n")
+
+    if profiled['profile'] is not None:
+        out.write("\n")
+        stats = pstats.Stats(profiled['profile'], stream=out)
+        stats.sort_stats('cumulative').print_stats(REPORT_FUNCTIONS)
+    else:
+        own, total = Counter(), Counter()
+        for stack, count in profiled['stacks'].items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        samples = sum(profiled['stacks'].values())
+        out.write(f"\n{samples} samples\n\n  own  total  function\n")
+        for frame, count in own.most_common(REPORT_FUNCTIONS):
+            out.write(f"{count:5} {total[frame]:6}  {frame}\n")
+
+    out.write("\nSQL queries:\n")
+    for i, (duration, sql) in enumerate(profiled['queries'], 1):
+        out.write(f"{i:4}. {duration * 1000:8.2f} ms  {sql}\n")
+    return out.getvalue()
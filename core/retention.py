@@ -0,0 +1,128 @@
+"""
+Retention, compaction and archival of history tables.
+
+For every model with an entry in settings.HISTORY_RETENTION, the history
+of each object is compacted in two steps: "~" rows that changed none of
+the tracked fields are squashed, and rows past the retention policy are
+written to a gzipped JSON lines archive and deleted. The newest row of
+an object that still exists is always kept. Work is done a chunk of
+objects at a time, with a commit per chunk, so that the write lock is
+never held for long.
+"""
+import datetime, itertools, json, os
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+
+COMPACT_CHUNK_SIZE = 500  # objects per transaction
+
+def history_models(labels=None):
+    """
+    Return (label, model, history_model, policy) for every model with a
+    retention policy, or only for the given model labels.
+    """
+    retention = getattr(settings, 'HISTORY_RETENTION', {})
+    found = []
+    for label in labels or retention:
+        model = apps.get_model(label)
+        manager = getattr(model._meta, 'simple_history_manager_attribute', None)
+        if manager is None:
+            raise ValueError(f"{label} has no history")
+        found.append((model._meta.label, model, getattr(model, manager).model, retention.get(model._meta.label, {})))
+    return found
+
+def split_history(rows, fields, policy, cutoff):
+    """
+    Split the history rows of one object, oldest first, into the ids of
+    no-op changes and the rows past retention.
+    """
+    noop_ids, kept = [], []
+    previous = None
+    for row in rows:
+        values = tuple(row[field] for field in fields)
+        if row['history_type'] == '~' and values == previous:
+            noop_ids.append(row['history_id'])
+            continue
+        previous = values
+        kept.append(row)
+
+    versions = policy.get('versions')
+    expired = []
+    if versions is None and cutoff is None:
+        return noop_ids, expired
+    for position, row in enumerate(reversed(kept)):
+        if position == 0 and row['history_type'] != '-':
+            continue
+        if versions is not None and position < versions:
+            continue
+        if cutoff is not None and row['history_date'] >= cutoff:
+            continue
+        expired.append(row)
+    return noop_ids, expired[::-1]
+
+def database_pages():
+    """
+    Return (page_size, page_count, freelist_count) of a SQLite database,
+    or None for other databases.
+    """
+    if connection.vendor != 'sqlite':
+        return None
+    with connection.cursor() as cursor:
+        return tuple(
+            cursor.execute(f"PRAGMA {pragma}").fetchone()[0]
+            for pragma in ('page_size', 'page_count', 'freelist_count')
+        )
+
+def compact_history(model, history_model, policy, chunk_size=COMPACT_CHUNK_SIZE, archive=None, dry_run=False):
+    """
+    Squash no-op changes and archive and delete expired history rows of
+    model. Expired rows are written to the archive file object, if any.
+    Returns a dict with the number of objects, squashed and expired rows.
+    """
+    object_field = model._meta.pk.attname
+    fields = [field.attname for field in history_model.tracked_fields]
+    cutoff = None
+    if policy.get('days') is not None:
+        cutoff = timezone.now() - datetime.timedelta(days=policy['days'])
+
+    stats = {'objects': 0, 'squashed': 0, 'expired': 0}
+    object_ids = history_model.objects.order_by(object_field).values_list(object_field, flat=True).distinct()
+    last_id = None
+    while True:
+        chunk = object_ids if last_id is None else object_ids.filter(**{f"{object_field}__gt": last_id})
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            break
+        last_id = chunk[-1]
+        stats['objects'] += len(chunk)
+
+        with transaction.atomic():
+            rows = history_model.objects.filter(**{f"{object_field}__in": chunk}).order_by(
+                object_field, 'history_date', 'history_id'
+            ).values()
+            delete_ids = []
+            for _, object_rows in itertools.groupby(rows, key=lambda row: row[object_field]):
+                noop_ids, expired = split_history(object_rows, fields, policy, cutoff)
+                stats['squashed'] += len(noop_ids)
+                stats['expired'] += len(expired)
+                delete_ids.extend(noop_ids)
+                delete_ids.extend(row['history_id'] for row in expired)
+                if archive is not None and not dry_run:
+                    for row in expired:
+                        archive.write(json.dumps(row, cls=DjangoJSONEncoder) + "\n")
+            if delete_ids and not dry_run:
+                if archive is not None:
+                    archive.flush()
+                history_model.objects.filter(history_id__in=delete_ids).delete()
+    return stats
+
+def archive_path(label, directory=None):
+    """
+    Return a new path for a gzipped JSON lines archive of the history of label.
+    """
+    directory = directory or settings.HISTORY_ARCHIVE_DIR
+    os.makedirs(directory, exist_ok=True)
+    stamp = timezone.now().strftime('%Y%m%dT%H%M%S')
+    return os.path.join(directory, f"{label.lower()}-history-{stamp}.jsonl.gz")
@@ -0,0 +1,109 @@
+"""
+Opt-in log of slow SQL queries.
+
+When SLOW_QUERY_THRESHOLD_MS is set, SlowQueryMiddleware and run_job()
+time every query of a sampled share (SLOW_QUERY_SAMPLE_RATE) of requests
+and jobs. Queries slower than the threshold are logged as JSON lines to
+the 'zenchanger.slow_query' logger, with their EXPLAIN plan, the view or
+job that ran them and the innermost project frames of the Python stack.
+Query parameters are not logged, as they may hold personal data.
+`manage.py slow_queries` summarizes the log.
+"""
+import json, logging, os, random, time, traceback
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('zenchanger.slow_query')
+
+STACK_DEPTH = 6
+# Frames of the instrumentation itself, which every query passes through
+IGNORED_FRAMES = ('manage.py', 'core/db.py', 'core/middleware.py', 'core/metrics.py', 'core/slowlog.py')
+EXPLAIN_CACHE_SIZE = 256
+EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+
+_explaining = ContextVar('explaining', default=False)
+_plans = {}
+
+def explain(connection, sql, params):
+    """
+    Return the query plan of sql, cached by statement so that a query that
+    is often slow is only explained once.
+    """
+    if sql in _plans:
+        return _plans[sql]
+    if not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+    token = _explaining.set(True)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}", params)
+            plan = "\n".join(str(row[-1]) for row in cursor.fetchall())
+    except Exception as e:
+        plan = f"EXPLAIN failed: {e}"
+    finally:
+        _explaining.reset(token)
+    if len(_plans) >= EXPLAIN_CACHE_SIZE:
+        _plans.pop(next(iter(_plans)))
+    _plans[sql] = plan
+    return plan
+
+def stack_summary():
+    """
+    Return the innermost frames of the current stack that are project code.
+    """
+    base_dir = str(settings.BASE_DIR)
+    frames = [
+        (os.path.relpath(frame.filename, base_dir), frame)
+        for frame in traceback.extract_stack()
+        if frame.filename.startswith(base_dir) and 'site-packages' not in frame.filename
+    ]
+    return [
+        f"{path}:{frame.lineno} in {frame.name}"
+        for path, frame in frames if path not in IGNORED_FRAMES
+    ][-STACK_DEPTH:]
+
+class SlowQueryLogger:
+    def __init__(self, origin, threshold):
+        self.origin = origin
+        self.threshold = threshold
+
+    def __call__(self, execute, sql, params, many, context):
+        if _explaining.get():
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = time.perf_counter() - start
+        if duration >= self.threshold:
+            connection = context['connection']
+            logger.warning(json.dumps({
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'origin': self.origin() if callable(self.origin) else self.origin,
+                'database': connection.alias,
+                'duration_ms': round(duration * 1000, 2),
+                'sql': sql,
+                'many': many,
+                'plan': None if many else explain(connection, sql, params),
+                'stack': stack_summary(),
+            }))
+        return result
+
+def enabled():
+    return getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', None) is not None
+
+@contextmanager
+def log_slow_queries(origin):
+    """
+    Log slow queries run inside the block, if the slow query log is enabled
+    and this block is sampled. origin names the view or job, and may be a
+    callable evaluated when a query is logged.
+    """
+    if not enabled() or random.random() >= getattr(settings, 'SLOW_QUERY_SAMPLE_RATE', 1.0):
+        yield
+        return
+    wrapper = SlowQueryLogger(origin, settings.SLOW_QUERY_THRESHOLD_MS / 1000)
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(wrapper))
+        yield
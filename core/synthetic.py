@@ -0,0 +1,133 @@
+"""
+Generation of synthetic datasets for benchmarks.
+
+All generated rows are recognizable, so that they can be removed again
+without touching real data: countries use the ISO 3166 user-assigned
+codes XA-XZ and QM-QZ, organizations and plans are named "Synthetic ...",
+and events have ext_data_src SYNTHETIC_SOURCE. Rows are written with
+bulk inserts and without history, a chunk per transaction.
+"""
+import datetime, random, string
+from django.db import transaction
+from .history import history_buffer
+from .models import Country, Event, EventPlan, Location, Organization
+from .versions import DATASETS, bump
+
+SYNTHETIC_SOURCE = 'synthetic'
+COUNTRY_CODES = [f"X{c}" for c in string.ascii_uppercase] + [f"Q{c}" for c in "MNOPQRSTUVWXYZ"]
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'sa', 'to', 'ru', 'vi', 'an', 'berg', 'by', 'holm', 'stad', 'vik', 'ås', 'ö']
+WEEKDAYS = [choice for choice, _ in EventPlan.Weekday.choices]
+RECURRENCES = [choice for choice, _ in EventPlan.Recurrence.choices if choice != EventPlan.Recurrence.IRREGULAR]
+
+def place_name(rng, used):
+    while True:
+        name = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if name not in used:
+            used.add(name)
+            return name
+
+def generate_countries(count):
+    if count > len(COUNTRY_CODES):
+        raise ValueError(f"At most {len(COUNTRY_CODES)} synthetic countries are possible")
+    countries = [Country(code=code, name=f"synthland {code.lower()}") for code in COUNTRY_CODES[:count]]
+    Country.objects.bulk_create(countries, ignore_conflicts=True)
+    return list(Country.objects.filter(code__in=COUNTRY_CODES[:count]))
+
+def generate_locations(rng, countries, branching, depth):
+    """
+    Create a location tree of the given depth and branching in every
+    country, e.g. regions, municipalities and towns. Returns the leaves.
+    """
+    leaves = []
+    for country in countries:
+        used = set()
+        parents = [None]
+        for level in range(depth):
+            children = [
+                Location(
+                    name=place_name(rng, used),
+                    in_country=country,
+                    in_location=parent,
+                    lat=rng.uniform(-60, 70),
+                    lon=rng.uniform(-180, 180),
+                )
+                for parent in parents for _ in range(branching)
+            ]
+            with transaction.atomic():
+                parents = Location.objects.bulk_create(children, batch_size=1000)
+        leaves.extend(parents)
+    return leaves
+
+def generate_organizations(count):
+    organizations = [Organization(name=f"Synthetic Organization {i}") for i in range(count)]
+    return Organization.objects.bulk_create(organizations, batch_size=1000)
+
+def generate_plans(rng, count, locations, organizations):
+    plans = []
+    for i in range(count):
+        location = rng.choice(locations)
+        start = datetime.date(2023, 1, 1) + datetime.timedelta(days=rng.randint(0, 700))
+        plans.append(EventPlan(
+            name=f"Synthetic Plan {i}",
+            time_of_day=f"{rng.randint(8, 19):02d}:00",
+            location=location,
+            country_id=location.in_country_id,
+            weekday=rng.choice(WEEKDAYS),
+            recurrence=rng.choice(RECURRENCES),
+            recur_from=start,
+            recur_until=start + datetime.timedelta(days=rng.randint(90, 1000)),
+        ))
+    with transaction.atomic():
+        plans = EventPlan.objects.bulk_create(plans, batch_size=1000)
+        Organizers = EventPlan.organizers.through
+        Organizers.objects.bulk_create([
+            Organizers(eventplan_id=plan.id, organization_id=org.id)
+            for plan in plans for org in rng.sample(organizations, rng.randint(1, 2))
+        ], batch_size=1000)
+    return plans
+
+def generate_events(rng, count, locations, organizations, plans, chunk_size=5000, progress=None):
+    """
+    Create count events spread over four years, a fifth of them belonging
+    to a plan, each with one to three organizers.
+    """
+    first_day = datetime.date.today() - datetime.timedelta(days=3 * 365)
+    Organizers = Event.organizers.through
+    for start in range(0, count, chunk_size):
+        events = []
+        for i in range(start, min(start + chunk_size, count)):
+            plan = rng.choice(plans) if plans and rng.random() < 0.2 else None
+            location = plan.location if plan else rng.choice(locations)
+            events.append(Event(
+                id=f"{SYNTHETIC_SOURCE}:{i}",
+                ext_data_src=SYNTHETIC_SOURCE,
+                plan=plan,
+                date=first_day + datetime.timedelta(days=rng.randint(0, 4 * 365)),
+                country_id=location.in_country_id,
+                location=location,
+                time_of_day=f"{rng.randint(8, 19):02d}:00",
+                cancelled=rng.random() < 0.03,
+            ))
+        with transaction.atomic():
+            Event.objects.bulk_create(events, batch_size=1000)
+            Organizers.objects.bulk_create([
+                Organizers(event_id=event.id, organization_id=org.id)
+                for event in events for org in rng.sample(organizations, rng.randint(1, 3))
+            ], batch_size=1000)
+        if progress:
+            progress(start + len(events))
+    bump(*DATASETS.values())
+
+def clear_synthetic_data():
+    """
+    Remove all synthetic rows. Returns the number of events removed.
+    """
+    from collect.purge import purge_events
+
+    removed = purge_events(Event.objects.filter(ext_data_src=SYNTHETIC_SOURCE), history=False)
+    with history_buffer():
+        EventPlan.objects.filter(name__startswith="Synthetic Plan ").delete()
+        Organization.objects.filter(name__startswith="Synthetic Organization ").delete()
+        Location.objects.filter(in_country__code__in=COUNTRY_CODES).delete()
+        Country.objects.filter(code__in=COUNTRY_CODES).delete()
+    return removed
@@ -0,0 +1,40 @@
+from django import template
+from core.pagecache import CSRF_PLACEHOLDER
+
+register = template.Library()
+
+# Context variables hidden from fragments, which are shared by all users
+PER_USER_VARIABLES = ('user', 'perms', 'request', 'messages')
+
+class FragmentNode(template.Node):
+    def __init__(self, fragment, nodelist):
+        self.fragment = fragment
+        self.nodelist = nodelist
+
+    def render(self, context):
+        fragment = self.fragment.resolve(context, ignore_failures=True)
+        if fragment is None:
+            return self.nodelist.render(context)
+        csrf_token = context.get('csrf_token')
+
+        def render():
+            hidden = dict.fromkeys(PER_USER_VARIABLES)
+            with context.push(csrf_token=CSRF_PLACEHOLDER, **hidden):
+                return self.nodelist.render(context)
+        return fragment.render(render, csrf_token)
+
+@register.tag
+def fragment(parser, token):
+    """
+    {% fragment page_fragment %}...{% endfragment %} renders its content
+    through the core.pagecache.Fragment page_fragment, so only on a cache
+    miss. The cached HTML is shared by every user, so the user, perms,
+    request and messages variables are empty inside it. Without a Fragment
+    the content is rendered as usual.
+    """
+    bits = token.split_contents()
+    if len(bits) != 2:
+        raise template.TemplateSyntaxError("'fragment' takes one argument, a Fragment")
+    nodelist = parser.parse(('endfragment',))
+    parser.delete_first_token()
+    return FragmentNode(parser.compile_filter(bits[1]), nodelist)
@@ -0,0 +1,47 @@
+"""
+Test helpers that fail when code runs more SQL queries than allowed.
+"""
+from contextlib import contextmanager
+from .metrics import count_queries, query_budget
+
+def format_statements(statements):
+    return "\n".join(f"  {i}. {sql}" for i, sql in enumerate(statements, 1))
+
+class QueryBudgetMixin:
+    """
+    Mixin for TestCase with assertions on query counts. Views are checked
+    against their QUERY_BUDGETS entry, as measured by QueryMetricsMiddleware.
+    """
+    @contextmanager
+    def assertMaxQueries(self, limit):
+        """
+        Fail if the block runs more than limit queries on any connection.
+        """
+        with count_queries(keep_statements=True) as stats:
+            yield stats
+        if stats.queries > limit:
+            self.fail(f"{stats.queries} queries run, more than {limit}:\n{format_statements(stats.statements)}")
+
+    def assertWithinQueryBudget(self, response, budget=None, statements=None):
+        """
+        Fail if the request of a test client response ran more queries
+        than budget, by default the budget of its view. The statements, if
+        given, are listed in the failure message.
+        """
+        metrics = response.wsgi_request.query_metrics
+        if budget is None:
+            budget = query_budget(metrics['view'])
+        if metrics['queries'] > budget:
+            self.fail(
+                f"{metrics['view']} ran {metrics['queries']} queries, over its budget of {budget}"
+                + (f":\n{format_statements(statements)}" if statements else "")
+            )
+
+    def get_within_budget(self, url, budget=None, **kwargs):
+        """
+        GET url with the test client, check its query budget and return the response.
+        """
+        with count_queries(keep_statements=True) as stats:
+            response = self.client.get(url, **kwargs)
+        self.assertWithinQueryBudget(response, budget, stats.statements)
+        return response
@@ -1,3 +1,499 @@
-from django.test import TestCase
+import datetime, io, json, os, random, re, tempfile
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Value
+from django.db.models.functions import Lower
+from django.template import RequestContext, Template
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import reverse
+from collect.models import LocationImportMapping, Source
+from . import autocomplete, benchmarks, metrics, profiling, slowlog, synthetic
+from .pagecache import CSRF_PLACEHOLDER, bypass_caches, page_fragment
+from .history import bulk_insert_new_with_history, history_buffer
+from .retention import compact_history
+from .versions import deferred_bumps, get_versions
+from .models import Country, Event, EventPlan, Job, Location, Organization
+from .testing import QueryBudgetMixin
 
-# Create your tests here.
+def query_plan(sql, params=()):
+    """
+    Return the EXPLAIN QUERY PLAN of a SQLite query as one string.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return "\n".join(row[-1] for row in cursor.fetchall())
+
+# A replica connection would not see the uncommitted test data, and index
+# usage does not depend on which connection runs the query
+@override_settings(DATABASE_ROUTERS=[])
+class IndexUsageTests(TestCase):
+    """
+    The event list views and the location lookups of the collectors must
+    be served by the indexes of core and collect, not by table scans.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('indexer', password='x')
+        cls.sweden = Country.objects.create(code='SE', name='Sweden')
+        norway = Country.objects.create(code='NO', name='Norway')
+        cls.location = Location.objects.create(name='Lund', in_country=cls.sweden, lat=0, lon=0)
+        cls.plan = EventPlan.objects.create(name='Fridays', country=cls.sweden, location=cls.location)
+        day = datetime.date(2024, 1, 1)
+        Event.objects.bulk_create([
+            Event(
+                id=f'e{i}',
+                date=day + datetime.timedelta(days=i),
+                country=cls.sweden if i % 2 else norway,
+                location=cls.location if i % 3 == 0 else None,
+                plan=cls.plan if i % 5 == 0 else None,
+                ext_data_src='test' if i % 7 == 0 else None,
+            )
+            for i in range(300)
+        ])
+        cls.source = Source.objects.create(id='test', url='http://example.com', plugin='feed', settings={})
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def event_query_plans(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [
+            query_plan(query['sql'])
+            for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and 'FROM "core_event"' in query['sql']
+            and 'COUNT(' not in query['sql']
+        ]
+
+    def assertUsesIndex(self, plan, index):
+        self.assertIn(index, plan)
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_event_list(self):
+        plans = self.event_query_plans(reverse('event_list'))
+        self.assertTrue(plans)
+        for plan in plans:
+            self.assertUsesIndex(plan, 'event_date_idx')
+
+    def test_event_list_by_country(self):
+        plans = self.event_query_plans(reverse('event_list') + '?country=SE')
+        self.assertTrue(plans)
+        for plan in plans:
+            self.assertUsesIndex(plan, 'event_country_date_idx')
+
+    def test_country_events(self):
+        plans = self.event_query_plans(reverse('country_events', args=['SE']))
+        self.assertTrue(plans)
+        for plan in plans:
+            self.assertUsesIndex(plan, 'event_country_date_idx')
+
+    def test_location_events(self):
+        plans = self.event_query_plans(reverse('location_events', args=[self.location.id]))
+        self.assertTrue(plans)
+        for plan in plans:
+            self.assertUsesIndex(plan, 'event_location_date_idx')
+
+    def test_plan_date_lookup(self):
+        events = Event.objects.filter(plan=self.plan, date=datetime.date(2024, 1, 6), cancelled=True)
+        self.assertIn('event_plan_date_idx', events.explain())
+
+    def test_source_events(self):
+        self.assertIn('event_source_idx', Event.objects.filter(ext_data_src='test').explain())
+
+    def test_location_name_lookup(self):
+        locations = Location.objects.filter(name='lund', in_country=self.sweden)
+        self.assertIn('location_country_name_idx', locations.explain())
+
+    def test_mapping_lower_name_lookup(self):
+        mappings = LocationImportMapping.objects.alias(lower_name=Lower('imported_name')).filter(
+            source=self.source, lower_name=Lower(Value('LUND')),
+        )
+        self.assertIn('mapping_source_lname_idx', mappings.explain())
+
+class QueryMetricsTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('metrics', password='x')
+        sweden = Country.objects.create(code='SE', name='Sweden')
+        organizers = Organization.objects.bulk_create([Organization(name=f'Org {i}') for i in range(3)])
+        for i in range(20):
+            event = Event.objects.create(id=f'm{i}', date=datetime.date(2024, 1, 1), country=sweden)
+            event.organizers.set(organizers)
+
+    def setUp(self):
+        metrics.reset()
+        self.client.force_login(self.user)
+
+    def test_event_list_within_budget(self):
+        response = self.get_within_budget(reverse('event_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.wsgi_request.query_metrics['view'], 'event_list')
+
+    def test_over_budget_fails(self):
+        response = self.client.get(reverse('event_list'))
+        with self.assertRaises(AssertionError):
+            self.assertWithinQueryBudget(response, budget=1)
+        with self.assertRaises(AssertionError), self.assertMaxQueries(1):
+            list(Event.objects.all())
+            list(Organization.objects.all())
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('event_list'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('zenchanger_requests_total{view="event_list"} 1', response.content.decode())
+        self.assertIn('zenchanger_request_duration_seconds_count{view="event_list"} 1', response.content.decode())
+
+    def test_metrics_endpoint_is_local(self):
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.1.2.3')
+        self.assertEqual(response.status_code, 403)
+        # Proxied requests come from the proxy's local address
+        response = self.client.get(reverse('metrics'), HTTP_X_FORWARDED_FOR='10.1.2.3')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_endpoint_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret', REMOTE_ADDR='10.1.2.3')
+        self.assertEqual(response.status_code, 200)
+
+    def test_request_metrics_keep_no_sql(self):
+        response = self.client.get(reverse('event_list'))
+        self.assertGreater(response.wsgi_request.query_metrics['queries'], 0)
+        self.assertNotIn('statements', response.wsgi_request.query_metrics)
+
+class HistoryBufferTests(TestCase):
+    def test_rows_are_written_when_the_block_ends(self):
+        with history_buffer():
+            for i in range(3):
+                Organization.objects.create(name=f'org {i}')
+            self.assertFalse(Organization.history.exists())
+        self.assertEqual(Organization.history.filter(history_type='+').count(), 3)
+
+    def test_error_discards_the_buffer(self):
+        with self.assertRaises(ValueError), history_buffer():
+            Organization.objects.create(name='org')
+            raise ValueError
+        self.assertFalse(Organization.objects.exists())
+        self.assertFalse(Organization.history.exists())
+
+    def test_rolled_back_savepoint_leaves_no_history(self):
+        with history_buffer():
+            Organization.objects.create(name='kept')
+            with self.assertRaises(ValueError), transaction.atomic():
+                Organization.objects.create(name='rolled back')
+                raise ValueError
+        self.assertEqual(list(Organization.history.values_list('name', flat=True)), ['kept'])
+
+    def test_only_inserted_rows_get_history(self):
+        source = Source.objects.create(id='test', url='https://example.com/', settings={}, plugin='feed')
+        LocationImportMapping.objects.create(source=source, imported_name='Lund')
+        mappings = [LocationImportMapping(source=source, imported_name=name) for name in ('Lund', 'Malmo', 'Malmo')]
+        with transaction.atomic():
+            inserted = bulk_insert_new_with_history(mappings, LocationImportMapping, ['source_id', 'imported_name'])
+        self.assertEqual([mapping.imported_name for mapping in inserted], ['Malmo'])
+        self.assertEqual(sorted(LocationImportMapping.history.values_list('imported_name', flat=True)), ['Lund', 'Malmo'])
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(name='v0')
+        for name in ('v1', 'v1', 'v2', 'v3'):
+            self.org.name = name
+            self.org.save()
+        # Every version but the newest is past a 30 day retention
+        old = timezone.now() - datetime.timedelta(days=60)
+        Organization.history.exclude(name='v3').update(history_date=old)
+
+    def compact(self, policy, **kwargs):
+        return compact_history(Organization, Organization.history.model, policy, chunk_size=1, **kwargs)
+
+    def names(self):
+        return list(Organization.history.order_by('history_date', 'history_id').values_list('name', flat=True))
+
+    def test_noop_changes_are_squashed(self):
+        self.assertEqual(self.compact({}), {'objects': 1, 'squashed': 1, 'expired': 0})
+        self.assertEqual(self.names(), ['v0', 'v1', 'v2', 'v3'])
+
+    def test_rows_past_the_cutoff_are_archived(self):
+        archive = io.StringIO()
+        self.assertEqual(self.compact({'days': 30, 'versions': 2}, archive=archive)['expired'], 2)
+        self.assertEqual(self.names(), ['v2', 'v3'])
+        self.assertEqual([json.loads(line)['name'] for line in archive.getvalue().splitlines()], ['v0', 'v1'])
+
+    def test_latest_row_is_kept(self):
+        Organization.history.update(history_date=timezone.now() - datetime.timedelta(days=60))
+        other = Organization.objects.create(name='other')
+        self.compact({'days': 30})
+        self.assertEqual(self.names(), ['v3', 'other'])
+
+        # Once the object is deleted, its history expires entirely
+        Organization.objects.filter(pk=self.org.pk).delete()
+        Organization.history.filter(history_type='-').update(history_date=timezone.now() - datetime.timedelta(days=60))
+        self.compact({'days': 30})
+        self.assertEqual(self.names(), ['other'])
+
+    def test_dry_run_deletes_nothing(self):
+        stats = self.compact({'days': 30}, dry_run=True)
+        self.assertEqual((stats['squashed'], stats['expired']), (1, 3))
+        self.assertEqual(len(self.names()), 5)
+
+class LocationNameTests(TestCase):
+    def test_bulk_writes_lowercase_names(self):
+        sweden = Country.objects.create(code='SE', name='Sweden')
+        location, = Location.objects.bulk_create([Location(name='Malmö', in_country=sweden, lat=0, lon=0)])
+        self.assertTrue(Location.objects.filter(name='malmö', in_country=sweden).exists())
+        location.name = 'Lund'
+        Location.objects.bulk_update([location], ['name'])
+        self.assertEqual(Location.objects.get().name, 'lund')
+
+class ProfileMiddlewareTests(TestCase):
+    def setUp(self):
+        profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(profile_dir.cleanup)
+        self.enterContext(override_settings(PROFILING_ENABLED=True, PROFILE_DIR=profile_dir.name))
+        staff = User.objects.create_user('staff', password='x', is_staff=True)
+        self.client.force_login(staff)
+
+    def test_only_safe_methods_are_profiled(self):
+        url = f"{reverse('event_list')}?_profile=1"
+        self.assertEqual(self.client.get(url)['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertNotEqual(self.client.post(url)['Content-Type'], 'text/plain; charset=utf-8')
+
+    def test_profiled_requests_bypass_the_caches(self):
+        def profiled_queries():
+            report = self.client.get(f"{reverse('event_list')}?_profile=1").content.decode()
+            return int(re.search(r"(\d+) queries", report).group(1))
+        cache.clear()
+        cold = profiled_queries()
+        self.client.get(reverse('event_list'))
+        self.assertEqual(profiled_queries(), cold)
+
+    def test_profiles_are_not_overwritten(self):
+        profiled = profiling.profile_call(lambda: None)
+        with mock.patch('core.profiling.timezone.now', return_value=timezone.now()):
+            first = profiling.save_profile(profiled, 'test')
+            second = profiling.save_profile(profiled, 'test')
+        self.assertTrue(set(first).isdisjoint(second))
+
+class DataVersionTests(TestCase):
+    def test_deferred_bumps_bump_once(self):
+        with deferred_bumps():
+            for i in range(3):
+                Organization.objects.create(name=f'org {i}')
+            self.assertEqual(get_versions('organizations')['organizations'][0], 0)
+        self.assertEqual(get_versions('organizations')['organizations'][0], 1)
+
+class PageCacheTests(TestCase):
+    def test_fragments_hide_the_user(self):
+        template = Template("{% load pagecache %}{% fragment fragment %}[{{ user.username }}]{% csrf_token %}{% endfragment %}")
+        request = RequestFactory().get('/')
+        request.user = User.objects.create_user('alice', password='x')
+        fragment = page_fragment(request, 'test', ['events'])
+        html = template.render(RequestContext(request, {'fragment': fragment}))
+        self.assertIn('[]', html)
+        self.assertNotIn(CSRF_PLACEHOLDER, html)
+        self.assertTrue(page_fragment(request, 'test', ['events']).cached)
+        with bypass_caches():
+            self.assertFalse(page_fragment(request, 'test', ['events']).cached)
+
+class JobStatusTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='x')
+        cls.job = Job.objects.create(kind='geocode.lookup', run_after=timezone.now(), created_by=cls.owner,
+                                     status=Job.Status.DONE, result={'status': 'ok'})
+
+    def test_only_the_owner_and_staff_see_a_job(self):
+        url = reverse('job_status', args=[self.job.id])
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get(url).json()['result'], {'status': 'ok'})
+        self.client.force_login(User.objects.create_user('other', password='x'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_login(User.objects.create_user('staff', password='x', is_staff=True))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_location_lookup_ignores_invalid_job_ids(self):
+        sweden = Country.objects.create(code='SE', name='Sweden')
+        location = Location.objects.create(name='Lund', in_country=sweden, lat=0, lon=0)
+        url = reverse('location_detail', args=[location.id])
+        self.assertEqual(self.client.get(url, {'lookup': 'abc'}).status_code, 200)
+        # Another user's lookup is not shown
+        response = self.client.get(url, {'lookup': self.job.id})
+        self.assertIsNone(response.context['google_result'])
+
+class SlowQueryLogTests(TestCase):
+    def setUp(self):
+        self.enterContext(mock.patch.dict(slowlog._plans, clear=True))
+
+    def logged(self, threshold_ms, sample_rate=1.0, random=0.5):
+        """
+        Run a query in a log_slow_queries() block and return the entries logged.
+        """
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=threshold_ms, SLOW_QUERY_SAMPLE_RATE=sample_rate), \
+                mock.patch('core.slowlog.random.random', return_value=random), \
+                mock.patch.object(slowlog.logger, 'warning') as warning, \
+                slowlog.log_slow_queries('test origin'):
+            list(Organization.objects.filter(name='x'))
+        return [json.loads(call.args[0]) for call in warning.call_args_list]
+
+    def test_queries_over_the_threshold_are_logged_with_their_plan(self):
+        entry, = self.logged(0)
+        self.assertEqual(entry['origin'], 'test origin')
+        self.assertIn(Organization._meta.db_table, entry['sql'])
+        self.assertIn('SCAN', entry['plan'])
+        self.assertIn('core/tests.py', entry['stack'][-1])
+
+    def test_fast_queries_are_not_logged(self):
+        self.assertEqual(self.logged(60 * 1000), [])
+
+    def test_only_sampled_blocks_are_logged(self):
+        self.assertEqual(self.logged(0, sample_rate=0.1, random=0.5), [])
+        self.assertEqual(len(self.logged(0, sample_rate=0.1, random=0.05)), 1)
+
+    def test_explain_skips_what_it_can_not_explain(self):
+        self.assertIsNone(slowlog.explain(connection, "INSERT INTO core_country (code, name) VALUES ('XX', 'x')", ()))
+        plan = slowlog.explain(connection, "SELECT * FROM no_such_table", ())
+        self.assertTrue(plan.startswith('EXPLAIN failed'))
+
+    def test_command_summarizes_the_log(self):
+        log_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(log_dir.cleanup)
+        path = os.path.join(log_dir.name, 'slow.log')
+        entries = [
+            {'sql': 'SELECT a', 'duration_ms': 10.0, 'origin': 'view a', 'plan': 'SCAN t'},
+            {'sql': 'SELECT a', 'duration_ms': 20.0, 'origin': 'view b', 'plan': 'SCAN t'},
+            {'sql': 'SELECT b', 'duration_ms': 25.0, 'origin': 'job c', 'plan': 'SEARCH t USING INDEX i'},
+        ]
+        with open(path, 'w') as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in entries)
+            f.write("not json\n")
+        out = io.StringIO()
+        call_command('slow_queries', '--file', path, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], "2x total 30.0 ms, max 20.0 ms from view a, view b")
+        self.assertEqual(lines[3], "1x total 25.0 ms, max 25.0 ms from job c")
+        self.assertEqual(lines[-1], "2 distinct slow statements in 1 files")
+        out = io.StringIO()
+        call_command('slow_queries', '--file', path, '--scans', stdout=out)
+        self.assertNotIn('SELECT b', out.getvalue())
+
+class SyntheticDataTests(TestCase):
+    def test_generate_and_clear(self):
+        rng = random.Random(1)
+        countries = synthetic.generate_countries(2)
+        leaves = synthetic.generate_locations(rng, countries, branching=2, depth=2)
+        organizations = synthetic.generate_organizations(3)
+        plans = synthetic.generate_plans(rng, 5, leaves, organizations)
+        synthetic.generate_events(rng, 50, leaves, organizations, plans, chunk_size=20)
+        self.assertEqual(len(leaves), 8)
+        self.assertEqual(Location.objects.filter(in_country__in=countries).count(), 12)
+        self.assertEqual(Event.objects.filter(ext_data_src=synthetic.SYNTHETIC_SOURCE).count(), 50)
+        self.assertFalse(Event.objects.filter(organizers=None).exists())
+
+        self.assertEqual(synthetic.clear_synthetic_data(), 50)
+        self.assertFalse(Country.objects.filter(code__in=synthetic.COUNTRY_CODES).exists())
+        self.assertFalse(Organization.objects.exists())
+        self.assertFalse(EventPlan.objects.exists())
+
+    def test_country_codes_are_limited(self):
+        with self.assertRaises(ValueError):
+            synthetic.generate_countries(len(synthetic.COUNTRY_CODES) + 1)
+
+class BenchmarkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(1)
+        countries = synthetic.generate_countries(2)
+        leaves = synthetic.generate_locations(rng, countries, branching=3, depth=2)
+        organizations = synthetic.generate_organizations(3)
+        plans = synthetic.generate_plans(rng, 5, leaves, organizations)
+        synthetic.generate_events(rng, 100, leaves, organizations, plans)
+
+    def test_benchmarks_run_and_clean_up(self):
+        results = benchmarks.run_benchmarks(repeat=2, warmup=1)
+        self.assertEqual(list(results), benchmarks.available())
+        self.assertEqual(results['event_list']['runs'], 2)
+        self.assertFalse(User.objects.filter(username='benchmark').exists())
+        self.assertFalse(Source.objects.filter(id='benchmark-feed').exists())
+        self.assertFalse(Event.history.filter(ext_data_src='benchmark-feed').exists())
+        self.assertFalse(Source.history.filter(id='benchmark-feed').exists())
+
+    def test_warmup_does_not_fill_caches(self):
+        names = ['event_list', 'location_list', 'plan_detail']
+        cold = benchmarks.run_benchmarks(names, repeat=1, warmup=0)
+        warm = benchmarks.run_benchmarks(names, repeat=1, warmup=2)
+        for name in names:
+            self.assertEqual(warm[name]['queries'], cold[name]['queries'], name)
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        # The indexes of the process outlive the rolled back test data
+        # whose versions they were built for
+        self.enterContext(mock.patch.object(autocomplete, 'locations', autocomplete.Autocomplete(
+            ('locations', 'countries'), autocomplete.load_locations, autocomplete.count_location_events)))
+        self.enterContext(mock.patch.object(autocomplete, 'organizations', autocomplete.Autocomplete(
+            ('organizations',), autocomplete.load_organizations, autocomplete.count_organization_events)))
+        self.sweden = Country.objects.create(code='SE', name='sweden')
+
+    def names(self, query):
+        return [item['name'] for item in autocomplete.complete_locations(query)]
+
+    def test_ranking(self):
+        for name in ['Övre Berg', 'Bergby', 'Bergsjö', 'Berg', 'Stenberg']:
+            Location.objects.create(name=name, in_country=self.sweden, lat=0, lon=0)
+        for i in range(2):
+            Event.objects.create(id=f'e{i}', date=datetime.date(2024, 1, 1), country=self.sweden,
+                                 location=Location.objects.get(name='bergsjö'))
+        self.assertEqual(self.names('berg'), ['Berg', 'Bergsjö', 'Bergby', 'Övre Berg'])
+
+    def test_accents_and_case_are_folded(self):
+        Location.objects.create(name='Göteborg', in_country=self.sweden, lat=0, lon=0)
+        self.assertEqual(self.names('GOTE'), ['Göteborg'])
+        self.assertEqual(self.names('göte'), ['Göteborg'])
+        organization = Organization.objects.create(name='Zenföreningen Ängen')
+        self.assertEqual(autocomplete.complete_organizations('ANGEN'), [{'id': organization.id, 'name': 'Zenföreningen Ängen'}])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.assertEqual(self.names('lund'), [])
+        lund = Location.objects.create(name='Lund', in_country=self.sweden, lat=0, lon=0)
+        self.assertEqual(self.names('lund'), ['Lund'])
+        self.sweden.name = 'sverige'
+        self.sweden.save()
+        self.assertEqual(autocomplete.complete_locations('lund')[0]['display'], 'Lund (Sverige)')
+        lund.delete()
+        self.assertEqual(self.names('lund'), [])
+        Location.objects.create(name='Lund', in_country=self.sweden, lat=0, lon=0)
+        self.sweden.delete()
+        self.assertEqual(self.names('lund'), [])
+
+class ConditionalResponseTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('alice', password='x'))
+        self.url = reverse('event_list')
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([query for query in queries if '"core_event"' in query['sql']])
+
+    def test_data_changes_modify(self):
+        etag = self.client.get(self.url)['ETag']
+        Organization.objects.create(name='new')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etags_are_per_user(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.force_login(User.objects.create_user('bob', password='x'))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
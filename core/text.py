@@ -0,0 +1,10 @@
+import re, unicodedata
+
+def fold(text):
+    """
+    Normalize a name for matching: lower case, accents removed and
+    whitespace collapsed. "  Göteborg " and "goteborg" fold the same.
+    """
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r'\s+', ' ', text).strip().lower()
@@ -0,0 +1,124 @@
+"""
+Version stamps of datasets, for caches and conditional responses.
+
+Every dataset, e.g. 'events' or 'locations', has a DataVersion row whose
+version is bumped whenever one of its models is saved or deleted. Caches
+key their entries on the versions they depend on, so a change to the
+data makes the old entries unreachable without having to find and delete
+them. Bulk writes that bypass model signals must call bump() themselves.
+Code that saves many objects, like the collectors, runs in a
+deferred_bumps() block, so that the signals bump each dataset once at
+the end instead of once per save.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils import timezone
+from .models import Country, DataVersion, Event, EventPlan, Location, Organization
+
+DATASETS = {
+    Country: 'countries',
+    Location: 'locations',
+    Organization: 'organizations',
+    Event: 'events',
+    EventPlan: 'eventplans',
+}
+
+_deferred = ContextVar('deferred_bumps', default=None)
+
+def bump(*names):
+    """
+    Increase the version of the named datasets.
+    """
+    now = timezone.now()
+    for name in names:
+        if DataVersion.objects.filter(name=name).update(version=F('version') + 1, updated_at=now):
+            continue
+        try:
+            with transaction.atomic():
+                DataVersion.objects.create(name=name, version=1, updated_at=now)
+        except IntegrityError:
+            DataVersion.objects.filter(name=name).update(version=F('version') + 1, updated_at=now)
+
+@contextmanager
+def deferred_bumps():
+    """
+    Collect the bumps of model signals inside the block and bump every
+    changed dataset once when it ends, also when it fails, since chunks
+    may have been committed. Nested blocks share the outermost one.
+    """
+    if _deferred.get() is not None:
+        yield
+        return
+    names = set()
+    token = _deferred.set(names)
+    try:
+        yield
+    finally:
+        _deferred.reset(token)
+        bump(*sorted(names))
+
+def _signal_bump(name):
+    names = _deferred.get()
+    if names is None:
+        bump(name)
+    else:
+        names.add(name)
+
+def get_versions(*names):
+    """
+    Return {name: (version, updated_at)} for the named datasets, with one
+    query. Datasets that never changed have version 0 and no date.
+    """
+    found = {
+        name: (version, updated_at)
+        for name, version, updated_at in DataVersion.objects.filter(name__in=names).values_list('name', 'version', 'updated_at')
+    }
+    return {name: found.get(name, (0, None)) for name in names}
+
+def request_versions(request, names):
+    """
+    get_versions() remembered on the request, so that the conditional
+    response checks and the page cache of a request share one query.
+    """
+    known = request.__dict__.setdefault('_data_versions', {})
+    missing = [name for name in names if name not in known]
+    if missing:
+        known.update(get_versions(*missing))
+    return {name: known[name] for name in names}
+
+def version_key(*names, versions=None):
+    """
+    Return a string identifying the current versions of the named datasets.
+    versions may hold them already, as returned by get_versions(). The
+    dates are part of the key, as a version number can come back after a
+    rolled back transaction or a restored backup.
+    """
+    if versions is None or not versions.keys() >= set(names):
+        versions = get_versions(*names)
+    parts = []
+    for name in names:
+        version, updated_at = versions[name]
+        stamp = int(updated_at.timestamp() * 1000000) if updated_at else 0
+        parts.append(f"{name}{version}.{stamp}")
+    return "-".join(parts)
+
+def _bump_for_instance(sender, **kwargs):
+    _signal_bump(DATASETS[sender])
+
+def _bump_for_m2m(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _signal_bump(_m2m_datasets[sender])
+
+_m2m_datasets = {}
+
+def connect_signals():
+    for model, name in DATASETS.items():
+        post_save.connect(_bump_for_instance, sender=model, dispatch_uid=f'versions_save_{name}')
+        post_delete.connect(_bump_for_instance, sender=model, dispatch_uid=f'versions_delete_{name}')
+    for model in (Event, EventPlan):
+        through = model.organizers.through
+        _m2m_datasets[through] = DATASETS[model]
+        m2m_changed.connect(_bump_for_m2m, sender=through, dispatch_uid=f'versions_m2m_{DATASETS[model]}')
@@ -1,3 +1,35 @@
-from django.shortcuts import render
+import hmac
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse
+from django.shortcuts import get_object_or_404
+from . import metrics
+from .models import Job
 
-# Create your views here.
+@login_required
+def job_status(request, job_id):
+    """Report status and result of a background job queued by the user (AJAX)"""
+    job = get_object_or_404(Job, id=job_id)
+    if not job.visible_to(request.user):
+        raise Http404("Job not found")
+    return JsonResponse(job.as_dict())
+
+def metrics_allowed(request):
+    """
+    With METRICS_TOKEN set, scrapers must send it as a bearer token.
+    Otherwise only direct requests from METRICS_ALLOWED_IPS are allowed;
+    requests forwarded by a proxy are refused, since behind a proxy on the
+    same host every client has its address.
+    """
+    if settings.METRICS_TOKEN:
+        expected = f"Bearer {settings.METRICS_TOKEN}"
+        return hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', '').encode(), expected.encode())
+    if 'HTTP_X_FORWARDED_FOR' in request.META or 'HTTP_X_REAL_IP' in request.META:
+        return False
+    return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+def metrics_view(request):
+    """Request metrics in Prometheus text format, for authorized scrapers only"""
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
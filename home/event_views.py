@@ -5,20 +5,30 @@ from django.contrib import messages
 from django.core.paginator import Paginator
 from django.db.models import Q
 from django.http import JsonResponse
+from core.autocomplete import complete_locations, complete_organizations
+from core.conditional import versioned_condition
+from core.db import read_only
 from core.models import Event, Country, Location, Organization, EventPlan                
+from core.options import country_options, location_options
+from core.pagecache import cached_response, page_fragment
 from .utils import add_status_to_events
 
 import logging
 logger = logging.getLogger(__name__)
 
+# Datasets and GET parameters the cached event pages depend on
+EVENT_PAGE_DATASETS = ['events', 'eventplans', 'locations', 'countries', 'organizations']
+EVENT_LIST_FILTERS = ['country', 'location', 'date_from', 'date_to', 'search', 'page']
+
 @login_required
+@read_only
+@versioned_condition(EVENT_PAGE_DATASETS, per_user=True)
 def event_list_view(request):
     """List all events with filtering and pagination"""
     logger.info("Event list view called")
     
     try:
         events = Event.objects.select_related('country', 'location').prefetch_related('organizers').order_by('-date')
-        logger.info(f"Found {events.count()} events")
         
         # Get event plans for the new section
         event_plans = EventPlan.objects.select_related(
@@ -32,6 +42,11 @@ def event_list_view(request):
         date_to = request.GET.get('date_to')
         search = request.GET.get('search')
         
+        # Events, plans and filters are rendered only when not cached
+        fragment = page_fragment(request, 'event_list', EVENT_PAGE_DATASETS, EVENT_LIST_FILTERS)
+        if fragment.cached:
+            return render(request, 'home/event_list.html', {'fragment': fragment})
+        
         if country_filter:
             events = events.filter(country__code=country_filter)
         
@@ -51,25 +66,30 @@ def event_list_view(request):
                 Q(location__name__icontains=search)
             )
         
-        # Add status information using utility function
-        events_with_status = add_status_to_events(events)
-        
-        # Pagination on the enriched data
-        paginator = Paginator(events_with_status, 50)
+        # Paginate in the database, so that only one page of events is
+        # loaded, then add status information using utility function
+        paginator = Paginator(events, 50)
         page_number = request.GET.get('page')
         page_obj = paginator.get_page(page_number)
+        page_obj.object_list = add_status_to_events(page_obj.object_list)
         
-        # Get filter options
-        countries = Country.objects.filter(visibility=Country.Visibility.DEFAULT).order_by('name')
-        locations = Location.objects.order_by('name')
+        # Get filter options from the option cache. Too many locations for a
+        # dropdown are searched with a typeahead instead
+        countries = country_options(fragment.versions)
+        locations = location_options(versions=fragment.versions)
+        selected_location = None
+        if locations is None and location_filter:
+            selected_location = Location.objects.filter(id=location_filter).values('id', 'name').first()
         
         logger.info(f"Rendering template with {len(page_obj.object_list)} events on page")
         
         return render(request, 'home/event_list.html', {
+            'fragment': fragment,
             'page_obj': page_obj,
             'event_plans': event_plans,
             'countries': countries,
             'locations': locations,
+            'selected_location': selected_location,
             'current_filters': {
                 'country': country_filter,
                 'location': location_filter,
@@ -233,7 +253,6 @@ def event_create_view(request):
                 messages.error(request, f'Error creating event: {str(e)}')
     
     # Get form data
-    organizations = Organization.objects.order_by('name')
     time_options = generate_time_options()
     
     # Prepare default values
@@ -265,7 +284,6 @@ def event_create_view(request):
         default_expected_participants_value = ""
     
     return render(request, 'home/event_create.html', {
-        'organizations': organizations,
         'time_options': time_options,
         'today': date.today().isoformat(),
         'prefill_location': prefill_location,
@@ -280,6 +298,7 @@ def event_create_view(request):
     })
 
 @login_required
+@read_only
 def event_detail_view(request, event_id):
     """View event details"""
     event = get_object_or_404(Event, id=event_id)
@@ -368,7 +387,6 @@ def event_edit_view(request, event_id):
                 messages.error(request, f'Error updating event: {str(e)}')
     
     # Get form data
-    organizations = Organization.objects.order_by('name')
     time_options = generate_time_options()  # Add this line
     
     # Handle form field defaults (for validation errors)
@@ -379,7 +397,6 @@ def event_edit_view(request, event_id):
     
     return render(request, 'home/event_edit.html', {
         'event': event,
-        'organizations': organizations,
         'time_options': time_options,  # Add this line
         'form_defaults': form_defaults,  # Add this line
     })
@@ -407,9 +424,15 @@ def event_delete_view(request, event_id):
     return render(request, 'home/event_delete.html', {'event': event})
 
 @login_required
+@read_only
+@versioned_condition(EVENT_PAGE_DATASETS, per_user=True)
 def location_events_view(request, location_id):
     """View events in a specific location"""
-    location = get_object_or_404(Location, id=location_id)
+    location = get_object_or_404(Location.objects.select_related('in_country', 'in_location__in_location'), id=location_id)
+    
+    fragment = page_fragment(request, 'location_events', EVENT_PAGE_DATASETS, ['page'], [location.id])
+    if fragment.cached:
+        return render(request, 'home/location_events.html', {'location': location, 'fragment': fragment})
     
     events = Event.objects.filter(location=location).select_related('country').prefetch_related('organizers').order_by('-date')
     
@@ -418,15 +441,14 @@ def location_events_view(request, location_id):
         location=location
     ).select_related('location', 'country').prefetch_related('organizers').order_by('name')
     
-    # Add status information using utility function
-    events_with_status = add_status_to_events(events)
-    
-    # Pagination
-    paginator = Paginator(events_with_status, 50)
+    # Pagination, then add status information using utility function
+    paginator = Paginator(events, 50)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    page_obj.object_list = add_status_to_events(page_obj.object_list)
     
     return render(request, 'home/location_events.html', {
+        'fragment': fragment,
         'location': location,
         'page_obj': page_obj,
         'event_plans': event_plans,
@@ -435,27 +457,35 @@ def location_events_view(request, location_id):
 # Add this view if it doesn't exist
 
 @login_required
+@read_only
+@versioned_condition(EVENT_PAGE_DATASETS, per_user=True)
 def country_events_view(request, country_code):
     """View events in a specific country"""
     country = get_object_or_404(Country, code=country_code)
     
-    events = Event.objects.filter(country=country).select_related('country', 'location').prefetch_related('organizers').order_by('-date')
+    fragment = page_fragment(request, 'country_events', EVENT_PAGE_DATASETS, ['page'], [country.code])
+    if fragment.cached:
+        return render(request, 'home/country_events.html', {'country': country, 'fragment': fragment})
     
-    # Add status information using utility function
-    events_with_status = add_status_to_events(events)
+    events = Event.objects.filter(country=country).select_related('country', 'location').prefetch_related('organizers').order_by('-date')
     
-    # Pagination
-    paginator = Paginator(events_with_status, 50)
+    # Pagination, then add status information using utility function
+    paginator = Paginator(events, 50)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    page_obj.object_list = add_status_to_events(page_obj.object_list)
     
     return render(request, 'home/country_events.html', {
+        'fragment': fragment,
         'country': country,
         'page_obj': page_obj,
     })
 
 # AJAX helper view for getting locations by country
 @login_required
+@read_only
+@versioned_condition(['locations', 'countries'])
+@cached_response('locations_by_country', ['locations', 'countries'], ['country'])
 def get_locations_by_country(request):
     """Get locations for a specific country (AJAX)"""
     country_code = request.GET.get('country')
@@ -466,39 +496,22 @@ def get_locations_by_country(request):
     return JsonResponse({'locations': []})
 
 @login_required
+@read_only
+@versioned_condition(['locations', 'countries', 'events'])
 def search_locations(request):
+    """Ranked location typeahead (AJAX)"""
     query = request.GET.get('q', '').strip()
-    locations = Location.objects.filter(
-        name__icontains=query
-    ).select_related('in_country')[:10]
-    
-    location_data = [{
-        'id': loc.id,
-        'name': loc.name.title(),
-        'country': loc.in_country.name.title(),
-        'display': f"{loc.name.title()} ({loc.in_country.name.title()})",
-        'full_name': loc.full_name()  # Add this line
-    } for loc in locations]
-    
-    return JsonResponse({'locations': location_data})
+    return JsonResponse({'locations': complete_locations(query)})
 
 @login_required
+@read_only
 def search_organizations(request):
-    """Search organizations by name (AJAX)"""
+    """Ranked organization typeahead (AJAX)"""
     query = request.GET.get('q', '').strip()
     if len(query) < 2:
         return JsonResponse({'organizations': []})
     
-    organizations = Organization.objects.filter(
-        name__icontains=query
-    ).order_by('name')[:20]
-    
-    org_data = [{
-        'id': org.id,
-        'name': org.name
-    } for org in organizations]
-    
-    return JsonResponse({'organizations': org_data})
+    return JsonResponse({'organizations': complete_organizations(query)})
 
 @login_required
 def eventplan_create_view(request):
@@ -616,7 +629,6 @@ def eventplan_create_view(request):
                 messages.error(request, f'Error creating event plan: {str(e)}')
     
     # Get form data
-    organizations = Organization.objects.order_by('name')
     time_options = generate_time_options()
     
     # Calculate month later date
@@ -636,7 +648,6 @@ def eventplan_create_view(request):
     }
     
     return render(request, 'home/eventplan_create.html', {
-        'organizations': organizations,
         'time_options': time_options,
         'today': today.isoformat(),
         'month_later': month_later.isoformat(),
@@ -647,10 +658,15 @@ def eventplan_create_view(request):
     })
 
 @login_required
+@read_only
 def eventplan_detail_view(request, plan_id):
     """View details of a specific event plan"""
     event_plan = get_object_or_404(EventPlan, id=plan_id)
     
+    fragment = page_fragment(request, 'eventplan_detail', EVENT_PAGE_DATASETS, args=[event_plan.id])
+    if fragment.cached:
+        return render(request, 'home/eventplan_detail.html', {'event_plan': event_plan, 'fragment': fragment})
+    
     # Get upcoming dates
     upcoming_dates = event_plan.get_next_event_dates(count=10)
     
@@ -671,6 +687,7 @@ def eventplan_detail_view(request, plan_id):
         })
     
     return render(request, 'home/eventplan_detail.html', {
+        'fragment': fragment,
         'event_plan': event_plan,
         'upcoming_dates': upcoming_dates,
         'upcoming_dates_with_status': upcoming_dates_with_status,
@@ -784,11 +801,8 @@ def eventplan_edit_view(request, plan_id):
             except Exception as e:
                 messages.error(request, f'Error updating event plan: {str(e)}')
     
-    organizations = Organization.objects.order_by('name')
-    
     return render(request, 'home/eventplan_edit.html', {
         'event_plan': event_plan,
-        'organizations': organizations,
         'can_edit': can_edit,
         'weekday_choices': EventPlan.Weekday.choices,
         'recurrence_choices': EventPlan.Recurrence.choices,
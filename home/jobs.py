@@ -0,0 +1,9 @@
+from core.jobs import job_handler
+from .location_views import quick_create_location
+
+@job_handler('location.quick_create', timeout=60, priority=20)
+def location_quick_create_job(job):
+    """
+    Geocode and create a location requested from the event forms.
+    """
+    return quick_create_location(job.payload['search_query'])
@@ -4,8 +4,12 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
+from django.urls import reverse
 from collect.google_maps_api import google_maps_lookup, create_location_with_chain
+from core.autocomplete import complete_locations
 from core.models import Location, Country
+from core.text import fold
+from core.jobs import enqueue
 
 @login_required
 def location_create_view(request):
@@ -94,7 +98,7 @@ def process_location_creation(request, result_data, search_query):
         # In process_location_creation function
         if created_locations:
             final_location = Location.objects.filter(
-                name__iexact=location_chain[-1].lower(),
+                name=location_chain[-1].lower(),
                 in_country=country
             ).first()
             
@@ -132,20 +136,18 @@ def location_search_popup(request):
         return JsonResponse({'error': 'No search query provided'})
     
     # First check if location already exists
-    existing_locations = Location.objects.filter(
-        name__icontains=search_query
-    ).select_related('in_country')[:5]
+    existing_locations = complete_locations(search_query, limit=5)
     
     existing_data = [{
-        'id': loc.id,
-        'name': loc.name.title(),
-        'country': loc.in_country.name.title(),
-        'display': f"{loc.name.title()} ({loc.in_country.name.title()})",
+        'id': loc['id'],
+        'name': loc['name'],
+        'country': loc['country'],
+        'display': loc['display'],
         'exists': True
     } for loc in existing_locations]
     
     # If no exact matches, suggest creating new location
-    if not existing_locations or not any(loc.name.lower() == search_query.lower() for loc in existing_locations):
+    if not existing_locations or fold(existing_locations[0]['name']) != fold(search_query):
         existing_data.insert(0, {
             'id': 'new',
             'name': f'Create new location: {search_query}',
@@ -159,22 +161,34 @@ def location_search_popup(request):
 @login_required 
 @require_POST
 def location_quick_create(request):
-    """Quick location creation via AJAX"""
+    """Quick location creation via AJAX, the lookup runs as a background job"""
     search_query = request.POST.get('search_query', '').strip()
     
     if not search_query:
         return JsonResponse({'error': 'No search query provided'})
     
+    job = enqueue('location.quick_create', {'search_query': search_query}, user=request.user)
+    return JsonResponse({
+        'queued': True,
+        'job_id': job.id,
+        'status_url': reverse('job_status', args=[job.id]),
+    }, status=202)
+
+def quick_create_location(search_query):
+    """
+    Look up search_query with Google Maps and create the location if there
+    is a single result. Returns the data for the location_quick_create reply.
+    """
     # Perform Google Maps lookup
     lookup_result = google_maps_lookup(search_query)
     
     if lookup_result['status'] == 'error':
-        return JsonResponse({'error': lookup_result['message']})
+        return {'error': lookup_result['message']}
     
     results = lookup_result['results']
     
     if not results:
-        return JsonResponse({'error': f"No results found for '{search_query}'"})
+        return {'error': f"No results found for '{search_query}'"}
     
     if len(results) == 1:
         # Single result - create immediately
@@ -189,13 +203,13 @@ def location_quick_create(request):
                     break
             
             if not country_code:
-                return JsonResponse({'error': 'Could not determine country from location data'})
+                return {'error': 'Could not determine country from location data'}
             
             # Check if country exists
             try:
                 country = Country.objects.get(code=country_code)
             except Country.DoesNotExist:
-                return JsonResponse({'error': f'Country "{country_code.upper()}" is not in our database'})
+                return {'error': f'Country "{country_code.upper()}" is not in our database'}
             
             # Create location
             location_chain = result_data.get('location_chain', [search_query])
@@ -208,11 +222,11 @@ def location_quick_create(request):
             
             # Find the created location
             final_location = Location.objects.filter(
-                name__iexact=location_chain[-1].lower(),
+                name=location_chain[-1].lower(),
                 in_country=country
             ).first()
             
-            return JsonResponse({
+            return {
                 'success': True,
                 'location': {
                     'id': final_location.id,
@@ -221,15 +235,15 @@ def location_quick_create(request):
                     'display': f"{final_location.name.title()} ({country.name.title()})",
                     'full_name': final_location.full_name()  # Add this
                 }
-            })
+            }
             
         except Exception as e:
-            return JsonResponse({'error': f'Error creating location: {str(e)}'})
+            return {'error': f'Error creating location: {str(e)}'}
     
     else:
         # Multiple results - return them for user to choose
-        return JsonResponse({
+        return {
             'multiple_results': True,
             'results': results,
             'search_query': search_query
-        })
\ No newline at end of file
+        }
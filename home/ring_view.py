@@ -2,6 +2,7 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
+from django.db.models import Count, Prefetch
 from django.http import JsonResponse
 from ring.models import Ring, RingKey, UserKey
 
@@ -46,20 +47,19 @@ def ring_view(request):
         else:
             messages.error(request, 'Ring name and encrypted key cannot be empty')
 
-    # Get rings where user is a member
-    user_ring_keys = RingKey.objects.filter(user=request.user).select_related('ring')
+    # Get rings where user is a member, with member counts and members
+    # loaded by one query each
+    rings = Ring.objects.annotate(member_count=Count('ringkey')).filter(
+        ringkey__user=request.user
+    ).prefetch_related(
+        Prefetch('ringkey_set', queryset=RingKey.objects.select_related('user').order_by('user__username'), to_attr='member_keys')
+    ).order_by('name')
     
-    ring_data = []
-    for ring_key in user_ring_keys:
-        ring = ring_key.ring
-        # Get all members of this ring
-        members = User.objects.filter(ringkey__ring=ring).distinct()
-        
-        ring_data.append({
-            'ring': ring,
-            'members': members,
-            'member_count': members.count()
-        })
+    ring_data = [{
+        'ring': ring,
+        'members': [ring_key.user for ring_key in ring.member_keys],
+        'member_count': ring.member_count
+    } for ring in rings]
     
     return render(request, 'home/ring_view.html', {
         'ring_data': ring_data
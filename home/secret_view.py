@@ -1,11 +1,22 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse, Http404
 from django.views.decorators.csrf import csrf_exempt
-import json
+from django.views.decorators.http import require_GET, require_POST
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+import datetime, json, re
+from ring import blobs
 from ring.models import Ring, RingKey, Secret
 
+SECRETS_PER_PAGE = 50
+SYNC_BATCH_SIZE = 500
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+
 @login_required
 def secret_view(request):
     # Handle POST request for adding new secret
@@ -21,7 +32,7 @@ def secret_view(request):
                 if RingKey.objects.filter(ring=ring, user=request.user).exists():
                     Secret.objects.create(
                         ring=ring,
-                        content=encrypted_content
+                        **blobs.store(encrypted_content)
                     )
                     messages.success(request, f'Secret added to {ring.name}!')
                 else:
@@ -34,20 +45,138 @@ def secret_view(request):
             
         return redirect('secret_view')
     
-    # Get all secrets
-    all_secrets = Secret.objects.select_related('ring').order_by('-created_at')
+    # Get secrets of the rings the user is a member of, newest first, one
+    # page at a time. The cursor is the id of the last secret shown. Large
+    # contents are in the chunk store, the page loads them by URL
+    secrets = Secret.objects.filter(ring__ringkey__user=request.user).select_related('ring').order_by('-id')
+    before = request.GET.get('before')
+    if before and before.isdigit():
+        secrets = secrets.filter(id__lt=int(before))
+    secrets = list(secrets[:SECRETS_PER_PAGE + 1])
+    next_cursor = secrets[SECRETS_PER_PAGE - 1].id if len(secrets) > SECRETS_PER_PAGE else None
+    secrets = secrets[:SECRETS_PER_PAGE]
     
     # Get rings where user is a member
-    user_rings = Ring.objects.filter(ringkey__user=request.user).distinct()
+    user_rings = Ring.objects.filter(ringkey__user=request.user).order_by('name')
     
     # Get user's ring keys for decryption
-    user_ring_keys = {
-        rk.ring.id: rk.encrypted_key 
-        for rk in RingKey.objects.filter(user=request.user).select_related('ring')
-    }
+    user_ring_keys = dict(RingKey.objects.filter(user=request.user).values_list('ring_id', 'encrypted_key'))
     
     return render(request, 'home/secret_view.html', {
-        'all_secrets': all_secrets,
+        'secrets': secrets,
+        'next_cursor': next_cursor,
+        'is_first_page': not before,
         'user_rings': user_rings,
         'user_ring_keys': user_ring_keys
     })
+
+@login_required
+def secret_sync_view(request):
+    """
+    Secrets of the user's rings changed since a watermark (AJAX), oldest
+    change first, for clients that keep decrypted secrets locally. Pass
+    the returned next values as since and after_id to get the following
+    batch; more is false once the client is up to date. rings lists the
+    user's rings, so that clients can drop secrets of rings they left.
+    Large contents are not included, download them from their content_url.
+    """
+    since = request.GET.get('since')
+    after_id = request.GET.get('after_id', '0')
+    secrets = Secret.objects.filter(ring__ringkey__user=request.user).order_by('updated_at', 'id')
+    if since:
+        since = parse_datetime(since)
+        if since is None or not after_id.isdigit():
+            return JsonResponse({'error': 'since must be an ISO 8601 date and after_id a secret id'}, status=400)
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since, datetime.timezone.utc)
+        secrets = secrets.filter(Q(updated_at__gt=since) | Q(updated_at=since, id__gt=int(after_id)))
+    secrets = list(secrets[:SYNC_BATCH_SIZE + 1])
+    more = len(secrets) > SYNC_BATCH_SIZE
+    secrets = secrets[:SYNC_BATCH_SIZE]
+    
+    if secrets:
+        watermark = {'since': secrets[-1].updated_at.isoformat(), 'after_id': secrets[-1].id}
+    else:
+        watermark = {'since': since.isoformat() if since else None, 'after_id': int(after_id) if since else 0}
+    return JsonResponse({
+        'secrets': [{
+            'id': secret.id,
+            'ring_id': secret.ring_id,
+            'content': None if secret.chunks else secret.content,
+            'content_url': reverse('secret_content', args=[secret.id]) if secret.chunks else None,
+            'size': blobs.size_of(secret),
+            'created_at': secret.created_at.isoformat(),
+            'updated_at': secret.updated_at.isoformat(),
+        } for secret in secrets],
+        'rings': list(RingKey.objects.filter(user=request.user).values_list('ring_id', flat=True)),
+        'next': watermark,
+        'more': more,
+    })
+
+def _byte_range(request, size, etag):
+    """
+    Return the (start, end) byte range asked for by the Range header, end
+    excluded, None for the whole content or False when unsatisfiable.
+    Only single ranges are served, others get the whole content.
+    """
+    match = RANGE_HEADER.match(request.headers.get('Range', ''))
+    if not match or not any(match.groups()):
+        return None
+    if request.headers.get('If-Range', etag) != etag:
+        return None
+    first, last = match.groups()
+    if not first:
+        start, end = max(size - int(last), 0), size
+    else:
+        start, end = int(first), min(int(last) + 1, size) if last else size
+    if start >= size or start >= end:
+        return False
+    return start, end
+
+@login_required
+@require_GET
+def secret_content_view(request, secret_id):
+    """
+    Stream the encrypted content of a secret of one of the user's rings,
+    with support for Range requests, e.g. to resume a download.
+    """
+    secret = get_object_or_404(Secret.objects.filter(ring__ringkey__user=request.user), id=secret_id)
+    size = blobs.size_of(secret)
+    etag = f'"{secret.id}-{secret.updated_at.timestamp()}"'
+    byte_range = _byte_range(request, size, etag)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    start, end = byte_range or (0, size)
+    response = StreamingHttpResponse(blobs.read(secret, start, end), content_type='text/plain; charset=us-ascii')
+    if byte_range:
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+    response['Content-Length'] = end - start
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    return response
+
+@login_required
+@require_POST
+def secret_upload_view(request):
+    """
+    Add a secret with the encrypted content sent as the raw request body
+    (AJAX), ?ring_id=1. For large contents, which are stored in the chunk
+    store as they are read.
+    """
+    ring_id = request.GET.get('ring_id', '')
+    if not ring_id.isdigit() or not RingKey.objects.filter(ring_id=ring_id, user=request.user).exists():
+        raise Http404("Ring not found")
+    try:
+        fields = blobs.store_stream(request)
+    except blobs.ContentTooLarge as e:
+        return JsonResponse({'error': str(e)}, status=413)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if not fields['size']:
+        return JsonResponse({'error': 'Content required'}, status=400)
+    secret = Secret.objects.create(ring_id=int(ring_id), **fields)
+    return JsonResponse({'id': secret.id, 'size': secret.size})
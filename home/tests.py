@@ -1,3 +1,105 @@
+from unittest import mock
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from core.testing import QueryBudgetMixin
+from ring.models import Ring, RingKey, Secret
 
-# Create your tests here.
+class RingViewQueryTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x')
+        cls.members = [User.objects.create_user(f'member{i}', password='x') for i in range(5)]
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_rings(self, count):
+        start = Ring.objects.count()
+        rings = Ring.objects.bulk_create([Ring(name=f'ring {i}') for i in range(start, start + count)])
+        RingKey.objects.bulk_create([
+            RingKey(ring=ring, user=user, encrypted_key='key')
+            for ring in rings for user in [self.admin] + self.members
+        ])
+
+    def page_queries(self, url):
+        response = self.get_within_budget(url)
+        self.assertEqual(response.status_code, 200)
+        return response.wsgi_request.query_metrics['queries']
+
+    def test_ring_view_queries_do_not_grow_with_rings(self):
+        self.add_rings(1)
+        queries = self.page_queries(reverse('ring_view'))
+        self.add_rings(49)
+        self.assertEqual(self.page_queries(reverse('ring_view')), queries)
+
+    def test_ring_view_counts_members(self):
+        self.add_rings(2)
+        response = self.client.get(reverse('ring_view'))
+        self.assertEqual([item['member_count'] for item in response.context['ring_data']], [6, 6])
+        self.assertEqual(len(response.context['ring_data'][0]['members']), 6)
+
+    def test_home_queries_do_not_grow_with_rings(self):
+        self.add_rings(1)
+        queries = self.page_queries(reverse('home'))
+        self.add_rings(49)
+        self.assertEqual(self.page_queries(reverse('home')), queries)
+
+class SecretViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create_user('member', password='x')
+        cls.outsider = User.objects.create_user('outsider', password='x')
+        cls.ring = Ring.objects.create(name='ring')
+        cls.other_ring = Ring.objects.create(name='other ring')
+        RingKey.objects.create(ring=cls.ring, user=cls.member, encrypted_key='key')
+        RingKey.objects.create(ring=cls.other_ring, user=cls.outsider, encrypted_key='key')
+        Secret.objects.bulk_create([Secret(ring=cls.ring, content=f'secret {i}', size=8) for i in range(5)])
+        Secret.objects.bulk_create([Secret(ring=cls.other_ring, content='other', size=5) for i in range(3)])
+        # Written in one transaction, so several secrets share a timestamp
+        Secret.objects.update(updated_at=timezone.now())
+        cls.ring_ids = sorted(Secret.objects.filter(ring=cls.ring).values_list('id', flat=True))
+
+    def setUp(self):
+        self.client.force_login(self.member)
+
+    def sync(self, **params):
+        return self.client.get(reverse('secret_sync'), params)
+
+    def test_non_members_see_no_secrets(self):
+        self.client.force_login(self.outsider)
+        response = self.client.get(reverse('secret_view'))
+        self.assertEqual({secret.ring_id for secret in response.context['secrets']}, {self.other_ring.id})
+        self.assertEqual({secret['ring_id'] for secret in self.sync().json()['secrets']}, {self.other_ring.id})
+        self.assertEqual(self.sync().json()['rings'], [self.other_ring.id])
+        response = self.client.get(reverse('secret_content', args=[self.ring_ids[0]]))
+        self.assertEqual(response.status_code, 404)
+
+    @mock.patch('home.secret_view.SECRETS_PER_PAGE', 2)
+    def test_before_cursor_pages_back(self):
+        seen, before = [], None
+        for _ in range(3):
+            response = self.client.get(reverse('secret_view'), {'before': before} if before else {})
+            seen.extend(secret.id for secret in response.context['secrets'])
+            before = response.context['next_cursor']
+        self.assertIsNone(before)
+        self.assertEqual(seen, self.ring_ids[::-1])
+
+    @mock.patch('home.secret_view.SYNC_BATCH_SIZE', 2)
+    def test_sync_batches_split_equal_timestamps(self):
+        seen, params = [], {}
+        while True:
+            data = self.sync(**params).json()
+            seen.extend(secret['id'] for secret in data['secrets'])
+            params = data['next']
+            if not data['more']:
+                break
+        self.assertEqual(seen, self.ring_ids)
+        # Up to date: the watermark stays where it is
+        data = self.sync(**params).json()
+        self.assertEqual((data['secrets'], data['more'], data['next']['after_id']), ([], False, self.ring_ids[-1]))
+
+    def test_sync_rejects_invalid_watermarks(self):
+        self.assertEqual(self.sync(since='yesterday').status_code, 400)
+        self.assertEqual(self.sync(since='2024-01-01T00:00:00', after_id='x').status_code, 400)
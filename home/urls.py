@@ -4,7 +4,7 @@ from .setup_view import setup_db
 from .home_view import home_view
 from .register_view import register_view
 from .ring_view import ring_view, ring_add_user_view
-from .secret_view import secret_view
+from .secret_view import secret_view, secret_sync_view, secret_content_view, secret_upload_view
 from .event_views import (
     event_list_view, event_create_view, event_detail_view, 
     event_edit_view, event_delete_view, location_events_view,
@@ -13,6 +13,7 @@ from .event_views import (
     cancel_event_view, uncancel_event_view, country_events_view
 )
 from .location_views import location_create_view, location_search_popup, location_quick_create
+from core.views import job_status
 
 urlpatterns = [
     path('login/', CustomLoginView.as_view(), name='login'),
@@ -23,6 +24,9 @@ urlpatterns = [
     path('rings/', ring_view, name='ring_view'),
     path('rings/<int:ring_id>/add/', ring_add_user_view, name='ring_add_user_view'),
     path('secrets/', secret_view, name='secret_view'),
+    path('secrets/sync/', secret_sync_view, name='secret_sync'),
+    path('secrets/upload/', secret_upload_view, name='secret_upload'),
+    path('secrets/<int:secret_id>/content/', secret_content_view, name='secret_content'),
     
     # Event URLs
     path('events/', event_list_view, name='event_list'),
@@ -42,6 +46,7 @@ urlpatterns = [
     path('api/search-locations/', search_locations, name='search_locations'),
     path('api/search-organizations/', search_organizations, name='search_organizations'),
     path('api/location-search-popup/', location_search_popup, name='location_search_popup'),
+    path('api/jobs/<int:job_id>/', job_status, name='job_status'),
 
     # Event Plan URLs
     path('eventplans/create/', eventplan_create_view, name='eventplan_create'),
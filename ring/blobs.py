@@ -0,0 +1,149 @@
+"""
+Chunk store for large secret contents.
+
+Contents longer than SECRET_INLINE_MAX bytes are not kept in the
+database: they are cut into CHUNK_SIZE byte chunks, each compressed with
+zlib and stored in a file of SECRET_BLOB_DIR named after the SHA-256 of
+the chunk, and the Secret keeps the list of chunk hashes. Identical
+chunks are stored once. Contents are base64 text, which compresses back
+to about the size of the ciphertext.
+
+Contents are limited to SECRET_MAX_SIZE bytes, checked while reading, so
+that an upload can not fill the disk. The size of inline contents is
+taken from the content itself, as Secrets created without store() have
+size 0.
+
+Chunks have a fixed uncompressed size, so read() serves any byte range
+by decompressing only the chunks it overlaps. Files are written to a
+temporary name and renamed, so readers never see partial chunks.
+Chunks no longer referenced by a Secret or StagedSecret are deleted by
+collect_garbage(), run as the 'ring.collect_secret_blobs' job and by
+`manage.py collect_secret_blobs`.
+"""
+import hashlib, io, os, tempfile, time, zlib
+from pathlib import Path
+from django.conf import settings
+from .models import Secret, StagedSecret
+
+CHUNK_SIZE = 1024 * 1024
+# Chunks written or reused this recently are never collected, as the row
+# referencing them may not be committed yet
+GARBAGE_GRACE_SECONDS = 3600
+
+class ContentTooLarge(ValueError):
+    pass
+
+def _path(digest):
+    return Path(settings.SECRET_BLOB_DIR) / digest[:2] / digest
+
+def _put_chunk(data):
+    digest = hashlib.sha256(data).hexdigest()
+    path = _path(digest)
+    if path.exists():
+        # Mark the chunk as in use for collect_garbage()
+        os.utime(path)
+        return digest
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as tmp:
+        tmp.write(zlib.compress(data))
+    os.replace(tmp.name, path)
+    return digest
+
+def _read_chunk(digest):
+    return zlib.decompress(_path(digest).read_bytes())
+
+def _read_full(stream, size):
+    parts = []
+    while size:
+        part = stream.read(size)
+        if not part:
+            break
+        parts.append(part)
+        size -= len(part)
+    return b''.join(parts)
+
+def store_stream(stream):
+    """
+    Store the content read from the binary file-like stream and return
+    the content, chunks and size fields of the Secret holding it. Reads
+    one chunk at a time. Raises ContentTooLarge once more than
+    SECRET_MAX_SIZE bytes are read; chunks stored until then are left to
+    collect_garbage(). Raises ValueError for a content small enough to be
+    stored inline that is not UTF-8 text.
+    """
+    data = _read_full(stream, CHUNK_SIZE)
+    if len(data) > settings.SECRET_MAX_SIZE:
+        raise ContentTooLarge(f"Contents can be at most {settings.SECRET_MAX_SIZE} bytes")
+    if len(data) <= settings.SECRET_INLINE_MAX:
+        try:
+            content = data.decode()
+        except UnicodeDecodeError:
+            raise ValueError("Contents must be UTF-8 text") from None
+        return {'content': content, 'chunks': [], 'size': len(data)}
+    chunks, size = [], 0
+    while data:
+        chunks.append(_put_chunk(data))
+        size += len(data)
+        data = _read_full(stream, CHUNK_SIZE)
+        if size + len(data) > settings.SECRET_MAX_SIZE:
+            raise ContentTooLarge(f"Contents can be at most {settings.SECRET_MAX_SIZE} bytes")
+    return {'content': '', 'chunks': chunks, 'size': size}
+
+def store(content):
+    """
+    Like store_stream(), for a content already in memory.
+    """
+    return store_stream(io.BytesIO(content.encode()))
+
+def size_of(secret):
+    """
+    Return the size of the content of secret in bytes.
+    """
+    return secret.size if secret.chunks else len(secret.content.encode())
+
+def read(secret, start=0, end=None):
+    """
+    Yield the bytes start to end, excluded, of the content of secret, a
+    Secret or StagedSecret, one chunk at a time.
+    """
+    size = size_of(secret)
+    end = size if end is None else min(end, size)
+    if not secret.chunks:
+        yield secret.content.encode()[start:end]
+        return
+    for index in range(start // CHUNK_SIZE, (end + CHUNK_SIZE - 1) // CHUNK_SIZE):
+        offset = index * CHUNK_SIZE
+        yield _read_chunk(secret.chunks[index])[max(start - offset, 0):end - offset]
+
+def content_of(secret):
+    """
+    Return the whole content of secret as text.
+    """
+    return b''.join(read(secret)).decode()
+
+def _referenced():
+    digests = set()
+    for model in (Secret, StagedSecret):
+        for chunks in model.objects.exclude(chunks=[]).values_list('chunks', flat=True).iterator():
+            digests.update(chunks)
+    return digests
+
+def collect_garbage():
+    """
+    Delete the chunk files not referenced by any secret. Returns the
+    number deleted.
+    """
+    root = Path(settings.SECRET_BLOB_DIR)
+    if not root.exists():
+        return 0
+    cutoff = time.time() - GARBAGE_GRACE_SECONDS
+    # List the old files first: a chunk reused after this is touched, and
+    # skipped by the second mtime check below
+    candidates = [path for path in root.glob('??/*') if path.stat().st_mtime < cutoff]
+    referenced = _referenced()
+    deleted = 0
+    for path in candidates:
+        if path.name not in referenced and path.stat().st_mtime < cutoff:
+            path.unlink(missing_ok=True)
+            deleted += 1
+    return deleted
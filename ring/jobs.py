@@ -0,0 +1,24 @@
+from core.jobs import job_handler
+from . import blobs, rotation
+from .tokens import purge
+
+@job_handler('ring.purge_key_tokens', timeout=60, priority=-10)
+def purge_key_tokens_job(job):
+    """
+    Delete expired and used key import tokens.
+    """
+    return {'deleted': purge()}
+
+@job_handler('ring.purge_key_rotations', timeout=300, priority=-10)
+def purge_key_rotations_job(job):
+    """
+    Delete expired key rotations that were not applied.
+    """
+    return {'deleted': rotation.purge()}
+
+@job_handler('ring.collect_secret_blobs', timeout=600, priority=-10)
+def collect_secret_blobs_job(job):
+    """
+    Delete chunks of secret contents no secret refers to.
+    """
+    return {'deleted': blobs.collect_garbage()}
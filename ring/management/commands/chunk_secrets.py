@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from ring import blobs
+from ring.models import Secret
+
+class Command(BaseCommand):
+    help = "Move secret contents over SECRET_INLINE_MAX bytes from the database to the chunk store"
+
+    def handle(self, *args, **options):
+        moved = 0
+        secrets = Secret.objects.filter(chunks=[], size__gt=settings.SECRET_INLINE_MAX).only('content', 'updated_at')
+        for secret in secrets.iterator(chunk_size=10):
+            # Skip secrets changed meanwhile, their new content is stored already
+            moved += Secret.objects.filter(pk=secret.pk, updated_at=secret.updated_at).update(**blobs.store(secret.content))
+        self.stdout.write(f"Moved {moved} secrets to the chunk store")
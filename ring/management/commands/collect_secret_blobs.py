@@ -0,0 +1,8 @@
+from django.core.management.base import BaseCommand
+from ring.blobs import collect_garbage
+
+class Command(BaseCommand):
+    help = "Delete chunks of secret contents that no secret refers to"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Deleted {collect_garbage()} secret chunks")
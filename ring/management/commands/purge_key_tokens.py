@@ -0,0 +1,8 @@
+from django.core.management.base import BaseCommand
+from ring.tokens import purge
+
+class Command(BaseCommand):
+    help = "Delete expired and used key import tokens"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Deleted {purge()} key import tokens")
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ring', '0004_secret'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='secret',
+            index=models.Index(fields=['ring', 'updated_at', 'id'], name='secret_ring_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ring', '0005_secret_sync_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeyImportToken',
+            fields=[
+                ('token', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('used_at', models.DateTimeField(blank=True, null=True)),
+                ('ring_key', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_tokens', to='ring.ringkey')),
+            ],
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ring', '0006_keyimporttoken'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ring',
+            name='key_version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.CreateModel(
+            name='KeyRotation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_version', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('ring', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rotations', to='ring.ring')),
+                ('started_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StagedRingKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('encrypted_key', models.CharField(max_length=255)),
+                ('rotation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='staged_keys', to='ring.keyrotation')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('rotation', 'user')},
+            },
+        ),
+        migrations.CreateModel(
+            name='StagedSecret',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content', models.TextField()),
+                ('secret_updated_at', models.DateTimeField()),
+                ('rotation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='staged_secrets', to='ring.keyrotation')),
+                ('secret', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ring.secret')),
+            ],
+            options={
+                'unique_together': {('rotation', 'secret')},
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:41
+
+from django.db import migrations, models
+from django.db.models.functions import Length
+
+
+def set_sizes(apps, schema_editor):
+    # Contents are base64 text, so characters and bytes are the same
+    apps.get_model('ring', 'Secret').objects.update(size=Length('content'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ring', '0007_key_rotation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='secret',
+            name='chunks',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='secret',
+            name='size',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='stagedsecret',
+            name='chunks',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='stagedsecret',
+            name='size',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='secret',
+            name='content',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='stagedsecret',
+            name='content',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(set_sizes, migrations.RunPython.noop),
+    ]
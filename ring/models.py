@@ -3,6 +3,8 @@ from django.db import models
 
 class Ring(models.Model):
     name = models.CharField(max_length=255, unique=True)
+    # Raised by every key rotation, see ring.rotation
+    key_version = models.PositiveIntegerField(default=1)
 
     def __str__(self):
         return f"Ring {self.name.title()}"
@@ -27,9 +29,66 @@ class UserKey(models.Model):
 
 class Secret(models.Model):
     ring = models.ForeignKey(Ring, on_delete=models.CASCADE)
-    content = models.TextField()  # Encrypted content
+    content = models.TextField(blank=True)  # Encrypted content, empty when stored in chunks
+    # Large contents are stored compressed in the chunk store, see ring.blobs
+    chunks = models.JSONField(default=list, blank=True)  # Hashes of the content's chunks
+    size = models.PositiveBigIntegerField(default=0)  # Length of the content in bytes
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Incremental sync reads the changes of a ring after a watermark
+            models.Index(fields=['ring', 'updated_at', 'id'], name='secret_ring_updated_idx'),
+        ]
+
     def __str__(self):
-        return f"Secret {self.pk} for {self.ring.name.title()}"
\ No newline at end of file
+        return f"Secret {self.pk} for {self.ring.name.title()}"
+
+class KeyImportToken(models.Model):
+    """
+    Single use token of a magic link that imports a ring key on another
+    device, see ring.tokens.
+    """
+    token = models.CharField(max_length=64, primary_key=True)
+    ring_key = models.ForeignKey(RingKey, on_delete=models.CASCADE, related_name='import_tokens')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    used_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"KeyImportToken for {self.ring_key}"
+
+class KeyRotation(models.Model):
+    """
+    A rotation of a ring's key, uploaded in batches to the staging tables
+    StagedSecret and StagedRingKey and applied at once, see ring.rotation.
+    """
+    ring = models.ForeignKey(Ring, on_delete=models.CASCADE, related_name='rotations')
+    started_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    from_version = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"KeyRotation {self.pk} of {self.ring} from version {self.from_version}"
+
+class StagedSecret(models.Model):
+    rotation = models.ForeignKey(KeyRotation, on_delete=models.CASCADE, related_name='staged_secrets')
+    secret = models.ForeignKey(Secret, on_delete=models.CASCADE)
+    content = models.TextField(blank=True)  # Content encrypted with the new ring key
+    chunks = models.JSONField(default=list, blank=True)
+    size = models.PositiveBigIntegerField(default=0)
+    secret_updated_at = models.DateTimeField()  # Secret.updated_at when staged
+
+    class Meta:
+        unique_together = ('rotation', 'secret')
+
+class StagedRingKey(models.Model):
+    rotation = models.ForeignKey(KeyRotation, on_delete=models.CASCADE, related_name='staged_keys')
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    encrypted_key = models.CharField(max_length=255)  # New ring key wrapped for user
+
+    class Meta:
+        unique_together = ('rotation', 'user')
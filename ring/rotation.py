@@ -0,0 +1,177 @@
+"""
+Key rotation of rings.
+
+Rotating a ring key means re-encrypting every Secret of the ring and
+wrapping the new key for every member. A client starts a KeyRotation,
+reads the ring's secrets with secret_batch(), and uploads the new
+contents and keys in as many batches as it likes with stage(). Batches
+go to the StagedSecret and StagedRingKey tables in short transactions of
+their own, so the ring stays usable during the upload. Large contents
+go to the chunk store, see ring.blobs, also when uploaded one at a time
+with stage_content().
+
+apply() checks in one transaction that the staged rows cover every
+secret and member of the ring, that no secret changed after it was
+staged and that no other rotation won the race, then swaps all contents
+and keys with one UPDATE per table and raises Ring.key_version.
+Unfinished rotations are deleted by purge() once they expire, run as the
+'ring.purge_key_rotations' job queued for every rotation's expiry.
+"""
+import datetime
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+from core.jobs import enqueue
+from . import blobs
+from .models import KeyRotation, Ring, RingKey, Secret, StagedRingKey, StagedSecret
+
+# Rows per INSERT when staging, and most secrets per secret_batch()
+ROTATION_BATCH_SIZE = 500
+# Most ids listed per kind of problem when apply() fails
+MAX_REPORTED = 100
+
+def start(ring, user):
+    """
+    Start a rotation of ring's key by user, valid for KEY_ROTATION_TTL
+    seconds.
+    """
+    expires_at = timezone.now() + datetime.timedelta(seconds=settings.KEY_ROTATION_TTL)
+    rotation = KeyRotation.objects.create(ring=ring, started_by=user, from_version=ring.key_version, expires_at=expires_at)
+    enqueue('ring.purge_key_rotations', run_after=expires_at)
+    return rotation
+
+def open_rotations(user):
+    """
+    Unfinished, unexpired rotations started by user.
+    """
+    return KeyRotation.objects.filter(started_by=user, completed_at__isnull=True, expires_at__gt=timezone.now())
+
+def secret_batch(rotation, after_id=0):
+    """
+    Return the next ROTATION_BATCH_SIZE secrets of the rotation's ring
+    after the secret id after_id, in id order. Contents in the chunk store
+    are not loaded.
+    """
+    return list(
+        Secret.objects.filter(ring_id=rotation.ring_id, id__gt=after_id)
+        .order_by('id').only('id', 'content', 'chunks', 'size', 'updated_at')[:ROTATION_BATCH_SIZE]
+    )
+
+def stage(rotation, contents, keys):
+    """
+    Stage new secret contents, {secret id: content}, and wrapped keys,
+    {user id: encrypted key}, replacing those staged before. Returns a
+    dict of the secret ids not in the ring and the user ids not members,
+    which are not staged.
+    """
+    current = dict(Secret.objects.filter(ring_id=rotation.ring_id, id__in=contents).values_list('id', 'updated_at'))
+    members = set(RingKey.objects.filter(ring_id=rotation.ring_id, user_id__in=keys).values_list('user_id', flat=True))
+    with transaction.atomic():
+        StagedSecret.objects.bulk_create([
+            StagedSecret(rotation=rotation, secret_id=secret_id, secret_updated_at=current[secret_id], **blobs.store(content))
+            for secret_id, content in contents.items() if secret_id in current
+        ], batch_size=ROTATION_BATCH_SIZE, update_conflicts=True,
+            unique_fields=['rotation', 'secret'], update_fields=['content', 'chunks', 'size', 'secret_updated_at'])
+        StagedRingKey.objects.bulk_create([
+            StagedRingKey(rotation=rotation, user_id=user_id, encrypted_key=encrypted_key)
+            for user_id, encrypted_key in keys.items() if user_id in members
+        ], batch_size=ROTATION_BATCH_SIZE, update_conflicts=True,
+            unique_fields=['rotation', 'user'], update_fields=['encrypted_key'])
+    return {
+        'unknown_secrets': sorted(contents.keys() - current.keys()),
+        'unknown_users': sorted(keys.keys() - members),
+    }
+
+def stage_content(rotation, secret_id, stream):
+    """
+    Stage the new content of one secret, read from the binary file-like
+    stream. Returns False when the secret is not in the ring. Raises
+    ValueError for an empty content, which would wipe the secret, or one
+    store_stream() rejects, and blobs.ContentTooLarge for one over
+    SECRET_MAX_SIZE.
+    """
+    updated_at = Secret.objects.filter(ring_id=rotation.ring_id, id=secret_id).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return False
+    fields = blobs.store_stream(stream)
+    if not fields['size']:
+        raise ValueError("Content required")
+    StagedSecret.objects.update_or_create(
+        rotation=rotation, secret_id=secret_id,
+        defaults={'secret_updated_at': updated_at, **fields},
+    )
+    return True
+
+def staged_counts(rotation):
+    """
+    Numbers of secrets and keys staged so far.
+    """
+    return {
+        'staged_secrets': rotation.staged_secrets.count(),
+        'staged_keys': rotation.staged_keys.count(),
+    }
+
+def _first_ids(queryset, field='id'):
+    return list(queryset.order_by(field).values_list(field, flat=True)[:MAX_REPORTED])
+
+def _problems(rotation):
+    staged_secrets = StagedSecret.objects.filter(rotation=rotation)
+    staged_keys = StagedRingKey.objects.filter(rotation=rotation)
+    problems = {
+        'missing_secrets': _first_ids(
+            Secret.objects.filter(ring_id=rotation.ring_id).exclude(id__in=staged_secrets.values('secret_id'))),
+        'stale_secrets': _first_ids(
+            staged_secrets.filter(secret__updated_at__gt=F('secret_updated_at')), 'secret_id'),
+        'missing_keys': _first_ids(
+            RingKey.objects.filter(ring_id=rotation.ring_id).exclude(user_id__in=staged_keys.values('user_id')), 'user_id'),
+    }
+    return {name: ids for name, ids in problems.items() if ids}
+
+def apply(rotation):
+    """
+    Replace all secret contents and ring keys of the rotation's ring with
+    the staged ones, in one transaction. Returns the new key version, or
+    a dict of problems when nothing was changed: conflict when the ring
+    key changed since the rotation started, or the ids of the secrets
+    missing from the staged rows or changed after they were staged and of
+    the members without a staged key, at most MAX_REPORTED of each.
+    Stage those and apply again.
+    """
+    with transaction.atomic():
+        if not Ring.objects.filter(pk=rotation.ring_id, key_version=rotation.from_version).update(key_version=F('key_version') + 1):
+            return {'conflict': 'The ring key was rotated since this rotation started'}
+        problems = _problems(rotation)
+        if problems:
+            transaction.set_rollback(True)
+            return problems
+
+        now = timezone.now()
+        staged = StagedSecret.objects.filter(rotation=rotation, secret=OuterRef('pk'))
+        Secret.objects.filter(ring_id=rotation.ring_id).update(
+            content=Subquery(staged.values('content')[:1]),
+            chunks=Subquery(staged.values('chunks')[:1]),
+            size=Subquery(staged.values('size')[:1]),
+            updated_at=now,
+        )
+        RingKey.objects.filter(ring_id=rotation.ring_id).update(
+            encrypted_key=Subquery(StagedRingKey.objects.filter(rotation=rotation, user=OuterRef('user_id')).values('encrypted_key')[:1]),
+        )
+        StagedSecret.objects.filter(rotation=rotation).delete()
+        StagedRingKey.objects.filter(rotation=rotation).delete()
+        rotation.completed_at = now
+        rotation.save(update_fields=['completed_at'])
+        # The chunks of the old contents are garbage now
+        enqueue('ring.collect_secret_blobs')
+    return rotation.from_version + 1
+
+def purge():
+    """
+    Delete expired rotations that were not applied, with their staged
+    rows. Returns the number of rotations deleted.
+    """
+    expired = KeyRotation.objects.filter(completed_at__isnull=True, expires_at__lte=timezone.now())
+    StagedSecret.objects.filter(rotation__in=expired).delete()
+    StagedRingKey.objects.filter(rotation__in=expired).delete()
+    deleted, _ = expired.delete()
+    return deleted
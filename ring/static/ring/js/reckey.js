@@ -454,4 +454,57 @@ export async function testKeyPairCompatibility() {
         console.error("❌ Key pair compatibility test failed:", error);
         return false;
     }
-}
\ No newline at end of file
+}
+/**
+ * Give users the ring key, wrapped with each user's public key. All public
+ * keys are fetched with one request and all wrapped keys stored with another.
+ * @param {number} ringId - The ring to distribute the key of
+ * @param {number[]} userIds - The users to give the key to
+ * @param {string} encryptedRingKey - Base64 encoded ring key, encrypted for the current user
+ * @returns {object} - The user ids stored and skipped, and those without a public key
+ */
+export async function distributeRingKey(ringId, userIds, encryptedRingKey) {
+    // Recover the base64 ring key, as wrapped for every member
+    const storedPrivateKey = JSON.parse(localStorage.getItem('private_key'));
+    if (!storedPrivateKey) {
+        throw new Error('No private key found in localStorage');
+    }
+    const privateKey = await window.crypto.subtle.importKey(
+        'jwk', storedPrivateKey, { name: 'RSA-OAEP', hash: 'SHA-256' }, false, ['decrypt']
+    );
+    const keyData = await window.crypto.subtle.decrypt(
+        { name: 'RSA-OAEP' },
+        privateKey,
+        Uint8Array.from(atob(encryptedRingKey), c => c.charCodeAt(0))
+    );
+
+    const params = new URLSearchParams(userIds.map(id => ['user_id', id]));
+    const response = await fetch(`/ring/get_public_keys/?${params}`, { credentials: 'include' });
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    const { public_keys, missing } = await response.json();
+
+    const keys = [];
+    for (const [userId, publicJwk] of Object.entries(public_keys)) {
+        const publicKey = await window.crypto.subtle.importKey(
+            'jwk', JSON.parse(publicJwk), { name: 'RSA-OAEP', hash: 'SHA-256' }, false, ['encrypt']
+        );
+        const encrypted = await window.crypto.subtle.encrypt({ name: 'RSA-OAEP' }, publicKey, keyData);
+        keys.push({ user_id: Number(userId), encrypted_key: btoa(String.fromCharCode(...new Uint8Array(encrypted))) });
+    }
+
+    const stored = await fetch('/ring/store_ring_keys/', {
+        method: 'POST',
+        credentials: 'include',
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value,
+        },
+        body: JSON.stringify({ ring_id: ringId, keys }),
+    });
+    if (!stored.ok) {
+        throw new Error(`HTTP error! status: ${stored.status}`);
+    }
+    return { ...(await stored.json()), missing };
+}
@@ -1,3 +1,209 @@
-from django.test import TestCase
+import datetime, json, tempfile
+from unittest import mock
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from . import blobs, tokens
+from .models import KeyImportToken, Ring, RingKey, Secret, StagedSecret, UserKey
+from .views import MAX_KEY_BATCH
 
-# Create your tests here.
+class KeyRotationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(f'member{i}', password='x') for i in range(3)]
+        cls.ring = Ring.objects.create(name='ring')
+        RingKey.objects.bulk_create([RingKey(ring=cls.ring, user=user, encrypted_key='old key') for user in cls.users])
+        Secret.objects.bulk_create([Secret(ring=cls.ring, content=f'old {i}') for i in range(10)])
+
+    def setUp(self):
+        self.client.force_login(self.users[0])
+
+    def post(self, url, data=None):
+        return self.client.post(url, json.dumps(data or {}), content_type='application/json')
+
+    def start(self):
+        response = self.post(reverse('start_key_rotation'), {'ring_id': self.ring.id})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['rotation_id']
+
+    def stage(self, rotation_id, secrets=None, users=None):
+        return self.post(reverse('stage_key_rotation', args=[rotation_id]), {
+            'secrets': [{'id': secret.id, 'content': f'new {secret.id}'} for secret in secrets or []],
+            'keys': [{'user_id': user.id, 'encrypted_key': 'new key'} for user in users or []],
+        })
+
+    def test_apply_swaps_everything(self):
+        rotation_id = self.start()
+        secrets = list(Secret.objects.all())
+        self.stage(rotation_id, secrets[:5])
+        self.stage(rotation_id, secrets[5:], self.users)
+        response = self.post(reverse('apply_key_rotation', args=[rotation_id]))
+        self.assertEqual(response.json(), {'key_version': 2})
+        self.assertFalse(Secret.objects.exclude(content__startswith='new').exists())
+        self.assertEqual(set(RingKey.objects.values_list('encrypted_key', flat=True)), {'new key'})
+        self.assertFalse(StagedSecret.objects.exists())
+
+    def test_incomplete_rotation_changes_nothing(self):
+        rotation_id = self.start()
+        secrets = list(Secret.objects.all())
+        self.stage(rotation_id, secrets[1:], self.users[1:])
+        response = self.post(reverse('apply_key_rotation', args=[rotation_id]))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['missing_secrets'], [secrets[0].id])
+        self.assertEqual(response.json()['missing_keys'], [self.users[0].id])
+        self.ring.refresh_from_db()
+        self.assertEqual(self.ring.key_version, 1)
+        self.assertFalse(Secret.objects.filter(content__startswith='new').exists())
+
+    def test_empty_or_binary_content_is_not_staged(self):
+        rotation_id = self.start()
+        secret = Secret.objects.first()
+        url = reverse('stage_key_rotation_secret', args=[rotation_id, secret.id])
+        for content in (b'', b'\xff\xfe'):
+            response = self.client.post(url, content, content_type='application/octet-stream')
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(StagedSecret.objects.exists())
+
+    def test_only_one_rotation_applies(self):
+        first, second = self.start(), self.start()
+        for rotation_id in (first, second):
+            self.stage(rotation_id, Secret.objects.all(), self.users)
+        self.assertEqual(self.post(reverse('apply_key_rotation', args=[first])).status_code, 200)
+        response = self.post(reverse('apply_key_rotation', args=[second]))
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('conflict', response.json())
+
+class RingKeyBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.member, cls.existing, cls.new, cls.outsider = [
+            User.objects.create_user(name, password='x') for name in ('member', 'existing', 'new', 'outsider')
+        ]
+        UserKey.objects.create(user=cls.new, public_key='public')
+        cls.ring = Ring.objects.create(name='ring')
+        RingKey.objects.bulk_create([
+            RingKey(ring=cls.ring, user=cls.member, encrypted_key='key'),
+            RingKey(ring=cls.ring, user=cls.existing, encrypted_key='key'),
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.member)
+
+    def store(self, user_ids, **data):
+        keys = [{'user_id': user_id, 'encrypted_key': 'new key'} for user_id in user_ids]
+        return self.client.post(reverse('store_ring_keys'), json.dumps({'ring_id': self.ring.id, 'keys': keys, **data}), content_type='application/json')
+
+    def test_public_keys(self):
+        response = self.client.get(reverse('get_public_keys'), {'user_id': [self.new.id, self.outsider.id]})
+        self.assertEqual(response.json(), {'public_keys': {str(self.new.id): 'public'}, 'missing': [self.outsider.id]})
+        response = self.client.get(reverse('get_public_keys'), {'user_id': list(range(1, MAX_KEY_BATCH + 2))})
+        self.assertEqual(response.status_code, 400)
+
+    def test_existing_keys_are_skipped(self):
+        response = self.store([self.existing.id, self.new.id])
+        self.assertEqual(response.json(), {'stored': [self.new.id], 'skipped': [self.existing.id]})
+        self.assertEqual(RingKey.objects.get(ring=self.ring, user=self.existing).encrypted_key, 'key')
+        self.assertEqual(RingKey.objects.get(ring=self.ring, user=self.new).encrypted_key, 'new key')
+
+    def test_only_members_store_keys(self):
+        self.client.force_login(self.outsider)
+        self.assertEqual(self.store([self.outsider.id]).status_code, 403)
+        self.assertFalse(RingKey.objects.filter(user=self.outsider).exists())
+
+    def test_invalid_batches_are_refused(self):
+        response = self.store([self.new.id, 999999])
+        self.assertEqual((response.status_code, response.json()['unknown']), (400, [999999]))
+        self.assertEqual(self.store(range(1, MAX_KEY_BATCH + 2)).status_code, 400)
+        self.assertEqual(self.store([self.new.id], key_version=self.ring.key_version + 1).status_code, 409)
+        self.assertFalse(RingKey.objects.filter(user=self.new).exists())
+
+class KeyImportTokenTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('member', password='x')
+        cls.other = User.objects.create_user('other', password='x')
+        cls.ring = Ring.objects.create(name='ring')
+        RingKey.objects.create(ring=cls.ring, user=cls.user, encrypted_key='key')
+        RingKey.objects.create(ring=cls.ring, user=cls.other, encrypted_key='other key')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('create_magic_link'), {'ring_id': self.ring.id})
+        self.token = KeyImportToken.objects.get().token
+        self.assertIn(self.token, response.json()['link'])
+
+    def redeem(self):
+        return self.client.get(reverse('get_encrypted_key'), {'token': self.token})
+
+    def test_token_is_single_use(self):
+        self.assertEqual(self.client.get(reverse('import_key'), {'token': self.token}).status_code, 200)
+        self.assertEqual(self.redeem().json(), {'encrypted_key': 'key'})
+        self.assertEqual(self.redeem().status_code, 400)
+        self.assertFalse(tokens.is_valid(self.token, self.user))
+        self.assertEqual(tokens.purge(), 1)
+
+    def test_token_expires(self):
+        KeyImportToken.objects.update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(self.redeem().status_code, 400)
+        self.assertEqual(tokens.purge(), 1)
+
+    def test_other_users_can_not_redeem(self):
+        self.client.force_login(self.other)
+        self.assertEqual(self.redeem().status_code, 400)
+        # The token is still there for its owner
+        self.client.force_login(self.user)
+        self.assertEqual(self.redeem().json(), {'encrypted_key': 'key'})
+
+class SecretChunkTests(TestCase):
+    def setUp(self):
+        blob_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(blob_dir.cleanup)
+        self.enterContext(override_settings(SECRET_BLOB_DIR=blob_dir.name, SECRET_INLINE_MAX=16))
+        self.enterContext(mock.patch.object(blobs, 'CHUNK_SIZE', 32))
+        self.user = User.objects.create_user('member', password='x')
+        self.ring = Ring.objects.create(name='ring')
+        RingKey.objects.create(ring=self.ring, user=self.user, encrypted_key='key')
+        self.client.force_login(self.user)
+
+    def test_small_content_stays_inline(self):
+        self.assertEqual(blobs.store('short'), {'content': 'short', 'chunks': [], 'size': 5})
+
+    def test_large_content_is_chunked(self):
+        content = ''.join(chr(65 + i % 26) for i in range(100))
+        secret = Secret.objects.create(ring=self.ring, **blobs.store(content))
+        self.assertEqual((secret.content, len(secret.chunks), secret.size), ('', 4, 100))
+        self.assertEqual(blobs.content_of(secret), content)
+        self.assertEqual(b''.join(blobs.read(secret, 30, 70)).decode(), content[30:70])
+
+    def test_download_range(self):
+        content = 'x' * 50 + 'y' * 50
+        response = self.client.post(f"{reverse('secret_upload')}?ring_id={self.ring.id}", content, content_type='application/octet-stream')
+        url = reverse('secret_content', args=[response.json()['id']])
+        response = self.client.get(url, HTTP_RANGE='bytes=45-54')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 45-54/100')
+        self.assertEqual(b''.join(response.streaming_content), b'xxxxxyyyyy')
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=100-').status_code, 416)
+
+    def test_inline_size_comes_from_the_content(self):
+        # Created without blobs.store(), so size is not set
+        secret = Secret.objects.create(ring=self.ring, content='abc')
+        response = self.client.get(reverse('secret_content', args=[secret.id]))
+        self.assertEqual((response['Content-Length'], b''.join(response.streaming_content)), ('3', b'abc'))
+
+    @override_settings(SECRET_MAX_SIZE=40)
+    def test_uploads_are_capped(self):
+        url = f"{reverse('secret_upload')}?ring_id={self.ring.id}"
+        for content in ('x' * 41, 'x' * 100):
+            response = self.client.post(url, content, content_type='application/octet-stream')
+            self.assertEqual(response.status_code, 413)
+        self.assertFalse(Secret.objects.exists())
+        response = self.client.post(url, 'x' * 40, content_type='application/octet-stream')
+        self.assertEqual(response.json()['size'], 40)
+
+    def test_inline_content_must_be_text(self):
+        url = f"{reverse('secret_upload')}?ring_id={self.ring.id}"
+        response = self.client.post(url, b'\xff\xfe', content_type='application/octet-stream')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Secret.objects.exists())
@@ -0,0 +1,52 @@
+"""
+Single use tokens of magic links that import a ring key on another device.
+
+A token row points at the RingKey it hands out, so a link always gives
+the current key. Redeeming marks the token used with one conditional
+UPDATE by primary key, which makes it single use across worker
+processes. Expired and used tokens are removed by purge(), run as the
+'ring.purge_key_tokens' job queued for every token's expiry and by
+`manage.py purge_key_tokens`.
+"""
+import datetime, secrets
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from core.jobs import enqueue
+from .models import KeyImportToken, RingKey
+
+def create_token(ring_key):
+    """
+    Return a new token for ring_key, valid for KEY_IMPORT_TOKEN_TTL seconds.
+    """
+    expires_at = timezone.now() + datetime.timedelta(seconds=settings.KEY_IMPORT_TOKEN_TTL)
+    token = KeyImportToken.objects.create(token=secrets.token_urlsafe(32), ring_key=ring_key, expires_at=expires_at)
+    enqueue('ring.purge_key_tokens', run_after=expires_at)
+    return token
+
+def _valid(token, user):
+    return KeyImportToken.objects.filter(
+        pk=token, ring_key__user=user, used_at__isnull=True, expires_at__gt=timezone.now(),
+    )
+
+def is_valid(token, user):
+    """
+    Tell whether token can still be redeemed by user.
+    """
+    return bool(token) and _valid(token, user).exists()
+
+def redeem(token, user):
+    """
+    Use up token and return the encrypted ring key it gives user, or None
+    when the token is unknown, expired, used or another user's.
+    """
+    if not token or not _valid(token, user).update(used_at=timezone.now()):
+        return None
+    return RingKey.objects.filter(import_tokens=token).values_list('encrypted_key', flat=True).first()
+
+def purge():
+    """
+    Delete expired and used tokens. Returns the number deleted.
+    """
+    deleted, _ = KeyImportToken.objects.filter(Q(expires_at__lte=timezone.now()) | Q(used_at__isnull=False)).delete()
+    return deleted
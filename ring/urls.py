@@ -1,11 +1,20 @@
 from django.urls import path
 from .views import StorePublicKeyView, get_user_public_key, get_ring_key, debug_urls, create_magic_link, get_encrypted_key, import_key_view
+from .views import get_public_keys, store_ring_keys
+from .views import start_key_rotation, key_rotation_secrets, stage_key_rotation, stage_key_rotation_secret, apply_key_rotation
 from .views import debug_urls
 
 urlpatterns = [
     path('store_public_key/', StorePublicKeyView.as_view(), name='store_public_key'),
     path('get_user_public_key/', get_user_public_key, name='get_user_public_key'),
     path('get_ring_key/<int:ring_id>/', get_ring_key, name='get_ring_key'),
+    path('get_public_keys/', get_public_keys, name='get_public_keys'),
+    path('store_ring_keys/', store_ring_keys, name='store_ring_keys'),
+    path('key_rotations/', start_key_rotation, name='start_key_rotation'),
+    path('key_rotations/<int:rotation_id>/secrets/', key_rotation_secrets, name='key_rotation_secrets'),
+    path('key_rotations/<int:rotation_id>/stage/', stage_key_rotation, name='stage_key_rotation'),
+    path('key_rotations/<int:rotation_id>/secrets/<int:secret_id>/', stage_key_rotation_secret, name='stage_key_rotation_secret'),
+    path('key_rotations/<int:rotation_id>/apply/', apply_key_rotation, name='apply_key_rotation'),
     path('debug_urls/', debug_urls, name='debug_urls'),
     path('create_magic_link/', create_magic_link, name='create_magic_link'),
     path('get_encrypted_key/', get_encrypted_key, name='get_encrypted_key'),
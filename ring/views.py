@@ -1,75 +1,52 @@
 import json, base64
 from django.shortcuts import render, redirect
 from django.http import JsonResponse, HttpResponseBadRequest, HttpResponse
-from django.views.decorators.http import require_GET
+from django.views.decorators.http import require_GET, require_POST
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth.models import User
 from django.contrib import messages
 from django.utils.decorators import method_decorator
-from django.utils.crypto import get_random_string
 from django.shortcuts import get_object_or_404
 from django.views import View
 from django.template.loader import render_to_string
+from django.db import transaction
+from django.urls import reverse
 from .models import UserKey, RingKey, Ring, Secret
+from .tokens import create_token, is_valid, redeem
+from . import blobs, rotation
 
-@require_GET
+# Most users in one batch key request
+MAX_KEY_BATCH = 500
+
+@login_required
 @require_GET
 def create_magic_link(request):
-    print(f"=== CREATE_MAGIC_LINK DEBUG ===")
-    print(f"Request user: {request.user} (ID: {request.user.id})")
-    print(f"User authenticated: {request.user.is_authenticated}")
-    
+    """Create a single use link that imports the user's ring key on another device"""
     ring_id = request.GET.get('ring_id')
-    print(f"Requested ring_id: {ring_id}")
-    
     if not ring_id:
         return JsonResponse({'error': 'ring_id required'}, status=400)
     
     try:
         ring = Ring.objects.get(id=ring_id)
-        print(f"Ring found: {ring.name} (ID: {ring.id})")
-        
-        # Check if user is a member with detailed logging
-        try:
-            ring_key = RingKey.objects.get(ring=ring, user=request.user)
-            print(f"RingKey found: {ring_key}")
-            print(f"RingKey details: Ring={ring_key.ring.id}, User={ring_key.user.id}")
-            
-            # Generate a unique token
-            token = get_random_string(32)
-            
-            # Store the encrypted key in session with the token
-            session_key = f'key_token_{token}'
-            request.session[session_key] = ring_key.encrypted_key
-            
-            # Create the magic link
-            base_url = request.build_absolute_uri('/')
-            magic_link = f"{base_url}ring/import_key/?token={token}"
-            
-            print(f"Generated magic link: {magic_link}")
-            
-            return JsonResponse({'link': magic_link})
-            
-        except RingKey.DoesNotExist:
-            print(f"RingKey NOT found for ring={ring_id}, user={request.user.id}")
-            
-            # Let's see what RingKeys DO exist for this ring
-            existing_keys = RingKey.objects.filter(ring=ring)
-            print(f"Existing RingKeys for ring {ring_id}:")
-            for rk in existing_keys:
-                print(f"  User {rk.user.id} ({rk.user.username})")
-                
-            return JsonResponse({'error': 'You are not member of this ring.'}, status=400)
-        
-    except Ring.DoesNotExist:
+    except (Ring.DoesNotExist, ValueError):
         return JsonResponse({'error': 'Ring not found'}, status=404)
     
+    try:
+        ring_key = RingKey.objects.get(ring=ring, user=request.user)
+    except RingKey.DoesNotExist:
+        return JsonResponse({'error': 'You are not member of this ring.'}, status=400)
+    
+    token = create_token(ring_key)
+    magic_link = request.build_absolute_uri(f"{reverse('import_key')}?token={token.token}")
+    return JsonResponse({'link': magic_link, 'expires_at': token.expires_at.isoformat()})
+
+@login_required
 @require_GET
 def get_encrypted_key(request):
-    token = request.GET.get('token')
-    encrypted_key = request.session.pop(f'key_token_{token}', None)
+    encrypted_key = redeem(request.GET.get('token'), request.user)
     if not encrypted_key:
         return HttpResponseBadRequest("Invalid or expired token")
 
@@ -148,7 +125,7 @@ def secret_view(request):
                 if RingKey.objects.filter(ring=ring, user=request.user).exists():
                     Secret.objects.create(
                         ring=ring,
-                        content=encrypted_content
+                        **blobs.store(encrypted_content)
                     )
                     messages.success(request, f'Secret added to {ring.name}!')
                 else:
@@ -182,20 +159,191 @@ def secret_view(request):
 @login_required
 def get_ring_key(request, ring_id):
     try:
-        ring_key = RingKey.objects.get(ring_id=ring_id, user=request.user)
-        return JsonResponse({'encrypted_key': ring_key.encrypted_key})
+        ring_key = RingKey.objects.select_related('ring').get(ring_id=ring_id, user=request.user)
+        return JsonResponse({'encrypted_key': ring_key.encrypted_key, 'key_version': ring_key.ring.key_version})
     except RingKey.DoesNotExist:
         return JsonResponse({'error': 'Ring key not found'}, status=404)
     
+@login_required
+@require_GET
+def get_public_keys(request):
+    """
+    Public keys of many users at once, for wrapping a ring key for each:
+    ?user_id=1&user_id=2... Users without a key are listed as missing.
+    """
+    user_ids = request.GET.getlist('user_id')
+    if not user_ids or not all(user_id.isdigit() for user_id in user_ids):
+        return JsonResponse({'error': 'user_id required, as one or more user ids'}, status=400)
+    if len(user_ids) > MAX_KEY_BATCH:
+        return JsonResponse({'error': f'At most {MAX_KEY_BATCH} users per request'}, status=400)
+    user_ids = {int(user_id) for user_id in user_ids}
+    public_keys = dict(UserKey.objects.filter(user_id__in=user_ids).values_list('user_id', 'public_key'))
+    return JsonResponse({
+        'public_keys': {str(user_id): key for user_id, key in public_keys.items()},
+        'missing': sorted(user_ids - public_keys.keys()),
+    })
+
+@login_required
+@require_POST
+def store_ring_keys(request):
+    """
+    Store the ring key wrapped for many users in one transaction, from a
+    JSON body {"ring_id": 1, "keys": [{"user_id": 2, "encrypted_key": "..."}]}.
+    Users become members of the ring. Only members may distribute its key,
+    and keys already set are left alone. With "key_version" the keys are
+    refused when the ring key was rotated since.
+    """
+    try:
+        data = json.loads(request.body)
+        ring_id = int(data['ring_id'])
+        keys = {int(item['user_id']): str(item['encrypted_key']) for item in data['keys']}
+        key_version = int(data['key_version']) if data.get('key_version') is not None else None
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected ring_id and a list of keys with user_id and encrypted_key'}, status=400)
+    if len(keys) > MAX_KEY_BATCH:
+        return JsonResponse({'error': f'At most {MAX_KEY_BATCH} keys per request'}, status=400)
+    if not all(keys.values()):
+        return JsonResponse({'error': 'encrypted_key can not be empty'}, status=400)
+
+    ring = get_object_or_404(Ring, id=ring_id)
+    if not RingKey.objects.filter(ring=ring, user=request.user).exclude(encrypted_key='').exists():
+        return JsonResponse({'error': 'You are not member of this ring.'}, status=403)
+    if key_version is not None and key_version != ring.key_version:
+        return JsonResponse({'error': 'The ring key was rotated', 'key_version': ring.key_version}, status=409)
+    unknown = keys.keys() - set(User.objects.filter(id__in=keys).values_list('id', flat=True))
+    if unknown:
+        return JsonResponse({'error': 'Unknown users', 'unknown': sorted(unknown)}, status=400)
+
+    with transaction.atomic():
+        existing = dict(RingKey.objects.filter(ring=ring, user_id__in=keys).values_list('user_id', 'encrypted_key'))
+        ring_keys = [
+            RingKey(ring=ring, user_id=user_id, encrypted_key=encrypted_key)
+            for user_id, encrypted_key in keys.items() if not existing.get(user_id)
+        ]
+        RingKey.objects.bulk_create(
+            ring_keys, update_conflicts=True, unique_fields=['ring', 'user'], update_fields=['encrypted_key'],
+        )
+    return JsonResponse({
+        'stored': sorted(ring_key.user_id for ring_key in ring_keys),
+        'skipped': sorted(user_id for user_id in keys if existing.get(user_id)),
+    })
+
+@login_required
+@require_POST
+def start_key_rotation(request):
+    """
+    Start rotating a ring's key, from a JSON body {"ring_id": 1}. Returns
+    the rotation id and the members to wrap the new key for. Upload the
+    secrets re-encrypted with the new key and the wrapped keys with
+    stage_key_rotation, then swap them in with apply_key_rotation.
+    """
+    try:
+        ring_id = int(json.loads(request.body)['ring_id'])
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected ring_id'}, status=400)
+
+    ring = get_object_or_404(Ring, id=ring_id)
+    if not RingKey.objects.filter(ring=ring, user=request.user).exclude(encrypted_key='').exists():
+        return JsonResponse({'error': 'You are not member of this ring.'}, status=403)
+    key_rotation = rotation.start(ring, request.user)
+    return JsonResponse({
+        'rotation_id': key_rotation.id,
+        'key_version': key_rotation.from_version,
+        'expires_at': key_rotation.expires_at.isoformat(),
+        'members': list(RingKey.objects.filter(ring=ring).order_by('user_id').values_list('user_id', flat=True)),
+    })
+
+@login_required
+@require_GET
+def key_rotation_secrets(request, rotation_id):
+    """
+    The current secrets of a rotation's ring to re-encrypt, in batches:
+    pass the returned next_after_id as after_id while more is true. Large
+    contents are not included, download them from their content_url.
+    """
+    key_rotation = get_object_or_404(rotation.open_rotations(request.user), id=rotation_id)
+    after_id = request.GET.get('after_id', '0')
+    if not after_id.isdigit():
+        return JsonResponse({'error': 'after_id must be a secret id'}, status=400)
+    secrets = rotation.secret_batch(key_rotation, int(after_id))
+    return JsonResponse({
+        'secrets': [{
+            'id': secret.id,
+            'content': None if secret.chunks else secret.content,
+            'content_url': reverse('secret_content', args=[secret.id]) if secret.chunks else None,
+            'size': blobs.size_of(secret),
+            'updated_at': secret.updated_at.isoformat(),
+        } for secret in secrets],
+        'next_after_id': secrets[-1].id if secrets else int(after_id),
+        'more': len(secrets) == rotation.ROTATION_BATCH_SIZE,
+    })
+
+@login_required
+@require_POST
+def stage_key_rotation(request, rotation_id):
+    """
+    Upload a batch of a rotation, from a JSON body {"secrets": [{"id": 1,
+    "content": "..."}], "keys": [{"user_id": 2, "encrypted_key": "..."}]}.
+    Batches may be sent in any order and again; the last upload of a
+    secret or key counts. Nothing changes for users until the rotation is
+    applied.
+    """
+    key_rotation = get_object_or_404(rotation.open_rotations(request.user), id=rotation_id)
+    try:
+        data = json.loads(request.body)
+        contents = {int(item['id']): str(item['content']) for item in data.get('secrets', [])}
+        keys = {int(item['user_id']): str(item['encrypted_key']) for item in data.get('keys', [])}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({'error': 'Expected lists of secrets with id and content and of keys with user_id and encrypted_key'}, status=400)
+    if len(contents) > rotation.ROTATION_BATCH_SIZE or len(keys) > MAX_KEY_BATCH:
+        return JsonResponse({'error': f'At most {rotation.ROTATION_BATCH_SIZE} secrets and {MAX_KEY_BATCH} keys per request'}, status=400)
+    if not all(contents.values()) or not all(keys.values()):
+        return JsonResponse({'error': 'content and encrypted_key can not be empty'}, status=400)
+
+    rejected = rotation.stage(key_rotation, contents, keys)
+    return JsonResponse({**rejected, **rotation.staged_counts(key_rotation)})
+
+@login_required
+@require_POST
+def stage_key_rotation_secret(request, rotation_id, secret_id):
+    """
+    Upload the new content of one secret of a rotation as the raw request
+    body, for contents too large for stage_key_rotation.
+    """
+    key_rotation = get_object_or_404(rotation.open_rotations(request.user), id=rotation_id)
+    try:
+        staged = rotation.stage_content(key_rotation, secret_id, request)
+    except blobs.ContentTooLarge as e:
+        return JsonResponse({'error': str(e)}, status=413)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if not staged:
+        return JsonResponse({'error': 'Secret not found in this ring'}, status=404)
+    return JsonResponse(rotation.staged_counts(key_rotation))
+
+@login_required
+@require_POST
+def apply_key_rotation(request, rotation_id):
+    """
+    Swap in the staged secrets and keys of a rotation, all at once. Answers
+    409 Conflict with the missing, stale or conflicting parts when the
+    upload does not cover the ring as it is now.
+    """
+    key_rotation = get_object_or_404(rotation.open_rotations(request.user), id=rotation_id)
+    result = rotation.apply(key_rotation)
+    if isinstance(result, dict):
+        return JsonResponse({'error': 'The rotation can not be applied', **result}, status=409)
+    return JsonResponse({'key_version': result})
+
+@login_required
 def import_key_view(request):
     """Serve the import key page when someone visits the magic link"""
     token = request.GET.get('token')
     if not token:
         return render(request, 'ring/import_error.html', {'error': 'No token provided'})
     
-    # Check if token exists in session (optional validation)
-    session_key = f'key_token_{token}'
-    if session_key not in request.session:
+    # The key itself is only handed out, once, by get_encrypted_key
+    if not is_valid(token, request.user):
         return render(request, 'ring/import_error.html', {'error': 'Invalid or expired token'})
     
     return render(request, 'ring/import_key.html', {'token': token})
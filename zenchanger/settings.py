@@ -34,6 +34,101 @@ ALLOWED_HOSTS = []
 if os.environ.get('ZENCHANGER_ALLOWED_HOSTS'):
     ALLOWED_HOSTS = os.environ['ZENCHANGER_ALLOWED_HOSTS'].split(',')
 
+# Collection runs record how much they raised the peak resident size of the
+# worker process, which never shrinks over the process lifetime. With
+# ZENCHANGER_COLLECT_TRACE_MEMORY set they trace Python allocations instead,
+# which measures the run alone but makes parsing much slower
+COLLECT_TRACE_MEMORY = bool(os.environ.get('ZENCHANGER_COLLECT_TRACE_MEMORY'))
+
+# Background jobs are run by `manage.py worker`, or in-process right after
+# the request's transaction commits when ZENCHANGER_JOBS_EAGER is set
+JOBS_EAGER = bool(os.environ.get('ZENCHANGER_JOBS_EAGER'))
+
+# History retention per model, used by `manage.py compact_history`. Every
+# object keeps its newest "versions" history rows and all rows of the last
+# "days"; older rows are archived to HISTORY_ARCHIVE_DIR and deleted.
+# Models without an entry keep their full history.
+HISTORY_RETENTION = {
+    'core.Event': {'versions': 5, 'days': 180},
+    'collect.LocationImportMapping': {'versions': 5, 'days': 365},
+    'collect.Source': {'versions': 20, 'days': 365},
+}
+HISTORY_ARCHIVE_DIR = os.environ.get('ZENCHANGER_HISTORY_ARCHIVE_DIR', BASE_DIR / 'history_archive')
+
+# Maximum number of SQL queries per request, by URL name. Requests over
+# budget are logged, and core.testing fails tests of views over budget.
+QUERY_BUDGETS = {
+    'default': int(os.environ.get('ZENCHANGER_QUERY_BUDGET', 50)),
+    'event_list': 10,
+    'country_events': 10,
+    'location_events': 10,
+    'home': 20,
+    'ring_view': 20,
+    'secret_view': 20,
+    'metrics': 0,
+}
+
+# Lifetime in seconds of the single use links that import a ring key on
+# another device, see ring.tokens
+KEY_IMPORT_TOKEN_TTL = int(os.environ.get('ZENCHANGER_KEY_IMPORT_TTL', 15 * 60))
+
+# Seconds a client has to upload and apply a ring key rotation before its
+# staged secrets and keys are deleted, see ring.rotation
+KEY_ROTATION_TTL = int(os.environ.get('ZENCHANGER_KEY_ROTATION_TTL', 3600))
+
+# Secret contents over SECRET_INLINE_MAX bytes are stored as compressed
+# chunks in SECRET_BLOB_DIR instead of the database, see ring.blobs
+SECRET_INLINE_MAX = int(os.environ.get('ZENCHANGER_SECRET_INLINE_MAX', 64 * 1024))
+SECRET_BLOB_DIR = os.environ.get('ZENCHANGER_SECRET_BLOB_DIR', BASE_DIR / 'secret_blobs')
+# Largest secret content accepted, in bytes
+SECRET_MAX_SIZE = int(os.environ.get('ZENCHANGER_SECRET_MAX_SIZE', 64 * 1024 * 1024))
+
+# Bearer token required to scrape the Prometheus /metrics endpoint. Set it
+# whenever the site runs behind a reverse proxy: without a token, direct
+# requests from METRICS_ALLOWED_IPS are allowed, and behind a proxy on the
+# same host every client would have the proxy's address
+METRICS_TOKEN = os.environ.get('ZENCHANGER_METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = os.environ.get('ZENCHANGER_METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+# Slow query log, off unless ZENCHANGER_SLOW_QUERY_MS is set. Queries of a
+# sampled share of requests and jobs that take longer are logged with their
+# query plan to a rotating file, see core.slowlog.
+SLOW_QUERY_THRESHOLD_MS = None
+if os.environ.get('ZENCHANGER_SLOW_QUERY_MS'):
+    SLOW_QUERY_THRESHOLD_MS = float(os.environ['ZENCHANGER_SLOW_QUERY_MS'])
+SLOW_QUERY_SAMPLE_RATE = float(os.environ.get('ZENCHANGER_SLOW_QUERY_SAMPLE_RATE', 0.1))
+SLOW_QUERY_LOG_FILE = os.environ.get('ZENCHANGER_SLOW_QUERY_LOG', BASE_DIR / 'slow_queries.log')
+
+if SLOW_QUERY_THRESHOLD_MS is not None:
+    LOGGING = {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'formatters': {
+            'message': {'format': '%(message)s'},
+        },
+        'handlers': {
+            'slow_queries': {
+                'class': 'logging.handlers.RotatingFileHandler',
+                'filename': SLOW_QUERY_LOG_FILE,
+                'maxBytes': 10 * 1024 * 1024,
+                'backupCount': 5,
+                'formatter': 'message',
+            },
+        },
+        'loggers': {
+            'zenchanger.slow_query': {
+                'handlers': ['slow_queries'],
+                'level': 'WARNING',
+                'propagate': False,
+            },
+        },
+    }
+
+# With ZENCHANGER_PROFILING=1, staff can profile GET requests of any page
+# with ?_profile=1. Profiles are stored in PROFILE_DIR, see core.profiling.
+PROFILING_ENABLED = os.environ.get('ZENCHANGER_PROFILING') == '1'
+PROFILE_DIR = os.environ.get('ZENCHANGER_PROFILE_DIR', BASE_DIR / 'profiles')
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -51,11 +146,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryMetricsMiddleware',
+    'core.middleware.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ProfileMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -83,12 +181,84 @@ WSGI_APPLICATION = 'zenchanger.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite runs in WAL mode so that readers are not blocked by a writer, and
+# write transactions take the write lock up front (BEGIN IMMEDIATE), waiting
+# up to ZENCHANGER_DB_TIMEOUT seconds for it instead of failing with
+# "database is locked" when a collection run is writing.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'mmap_size': int(os.environ.get('ZENCHANGER_DB_MMAP_SIZE', 256 * 1024 * 1024)),
+    'cache_size': -int(os.environ.get('ZENCHANGER_DB_CACHE_KB', 64 * 1024)),
+}
+
+def sqlite_init_command(pragmas):
+    return ";".join(f"PRAGMA {name}={value}" for name, value in pragmas.items())
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('ZENCHANGER_DB_PATH', BASE_DIR / 'db.sqlite3'),
+        'CONN_MAX_AGE': int(os.environ.get('ZENCHANGER_DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': int(os.environ.get('ZENCHANGER_DB_TIMEOUT', 20)),
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': sqlite_init_command(SQLITE_PRAGMAS),
+        },
+    }
+}
+
+# Optional read-only connection used by views decorated with
+# core.db.read_only. ZENCHANGER_DB_REPLICA_PATH may name a replicated copy
+# of the database, or the primary file itself to read through a separate
+# read-only connection.
+if os.environ.get('ZENCHANGER_DB_REPLICA_PATH'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"file:{os.environ['ZENCHANGER_DB_REPLICA_PATH']}?mode=ro",
+        'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': DATABASES['default']['OPTIONS']['timeout'],
+            'init_command': sqlite_init_command({
+                'query_only': 'ON',
+                'temp_store': 'MEMORY',
+                'mmap_size': SQLITE_PRAGMAS['mmap_size'],
+                'cache_size': SQLITE_PRAGMAS['cache_size'],
+            }),
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.db.ReplicaRouter']
+
+# Cache for option lists and rendered pages, see core.pagecache. Entries are
+# keyed on data versions, so every backend stays consistent across worker
+# processes; a shared backend also shares the cached pages between them.
+# ZENCHANGER_CACHE is one of:
+#   locmem    per-process memory (default)
+#   file      files in ZENCHANGER_CACHE_LOCATION, shared by the workers of a host
+#   database  the table ZENCHANGER_CACHE_LOCATION, created with
+#             `manage.py createcachetable`, shared like the database itself
+#   redis     the server at ZENCHANGER_CACHE_LOCATION, needs the redis package
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'zenchanger'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', BASE_DIR / 'cache'),
+    'database': ('django.core.cache.backends.db.DatabaseCache', 'zenchanger_cache'),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379'),
+}
+CACHE = os.environ.get('ZENCHANGER_CACHE', 'locmem')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE][0],
+        'LOCATION': os.environ.get('ZENCHANGER_CACHE_LOCATION', CACHE_BACKENDS[CACHE][1]),
+        'TIMEOUT': 24 * 3600,
     }
 }
+if CACHE != 'redis':
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.environ.get('ZENCHANGER_CACHE_MAX_ENTRIES', 5000))}
 
 
 # Password validation
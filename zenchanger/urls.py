@@ -16,10 +16,12 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from core.views import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('home.urls')),
     path('collect/', include('collect.urls')),
     path('ring/', include('ring.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]